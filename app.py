@@ -1,1305 +1,1420 @@
 import os
-from flask import Flask, render_template_string, request, send_file, jsonify
-import fitz  # PyMuPDF
-import io
+from flask import Flask, Response, request, send_file, jsonify
 import base64
+import collections
 import json
-import zipfile
+import re
 import uuid
+import contextlib
+import select
+import socket
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# editing (MuPDF) y zipfile se importan al primer uso dentro de las
+# funciones: el servidor puede atender el editor sin cargar MuPDF y así
+# arranca antes (ver main.py)
+import assets
+import metrics
+import search
+import thumbnails
+import tiles
+from docstore import DocumentStore
+from engine import EXPORT_RUN_PAGES, PLACEHOLDER_MESSAGE, Engine
+from jobs import Job, JobCancelled, JobManager, QueueFull
+from render_cache import RenderCache
+from uploads import UploadError, UploadManager
+from workers import PageLimitExceeded, WorkerError, WorkerPool
+
+app = Flask(__name__, static_folder=None)
+
+# PDFs originales, volcados al directorio de spool y compartidos con los
+# workers; los resultados de las exportaciones también se escriben ahí
+# NOTA: Para una aplicación en producción, esto no es escalable ni seguro.
+original_pdfs = DocumentStore(os.environ.get('PDF_SPOOL_DIR'))
+# Tamaño (ancho, alto) de cada página, para generar avisos del mismo tamaño
+page_sizes = {}
+
+# Todo el trabajo de MuPDF sobre los documentos subidos se hace en procesos
+# aislados con límites por página de CPU (segundos) y memoria (MB); cada
+# worker se recicla tras PDF_WORKER_MAX_JOBS operaciones
+pdf_workers = WorkerPool(
+    size=int(os.environ.get('PDF_WORKERS', os.cpu_count() or 2)),
+    cpu_seconds=int(os.environ.get('PDF_PAGE_CPU_SECONDS', 30)),
+    memory_mb=int(os.environ.get('PDF_PAGE_MEMORY_MB', 1024)),
+    max_jobs=int(os.environ.get('PDF_WORKER_MAX_JOBS', 500)))
+
+# Exportaciones de páginas (ver engine.py); comparte page_sizes con la carga
+export_engine = Engine(original_pdfs, pdf_workers, page_sizes)
+
+# Tamaño máximo de un archivo subido, en la petición o por bloques
+MAX_UPLOAD_BYTES = int(os.environ.get('PDF_MAX_UPLOAD_MB', 512)) * 1024 * 1024
+
+# Cargas por bloques reanudables; los bloques se escriben en el spool
+chunked_uploads = UploadManager(
+    original_pdfs.temp_path,
+    max_size=MAX_UPLOAD_BYTES,
+    chunk_size=int(os.environ.get('PDF_UPLOAD_CHUNK_MB', 8)) * 1024 * 1024)
+
+# Páginas ya rasterizadas, por contenido del documento; el directorio
+# persiste entre reinicios y puede compartirse entre procesos
+render_cache = RenderCache(
+    os.environ.get('PDF_RENDER_CACHE_DIR',
+                   os.path.join(tempfile.gettempdir(), 'pdf-render-cache')),
+    max_bytes=int(os.environ.get('PDF_RENDER_CACHE_MB', 1024)) * 1024 * 1024)
+
+# Texto de las páginas para la búsqueda, extraído en segundo plano al cargar
+# cada documento; con PDF_SEARCH_INDEX_DIR persiste entre reinicios
+search_index = search.SearchIndex(
+    os.environ.get('PDF_SEARCH_INDEX_DIR'),
+    max_words=int(os.environ.get('PDF_SEARCH_MAX_WORDS', 10_000_000)))
+search_indexer = ThreadPoolExecutor(max_workers=1,
+                                    thread_name_prefix='pdf-search')
+# Páginas por operación de worker al extraer el texto
+SEARCH_RUN_PAGES = 16
+# Páginas con coincidencias que devuelve como mucho una búsqueda
+SEARCH_MAX_PAGES = 500
+
+metrics.describe('pdf_redacted_pages_total',
+                 'Páginas exportadas con texto tachado')
+
+# Ancho en píxeles de las páginas que se muestran en el editor: el cliente
+# pide el que necesita (ancho en pantalla por densidad de píxeles) y se
+# redondea al escalón siguiente, para que clientes parecidos compartan la
+# caché de páginas
+RENDER_WIDTHS = (400, 800, 1200, 1600, 2400)
+DEFAULT_RENDER_WIDTH = 1200
+# Píxeles máximos de una imagen de página, para las páginas muy alargadas
+RENDER_MAX_PIXELS = 2400 * 3400
+
+# Formato de imagen por perfil de renderizado (páginas del editor, teselas y
+# hojas de miniaturas):
+# 'auto' elige según el contenido entre los formatos que acepta el cliente
+# (ver image_formats y editing.encode_pixmap); 'png', 'jpeg' o 'webp' lo fijan
+RENDER_PROFILES = {
+    'page': {
+        'format': os.environ.get('PDF_PAGE_IMAGE_FORMAT', 'auto'),
+        'quality': int(os.environ.get('PDF_PAGE_IMAGE_QUALITY', 80)),
+    },
+    'tile': {
+        'format': os.environ.get('PDF_TILE_IMAGE_FORMAT', 'auto'),
+        'quality': int(os.environ.get('PDF_TILE_IMAGE_QUALITY', 75)),
+    },
+    'thumbnail': {
+        'format': os.environ.get('PDF_THUMBNAIL_IMAGE_FORMAT', 'auto'),
+        'quality': int(os.environ.get('PDF_THUMBNAIL_IMAGE_QUALITY', 75)),
+    },
+}
+
+# Documentos de una combinación de correspondencia (ver build_mail_merge)
+# que genera cada operación de worker, y filas como máximo
+MERGE_RUN_ROWS = 25
+MERGE_MAX_ROWS = int(os.environ.get('PDF_MERGE_MAX_ROWS', 100_000))
+
+class InvalidUpload(Exception):
+    """Un archivo subido no se pudo abrir como PDF o su carga no es válida."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _single_source_doc_id(pages_order):
+    """Devuelve el docId si el orden de páginas es un único documento sin reordenar.
+
+    Solo comprueba que todas las páginas vengan del mismo documento y en orden
+    ascendente consecutivo desde 0; el número total de páginas se valida con
+    los tamaños guardados al cargarlo.
+    """
+    if not pages_order:
+        return None
+    doc_id = pages_order[0]['docId']
+    for i, page_info in enumerate(pages_order):
+        if page_info['docId'] != doc_id or page_info['pageNum'] != i:
+            return None
+    return doc_id
+
+
+def export_incremental_update(pages_order, all_elements_data, output_path):
+    """Guarda las ediciones como una actualización incremental del original.
+
+    Solo aplica cuando la sesión contiene un único documento completo, en su
+    orden original. Las ediciones se dibujan sobre el propio documento y se
+    añaden al final de los bytes originales, así que el coste depende del
+    número de páginas editadas y las firmas digitales de la revisión original
+    siguen siendo válidas. El resultado se escribe en `output_path`; devuelve
+    None si no se puede usar este modo.
+    """
+    doc_id = _single_source_doc_id(pages_order)
+    if (doc_id is None or doc_id not in original_pdfs
+            or len(page_sizes[doc_id]) != len(pages_order)):
+        return None
 
-app = Flask(__name__)
+    edited_pages = [(page_num, all_elements_data[f"{doc_id}_{page_num}"])
+                    for page_num in range(len(pages_order))
+                    if all_elements_data.get(f"{doc_id}_{page_num}")]
+    if not edited_pages:
+        # Sin ediciones el documento original ya es el resultado
+        try:
+            original_pdfs.copy_to(doc_id, output_path)
+        except KeyError:
+            return None
+        return output_path
 
-# Diccionario global para almacenar los PDFs originales y sus metadatos
-# NOTA: Para una aplicación en producción, esto no es escalable ni seguro.
-# Se recomienda usar una base de datos o un sistema de archivos temporal.
-original_pdfs = {}
+    try:
+        with original_pdfs.lease(doc_id) as handles:
+            if doc_id not in handles:
+                return None
+            return pdf_workers.call('incremental',
+                                    doc_id,
+                                    handles[doc_id],
+                                    cost=len(edited_pages),
+                                    edited_pages=edited_pages,
+                                    output_path=output_path)
+    except (PageLimitExceeded, WorkerError) as e:
+        print(f"Error en el guardado incremental del documento {doc_id}: {e}")
+        return None
+
+
+# Interfaz del editor (static/), cargada y comprimida una vez al arrancar
+editor_assets = assets.AssetBundle()
+
+
+def _asset_response(asset, cache_control):
+    """Respuesta con el recurso comprimido según Accept-Encoding.
 
+    Responde 304 sin cuerpo si el cliente ya tiene esa versión (If-None-Match).
+    """
+    encoding, body = asset.body(request.accept_encodings)
+    response = Response(body, content_type=asset.mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    response.set_etag(f"{asset.digest}-{encoding}")
+    return response.make_conditional(request)
 
-def apply_edits_to_page(doc_data, page_num, edits):
-    """Aplica ediciones (texto, formas, imágenes) a una página de PDF."""
+
+@app.route('/')
+def index():
+    """Ruta principal que muestra el editor."""
+    return _asset_response(editor_assets.shell, assets.REVALIDATE)
+
+
+@app.route('/static/<name>')
+def static_asset(name):
+    """CSS y JavaScript del editor, con el hash de su contenido en el nombre."""
+    asset = editor_assets.get(name)
+    if asset is None:
+        return jsonify({"error": "Recurso no encontrado"}), 404
+    return _asset_response(asset, assets.IMMUTABLE)
+
+
+def requested_render_width(value):
+    """Escalón de RENDER_WIDTHS para el ancho (px) que pide el cliente."""
     try:
-        # Abrir el documento original en memoria
-        pdf_document = fitz.open(stream=doc_data, filetype="pdf")
-        page = pdf_document.load_page(page_num)
-
-        # Escalar coordenadas del cliente a las del PDF
-        page_rect = page.rect
-        page_width, page_height = page_rect.width, page_rect.height
-
-        # El cliente trabaja con un ancho fijo de 800px, necesitamos el ratio
-        scale_factor = page_width / 800
-
-        for element in edits:
-            x, y = element['x'] * scale_factor, element['y'] * scale_factor
-            width, height = element['width'] * scale_factor, element[
-                'height'] * scale_factor
-
-            if element['type'] == 'text':
-                font_size = element['fontSize'] * scale_factor
-                text = element['text']
-                color_hex = element['fontColor']
-                color_rgb = tuple(
-                    int(color_hex[i:i + 2], 16) / 255.0 for i in (1, 3, 5))
-
-                # Ajustar el punto de inserción para que no se "corte" el texto
-                text_bbox = page.insert_textbox(
-                    fitz.Rect(
-                        x, y, x + width, y +
-                        height),  # El ancho y alto son estimados en el cliente
-                    text,
-                    fontname="helv",  # Usar una fuente estándar
-                    fontsize=font_size,
-                    color=color_rgb)
-
-            elif element['type'] == 'image':
-                img_data = base64.b64decode(element['src'].split(',')[1])
-                page.insert_image(fitz.Rect(x, y, x + width, y + height),
-                                  stream=img_data)
-
-            elif element['type'] == 'rect':
-                fill_color_hex = element['fillColor']
-                border_color_hex = element['borderColor']
-                fill_color_rgb = tuple(
-                    int(fill_color_hex[i:i + 2], 16) / 255.0
-                    for i in (1, 3, 5))
-                border_color_rgb = tuple(
-                    int(border_color_hex[i:i + 2], 16) / 255.0
-                    for i in (1, 3, 5))
-
-                page.draw_rect(fitz.Rect(x, y, x + width, y + height),
-                               fill=fill_color_rgb,
-                               color=border_color_rgb,
-                               width=1)
-
-            elif element['type'] == 'circle':
-                fill_color_hex = element['fillColor']
-                border_color_hex = element['borderColor']
-                fill_color_rgb = tuple(
-                    int(fill_color_hex[i:i + 2], 16) / 255.0
-                    for i in (1, 3, 5))
-                border_color_rgb = tuple(
-                    int(border_color_hex[i:i + 2], 16) / 255.0
-                    for i in (1, 3, 5))
-
-                page.draw_oval(fitz.Rect(x, y, x + width, y + height),
-                               fill=fill_color_rgb,
-                               color=border_color_rgb,
-                               width=1)
-
-        # Guardar la página modificada en un nuevo documento en memoria
-        output_buffer = io.BytesIO()
-        modified_doc = fitz.open()
-        modified_doc.insert_pdf(pdf_document,
-                                from_page=page_num,
-                                to_page=page_num)
-        modified_doc.save(output_buffer)
-        modified_doc.close()
-        pdf_document.close()
-
-        return output_buffer.getvalue()
+        requested = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RENDER_WIDTH
+    for width in RENDER_WIDTHS:
+        if width >= requested:
+            return width
+    return RENDER_WIDTHS[-1]
+
+
+def image_formats(profile, accept):
+    """Formatos de imagen para el perfil `profile` que acepta el cliente.
+
+    `accept` es la cabecera Accept ya interpretada (request.accept_mimetypes).
+    PNG se acepta siempre. WebP solo si el cliente lo anuncia, y JPEG si
+    anuncia image/jpeg o image/*: un cliente que envía */* (o nada) sigue
+    recibiendo PNG.
+    """
+    import editing
+
+    listed = {value.lower() for value, quality in accept if quality > 0}
+    setting = RENDER_PROFILES[profile]['format']
+    candidates = editing.IMAGE_FORMATS if setting == 'auto' else (setting,)
+    formats = tuple(
+        fmt for fmt in candidates
+        if fmt == 'png' or editing.IMAGE_MIMETYPES.get(fmt) in listed or (
+            fmt == 'jpeg' and 'image/*' in listed))
+    return formats or ('png',)
+
+
+def page_render_options(width, accept):
+    """Opciones para rasterizar las páginas del editor (ver render_documents).
+
+    `width` es el campo `render_width` de la petición y `accept` su cabecera
+    Accept.
+    """
+    return {
+        'width': requested_render_width(width),
+        'formats': image_formats('page', accept),
+        'quality': RENDER_PROFILES['page']['quality'],
+    }
+
+
+def _cache_format(formats, quality):
+    # Clave de formato en la caché de páginas: la imagen guardada depende de
+    # los formatos permitidos y de la calidad
+    return f"{'-'.join(formats)}-q{quality}"
+
+
+def render_zoom(width, height, target_width):
+    """Zoom para rasterizar una página de `width` x `height` puntos.
+
+    La imagen tiene `target_width` píxeles de ancho, salvo que supere
+    RENDER_MAX_PIXELS, en cuyo caso se reduce conservando la proporción.
+    """
+    zoom = target_width / width
+    if width * height * zoom * zoom > RENDER_MAX_PIXELS:
+        zoom = (RENDER_MAX_PIXELS / (width * height))**0.5
+    return zoom
+
+
+def ingest_pdfs(files, render, job):
+    """Guarda los PDFs subidos y rasteriza sus páginas para el editor."""
+    documents = []
+    try:
+        for file in files:
+            # El archivo se vuelca al spool por bloques, sin leerlo entero
+            doc_id = str(uuid.uuid4())
+            original_pdfs.spool(doc_id, file.stream)
+            documents.append((doc_id, file.filename))
+    except BaseException:
+        for doc_id, _ in documents:
+            original_pdfs.discard(doc_id)
+        raise
+
+    return render_documents(documents, render, job)
 
+
+def ingest_chunked_upload(upload_id, render, job):
+    """Incorpora como documento una carga por bloques completa y verificada."""
+    try:
+        path, filename, sha256 = chunked_uploads.finish(upload_id)
+    except UploadError as e:
+        raise InvalidUpload(str(e), e.status) from e
+
+    doc_id = str(uuid.uuid4())
+    original_pdfs.add_file(doc_id, path, sha256)
+    return render_documents([(doc_id, filename)], render, job)
+
+
+def ingest_known_document(sha256, render, job):
+    """Añade a la sesión un documento que el servidor ya tiene, sin subirlo."""
+    doc_id = str(uuid.uuid4())
+    if not original_pdfs.attach(doc_id, sha256):
+        raise InvalidUpload("Documento no encontrado", 404)
+    return render_documents([(doc_id, f"documento {sha256[:12]}")],
+                            render, job)
+
+
+def render_documents(documents, render, job):
+    """Rasteriza para el editor las páginas de los documentos [(doc_id, nombre)].
+
+    `render` son las opciones de page_render_options: cada página se
+    rasteriza con render['width'] píxeles de ancho (ver render_zoom), sea un
+    recibo A6 o un plano A0, y se codifica en uno de render['formats'].
+
+    Los documentos se abren y se rasterizan en los workers, repartiendo las
+    páginas entre todos ellos; una página que no se puede rasterizar se
+    sustituye por un aviso. Las páginas de un contenido ya rasterizado antes
+    (aunque sea en otra sesión o antes de un reinicio) salen de la caché.
+    """
+    import editing
+
+    pages_data = {}
+    pages_type = {}
+    pages_order = []
+    doc_ids = [doc_id for doc_id, _ in documents]
+
+    try:
+        with original_pdfs.lease(*doc_ids) as handles:
+            for doc_id, filename in documents:
+                try:
+                    page_sizes[doc_id] = pdf_workers.call(
+                        'open', doc_id, handles[doc_id])
+                except (PageLimitExceeded, WorkerError) as e:
+                    # El detalle de MuPDF incluye la ruta del spool
+                    print(f"Error al abrir {filename}: {e}")
+                    raise InvalidUpload(
+                        f"No se pudo abrir {filename} como PDF.") from e
+
+            pages = [(doc_id, i) for doc_id in doc_ids
+                     for i in range(len(page_sizes[doc_id]))]
+            job.start(len(pages))
+
+            # Las páginas que ya están en la caché no llegan a los workers
+            images = {}
+            renders = []
+            resolution = f"w{render['width']}"
+            fmt = _cache_format(render['formats'], render['quality'])
+            for doc_id, i in pages:
+                cached = render_cache.get(original_pdfs.sha256(doc_id), i,
+                                          resolution, fmt)
+                if cached is not None:
+                    images[doc_id, i] = cached
+                    job.advance(1, len(cached))
+                else:
+                    renders.append((doc_id, handles[doc_id], {
+                        'page_num': i,
+                        'zoom': render_zoom(*page_sizes[doc_id][i],
+                                            render['width']),
+                        'formats': render['formats'],
+                        'quality': render['quality']
+                    }))
+
+            with contextlib.closing(pdf_workers.map('render',
+                                                    renders)) as results:
+                for (doc_id, _, kwargs), img_bytes in zip(renders, results):
+                    i = kwargs['page_num']
+                    if isinstance(img_bytes, Exception):
+                        width, height = page_sizes[doc_id][i]
+                        img_bytes = editing.placeholder_png(
+                            width, height, PLACEHOLDER_MESSAGE,
+                            kwargs['zoom'])
+                    else:
+                        # Los avisos no se guardan: con otros límites la
+                        # página podría rasterizarse
+                        render_cache.put(original_pdfs.sha256(doc_id), i,
+                                         resolution, fmt, img_bytes)
+                    images[doc_id, i] = img_bytes
+                    job.advance(1, len(img_bytes))
+
+            for doc_id, i in pages:
+                page_id = f"{doc_id}_{i}"
+                pages_data[page_id] = base64.b64encode(
+                    images[doc_id, i]).decode('utf-8')
+                pages_type[page_id] = editing.image_mimetype(images[doc_id, i])
+                pages_order.append({"docId": doc_id, "pageNum": i})
+
+    except (JobCancelled, InvalidUpload):
+        # La carga se abandonó o es inválida: no dejar documentos huérfanos
+        for doc_id in doc_ids:
+            original_pdfs.discard(doc_id)
+            page_sizes.pop(doc_id, None)
+        raise
+
+    index_documents(doc_ids)
+    return {
+        "pagesData": pages_data,
+        "pagesType": pages_type,
+        "pagesOrder": pages_order
+    }
+
+
+def index_documents(doc_ids):
+    """Extrae en segundo plano el texto de los documentos aún no indexados."""
+    for doc_id in doc_ids:
+        sha256 = original_pdfs.sha256(doc_id)
+        if (sha256 is not None and doc_id in page_sizes and
+                not search_index.has(sha256) and search_index.start(sha256)):
+            search_indexer.submit(_extract_text, doc_id, sha256)
+
+
+def _extract_words(doc_id, handle, page_nums=None):
+    """Extrae en los workers las palabras de las páginas `page_nums` (o todas).
+
+    Las páginas se reparten entre los workers en tramos de SEARCH_RUN_PAGES;
+    las de un tramo que falla quedan como None y no impiden buscar en el
+    resto.
+    """
+    if page_nums is None:
+        page_nums = range(len(page_sizes[doc_id]))
+    page_nums = list(page_nums)
+    calls = [(doc_id, handle, {
+        'page_nums': page_nums[start:start + SEARCH_RUN_PAGES],
+        'cost': len(page_nums[start:start + SEARCH_RUN_PAGES])
+    }) for start in range(0, len(page_nums), SEARCH_RUN_PAGES)]
+    pages = []
+    with contextlib.closing(pdf_workers.map('words', calls)) as results:
+        for (_, _, kwargs), words in zip(calls, results):
+            if isinstance(words, Exception):
+                print(f"Error al extraer el texto de {doc_id}: {words}")
+                words = [None] * len(kwargs['page_nums'])
+            pages.extend(words)
+    return pages
+
+
+def _extract_text(doc_id, sha256):
+    """Indexa en segundo plano el texto de un documento (ver index_documents)."""
+    try:
+        with original_pdfs.lease(doc_id) as handles:
+            if doc_id not in handles:
+                search_index.cancel(sha256)
+                return
+            pages = _extract_words(doc_id, handles[doc_id])
+        search_index.add(sha256, pages)
     except Exception as e:
-        print(f"Error al aplicar ediciones a la página {page_num}: {e}")
+        search_index.cancel(sha256)
+        print(f"Error al indexar el texto de {doc_id}: {e}")
+
+
+def document_index(doc_id):
+    """Índice de búsqueda del documento; si aún no existe, lo extrae ahora.
+
+    Si el texto de alguna página no se pudo extraer (p. ej. porque un worker
+    superó su tiempo con el servidor cargado), se vuelve a intentar con esas
+    páginas. Devuelve None si el documento no existe.
+    """
+    sha256 = original_pdfs.sha256(doc_id)
+    if sha256 is None or doc_id not in page_sizes:
+        return None
+    document = search_index.get(sha256)
+    if document is None or document.unreadable_pages():
+        with original_pdfs.lease(doc_id) as handles:
+            if doc_id not in handles:
+                return None
+            if document is None:
+                pages = _extract_words(doc_id, handles[doc_id])
+            else:
+                pages = list(document.pages)
+                retry = document.unreadable_pages()
+                for page_num, words in zip(
+                        retry, _extract_words(doc_id, handles[doc_id], retry)):
+                    pages[page_num] = words
+        document = search_index.add(sha256, pages)
+    return document
+
+
+def _disconnect_probe(environ):
+    """Devuelve una función que indica si el cliente cerró la conexión.
+
+    Usa el socket que exponen el servidor de Werkzeug y gunicorn; con otros
+    servidores (o con TLS terminado en el propio proceso) la desconexión no se
+    puede detectar y se devuelve None.
+    """
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    if sock is None:
         return None
 
+    def disconnected():
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            # Legible y sin datos pendientes: el cliente envió FIN
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+        except ValueError:
+            return False
+        except OSError:
+            return True
 
-@app.route('/')
-def index():
-    """Ruta principal que muestra el formulario HTML."""
-    return render_template_string(HTML_FORM)
+    return disconnected
 
 
-@app.route('/upload', methods=['POST'])
-def upload_files():
-    """Carga inicial de uno o más PDFs."""
+def new_request_job(kind, job_id):
+    """Crea el Job de una carga o exportación que se ejecuta en la petición.
+
+    Si el cliente envía un `job_id` (UUID) el trabajo se registra con ese id:
+    su progreso puede seguirse en /jobs/<id>/events y cancelarse. Devuelve
+    None si el id no es válido o ya está en uso.
+    """
+    if not job_id:
+        return Job(kind)
+    try:
+        job_id = str(uuid.UUID(job_id))
+    except ValueError:
+        return None
+    return export_jobs.track(kind, job_id)
+
+
+def _request_job(kind, job_id):
+    """Como new_request_job, pero el trabajo además se cancela solo si el
+    cliente cierra la conexión."""
+    job = new_request_job(kind, job_id)
+    if job is not None:
+        probe = _disconnect_probe(request.environ)
+        if probe is not None:
+            job.add_cancel_probe(probe)
+    return job
+
+
+def run_upload(job, ingest, *args):
+    """Ejecuta `ingest(*args, job)` y devuelve (cuerpo JSON, código HTTP)."""
+    try:
+        result = ingest(*args, job)
+    except JobCancelled:
+        job.mark_cancelled()
+        return {"error": "Carga cancelada"}, 499
+    except InvalidUpload as e:
+        job.fail(str(e), e.status)
+        return {"error": str(e)}, e.status
+    except Exception as e:
+        job.fail(str(e))
+        raise
+
+    job.finish(None)
+    return result, 200
+
+
+def _run_upload():
     files = request.files.getlist('pdf_files')
     if not files:
         return jsonify({"error": "No se subieron archivos"}), 400
 
-    pages_data = {}
-    pages_order = []
+    job = _request_job('upload', request.form.get('job_id'))
+    if job is None:
+        return jsonify({"error": "Identificador de trabajo no válido"}), 400
 
-    for file in files:
-        file_bytes = file.read()
-        doc_id = str(uuid.uuid4())
-        original_pdfs[doc_id] = file_bytes
+    render = page_render_options(request.form.get('render_width'),
+                                 request.accept_mimetypes)
+    body, status = run_upload(job, ingest_pdfs, files, render)
+    return jsonify(body), status
 
-        pdf_document = fitz.open(stream=file_bytes, filetype="pdf")
-        for i in range(pdf_document.page_count):
-            page = pdf_document.load_page(i)
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_bytes = pix.tobytes("png")
-            img_base64 = base64.b64encode(img_bytes).decode('utf-8')
 
-            page_id = f"{doc_id}_{i}"
-            pages_data[page_id] = img_base64
-            pages_order.append({"docId": doc_id, "pageNum": i})
-        pdf_document.close()
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Contadores del servidor en formato de texto de Prometheus."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-    return jsonify({"pagesData": pages_data, "pagesOrder": pages_order})
+
+@app.route('/upload', methods=['POST'])
+def upload_files():
+    """Carga inicial de uno o más PDFs."""
+    return _run_upload()
 
 
 @app.route('/add_pdfs', methods=['POST'])
 def add_pdfs():
     """Añade PDFs a la sesión existente."""
-    files = request.files.getlist('pdf_files')
-    if not files:
-        return jsonify({"error": "No se subieron archivos"}), 400
+    return _run_upload()
 
-    pages_data = {}
-    pages_order = []
 
-    for file in files:
-        file_bytes = file.read()
-        doc_id = str(uuid.uuid4())
-        original_pdfs[doc_id] = file_bytes
+@app.route('/documents/<sha256>', methods=['GET'])
+def get_document(sha256):
+    """Indica (también con HEAD) si el servidor ya tiene ese documento."""
+    size = original_pdfs.find(sha256.lower())
+    if size is None:
+        return jsonify({"error": "Documento no encontrado"}), 404
+    return jsonify({"sha256": sha256.lower(), "size": size})
 
-        pdf_document = fitz.open(stream=file_bytes, filetype="pdf")
-        for i in range(pdf_document.page_count):
-            page = pdf_document.load_page(i)
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_bytes = pix.tobytes("png")
-            img_base64 = base64.b64encode(img_bytes).decode('utf-8')
 
-            page_id = f"{doc_id}_{i}"
-            pages_data[page_id] = img_base64
-            pages_order.append({"docId": doc_id, "pageNum": i})
-        pdf_document.close()
+@app.route('/documents/<sha256>/attach', methods=['POST'])
+def attach_document(sha256):
+    """Añade a la sesión un documento ya guardado, sin volver a subirlo.
 
-    return jsonify({"pagesData": pages_data, "pagesOrder": pages_order})
+    Responde como /upload; admite un `job_id` para seguir el progreso.
+    """
+    data = request.get_json(silent=True) or {}
+    job = _request_job('upload', data.get('job_id'))
+    if job is None:
+        return jsonify({"error": "Identificador de trabajo no válido"}), 400
 
+    render = page_render_options(data.get('render_width'),
+                                 request.accept_mimetypes)
+    body, status = run_upload(job, ingest_known_document, sha256.lower(),
+                              render)
+    return jsonify(body), status
 
-@app.route('/download_final_pdf', methods=['POST'])
-def download_final_pdf():
-    """Combina todas las páginas editadas en un solo PDF final."""
-    data = request.json
-    pages_order = data.get('pages_order', [])
-    all_elements_data = data.get('all_elements_data', {})
 
-    final_pdf = fitz.open()
+def _page_ref(page_id):
+    """(doc_id, página) de un identificador '<doc_id>_<página>', o None."""
+    doc_id, _, page_num = page_id.rpartition('_')
+    if not page_num.isdigit() or doc_id not in page_sizes:
+        return None
+    page_num = int(page_num)
+    if page_num >= len(page_sizes[doc_id]):
+        return None
+    return doc_id, page_num
+
+
+@app.route('/pages/<page_id>/tiles', methods=['GET'])
+def get_tile_info(page_id):
+    """Tamaño de la página y niveles de su pirámide de teselas."""
+    ref = _page_ref(page_id)
+    if ref is None:
+        return jsonify({"error": "Página no encontrada"}), 404
+    width, height = page_sizes[ref[0]][ref[1]]
+    return jsonify({
+        "width": width,
+        "height": height,
+        "tileSize": tiles.TILE_SIZE,
+        "maxLevel": tiles.max_level(width, height)
+    })
+
+
+@app.route('/pages/<page_id>/tiles/<int:level>/<int:x>/<int:y>',
+           methods=['GET'])
+def get_tile(page_id, level, x, y):
+    """Tesela de una página: solo se rasteriza el recorte que cubre."""
+    import editing
+
+    ref = _page_ref(page_id)
+    if ref is None:
+        return jsonify({"error": "Página no encontrada"}), 404
+    doc_id, page_num = ref
+    width, height = page_sizes[doc_id][page_num]
+    tile = tiles.tile_clip(width, height, level, x, y)
+    if tile is None:
+        return jsonify({"error": "Tesela no encontrada"}), 404
+    zoom, clip = tile
+    formats = image_formats('tile', request.accept_mimetypes)
+    quality = RENDER_PROFILES['tile']['quality']
+    fmt = _cache_format(formats, quality)
+
+    with original_pdfs.lease(doc_id) as handles:
+        sha256 = original_pdfs.sha256(doc_id)
+        if doc_id not in handles or sha256 is None:
+            return jsonify({"error": "Página no encontrada"}), 404
+        image = render_cache.get(sha256, page_num, None, fmt,
+                                 tile=(level, x, y))
+        if image is None:
+            try:
+                image = pdf_workers.call('render',
+                                         doc_id,
+                                         handles[doc_id],
+                                         page_num=page_num,
+                                         zoom=zoom,
+                                         clip=clip,
+                                         formats=formats,
+                                         quality=quality)
+            except PageLimitExceeded:
+                return jsonify({"error": PLACEHOLDER_MESSAGE}), 422
+            except WorkerError as e:
+                print(f"Error al rasterizar la tesela {page_id}: {e}")
+                return jsonify({"error":
+                                "No se pudo rasterizar la página"}), 500
+            render_cache.put(sha256, page_num, None, fmt, image,
+                             tile=(level, x, y))
+
+    response = Response(image, mimetype=editing.image_mimetype(image))
+    # El contenido de un doc_id no cambia nunca; el formato depende de Accept
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+@app.route('/thumbnails/<doc_id>', methods=['GET'])
+def get_thumbnail_map(doc_id):
+    """Hojas de miniaturas de un documento y la posición de cada página."""
+    if doc_id not in page_sizes:
+        return jsonify({"error": "Documento no encontrado"}), 404
+    sheets = thumbnails.sprite_layout(page_sizes[doc_id])
+    pages = []
+    for index, sheet in enumerate(sheets):
+        for _, x, y, width, height in sheet['pages']:
+            pages.append({
+                "sheet": index,
+                "x": x,
+                "y": y,
+                "width": width,
+                "height": height
+            })
+    response = jsonify({
+        "sheets": [{
+            "url": f"/thumbnails/{doc_id}/{index}",
+            "width": sheet['width'],
+            "height": sheet['height']
+        } for index, sheet in enumerate(sheets)],
+        "pages": pages
+    })
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+@app.route('/thumbnails/<doc_id>/<int:sheet>', methods=['GET'])
+def get_thumbnail_sheet(doc_id, sheet):
+    """Imagen de una hoja de miniaturas, rasterizada de una vez y en caché."""
+    import editing
+
+    if doc_id not in page_sizes:
+        return jsonify({"error": "Documento no encontrado"}), 404
+    sheets = thumbnails.sprite_layout(page_sizes[doc_id])
+    if sheet >= len(sheets):
+        return jsonify({"error": "Hoja no encontrada"}), 404
+    layout = sheets[sheet]
+    first_page = layout['pages'][0][0]
+    formats = image_formats('thumbnail', request.accept_mimetypes)
+    quality = RENDER_PROFILES['thumbnail']['quality']
+    fmt = _cache_format(formats, quality)
+    resolution = (f"sprite{thumbnails.SPRITE_PAGES}"
+                  f"x{thumbnails.THUMBNAIL_WIDTH}")
+
+    with original_pdfs.lease(doc_id) as handles:
+        sha256 = original_pdfs.sha256(doc_id)
+        if doc_id not in handles or sha256 is None:
+            return jsonify({"error": "Documento no encontrado"}), 404
+        image = render_cache.get(sha256, first_page, resolution, fmt)
+        if image is None:
+            try:
+                image = pdf_workers.call('sprite',
+                                         doc_id,
+                                         handles[doc_id],
+                                         cost=len(layout['pages']),
+                                         width=layout['width'],
+                                         height=layout['height'],
+                                         placements=layout['pages'],
+                                         formats=formats,
+                                         quality=quality)
+            except PageLimitExceeded:
+                # El editor usa entonces las imágenes de las páginas
+                return jsonify({"error": PLACEHOLDER_MESSAGE}), 422
+            except WorkerError as e:
+                print(f"Error al rasterizar las miniaturas de {doc_id}: {e}")
+                return jsonify(
+                    {"error": "No se pudieron rasterizar las miniaturas"}), 500
+            render_cache.put(sha256, first_page, resolution, fmt, image)
+
+    response = Response(image, mimetype=editing.image_mimetype(image))
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+@app.route('/search', methods=['GET'])
+def search_pages():
+    """Busca un texto en las páginas de los documentos `doc` de la sesión.
+
+    Devuelve las páginas con coincidencias, en el orden de los documentos
+    pedidos, con el rectángulo (en puntos) de cada palabra de cada
+    coincidencia para resaltarla. `pending` enumera los documentos cuyo texto
+    aún se está extrayendo, en los que conviene repetir la búsqueda.
+    """
+    terms = search.query_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({"error": "Falta el texto a buscar"}), 400
+    doc_ids = list(dict.fromkeys(request.args.getlist('doc')))
+    metrics.inc('pdf_search_queries_total')
+
+    results = []
+    pending = []
+    truncated = False
+    for doc_id in doc_ids:
+        sha256 = original_pdfs.sha256(doc_id)
+        if sha256 is None or doc_id not in page_sizes:
+            continue
+        document = search_index.get(sha256)
+        if document is None:
+            # Aún no indexado (o descartado de la memoria sin copia en disco)
+            index_documents([doc_id])
+            pending.append(doc_id)
+            continue
+        for page_num, hits in sorted(document.find(terms).items()):
+            if len(results) == SEARCH_MAX_PAGES:
+                truncated = True
+                break
+            width, height = page_sizes[doc_id][page_num]
+            results.append({
+                "docId": doc_id,
+                "pageNum": page_num,
+                "width": width,
+                "height": height,
+                "hits": hits
+            })
+
+    return jsonify({
+        "results": results,
+        "pending": pending,
+        "truncated": truncated
+    })
+
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Crea una carga por bloques a partir de {filename, size, sha256}."""
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = chunked_uploads.create(data.get('filename'), data.get('size'),
+                                        data.get('sha256'))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify(upload.to_dict()), 201
+
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Estado de una carga por bloques: los tramos que faltan por subir."""
+    upload = chunked_uploads.get(upload_id)
+    if upload is None:
+        return jsonify({"error": "Carga no encontrada"}), 404
+    return jsonify(upload.to_dict())
+
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """Recibe el bloque que empieza en ?offset=N; puede repetirse sin riesgo."""
+    upload = chunked_uploads.get(upload_id)
+    if upload is None:
+        return jsonify({"error": "Carga no encontrada"}), 404
+    offset = request.args.get('offset', type=int)
+    if offset is None or request.content_length is None:
+        return jsonify({"error": "Faltan offset o Content-Length"}), 400
 
-    for page_info in pages_order:
-        doc_id = page_info['docId']
-        page_num = page_info['pageNum']
-        page_id = f"{doc_id}_{page_num}"
+    try:
+        upload.write(offset, request.stream, request.content_length)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify(upload.to_dict())
 
-        if doc_id not in original_pdfs:
-            continue
 
-        doc_data = original_pdfs[doc_id]
-        edits = all_elements_data.get(page_id, [])
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    """Abandona una carga por bloques y borra lo recibido."""
+    if not chunked_uploads.cancel(upload_id):
+        return jsonify({"error": "Carga no encontrada"}), 404
+    return '', 204
+
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Comprueba el hash de una carga completa y rasteriza sus páginas.
+
+    Responde como /upload; admite un `job_id` para seguir el progreso.
+    """
+    data = request.get_json(silent=True) or {}
+    job = _request_job('upload', data.get('job_id'))
+    if job is None:
+        return jsonify({"error": "Identificador de trabajo no válido"}), 400
+
+    render = page_render_options(data.get('render_width'),
+                                 request.accept_mimetypes)
+    body, status = run_upload(job, ingest_chunked_upload, upload_id, render)
+    return jsonify(body), status
+
+
+class ExportError(Exception):
+    """Error de exportación que se devuelve al cliente con un código HTTP."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@contextlib.contextmanager
+def _export_file(suffix):
+    """Ruta en el spool para el resultado de una exportación.
 
-        if edits:
-            modified_page_bytes = apply_edits_to_page(doc_data, page_num,
-                                                      edits)
-            if modified_page_bytes:
-                temp_doc = fitz.open(stream=modified_page_bytes,
-                                     filetype="pdf")
-                final_pdf.insert_pdf(temp_doc)
-                temp_doc.close()
+    El fichero se borra si la exportación falla o se cancela.
+    """
+    path = original_pdfs.temp_path(suffix)
+    try:
+        yield path
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+def redaction_rects(page_refs, redactions):
+    """Rectángulos a tachar en las páginas [(doc_id, page_num), ...].
+
+    `redactions` es la lista que envía el cliente, [{term, regex}, ...]: cada
+    término se busca en el texto de la página sin acentos ni mayúsculas,
+    también en medio de una palabra (ver search.DocumentIndex.contains), y,
+    con regex, como expresión regular (ver search.DocumentIndex.match). Se
+    tachan enteras las palabras que toca cada aparición. Se usa el índice de
+    búsqueda, así que solo se tachan, y se vuelven a escribir, las páginas
+    con alguna aparición. Si el texto de una página que se exporta no se
+    pudo extraer, la exportación falla en lugar de dejar algo sin tachar.
+    Devuelve {(doc_id, page_num): rectángulos}.
+    """
+    patterns = []
+    for redaction in redactions:
+        term = str(redaction.get('term') or '')
+        if redaction.get('regex'):
+            try:
+                patterns.append(re.compile(term, re.IGNORECASE) if term else None)
+            except re.error as e:
+                raise ExportError(f"Expresión regular no válida: {e}.", 400)
         else:
-            temp_doc = fitz.open(stream=doc_data, filetype="pdf")
-            final_pdf.insert_pdf(temp_doc,
-                                 from_page=page_num,
-                                 to_page=page_num)
-            temp_doc.close()
+            patterns.append(term if term.strip() else None)
+        if patterns[-1] is None:
+            raise ExportError("Falta el texto a tachar.", 400)
+
+    rects = collections.defaultdict(list)
+    page_nums = collections.defaultdict(set)
+    for doc_id, page_num in page_refs:
+        page_nums[doc_id].add(page_num)
+    for doc_id, wanted in page_nums.items():
+        document = document_index(doc_id)
+        if document is None:
+            continue  # documento desconocido: sus páginas se omiten
+        for page_num in sorted(wanted.intersection(document.unreadable_pages())):
+            raise ExportError(
+                f"No se pudo leer el texto de la página {page_num + 1} de "
+                f"{doc_id} para tacharla.", 422)
+        for pattern in patterns:
+            if isinstance(pattern, str):
+                hits = document.contains(pattern)
+            else:
+                hits = document.match(pattern)
+            for page_num, page_hits in hits.items():
+                if page_num in wanted:
+                    rects[doc_id, page_num].extend(
+                        rect for hit in page_hits for rect in hit)
+    metrics.inc('pdf_redacted_pages_total', len(rects))
+    return dict(rects)
 
-    output_buffer = io.BytesIO()
-    final_pdf.save(output_buffer)
-    final_pdf.close()
-    output_buffer.seek(0)
 
-    return send_file(output_buffer,
-                     as_attachment=True,
-                     download_name='documento_final.pdf',
-                     mimetype='application/pdf')
+def build_final_pdf(data, job):
+    """Combina todas las páginas editadas en un solo PDF final."""
+    pages_order = data.get('pages_order', [])
+    all_elements_data = data.get('all_elements_data', {})
+    page_refs = [(page_info['docId'], page_info['pageNum'])
+                 for page_info in pages_order]
+    redactions = redaction_rects(page_refs, data.get('redactions') or [])
+    job.start(len(pages_order))
 
+    with _export_file('.pdf') as output_path:
+        # Un único documento sin reordenar: añadir las ediciones al original.
+        # No si se tacha algo, porque el texto seguiría en la revisión original
+        if (data.get('incremental', True) and not data.get('redactions')
+                and export_incremental_update(pages_order, all_elements_data,
+                                              output_path)):
+            job.advance(len(pages_order), os.path.getsize(output_path))
+            return output_path, 'documento_final.pdf', 'application/pdf'
 
-@app.route('/extract_pages', methods=['POST'])
-def extract_pages():
+        if export_engine.merge_pages(page_refs, all_elements_data, job,
+                                     output_path, redactions) is None:
+            raise ExportError("No se pudo exportar ninguna página.", 422)
+
+    return output_path, 'documento_final.pdf', 'application/pdf'
+
+
+def build_extracted_pdf(data, job):
     """Extrae páginas específicas de los documentos cargados."""
-    data = request.json
     pages_to_extract = data.get('pages', [])
     pages_order = data.get('pages_order', [])
     all_elements_data = data.get('all_elements_data', {})
 
     if not pages_to_extract:
-        return "No se especificaron páginas para extraer.", 400
-
-    extraction_pdf = fitz.open()
+        raise ExportError("No se especificaron páginas para extraer.", 400)
 
+    page_refs = []
     for page_num in pages_to_extract:
         if page_num > 0 and page_num <= len(pages_order):
             page_info = pages_order[page_num -
                                     1]  # Convertir de 1-based a 0-based
-            doc_id = page_info['docId']
-            original_page_num = page_info['pageNum']
-            page_id = f"{doc_id}_{original_page_num}"
+            page_refs.append((page_info['docId'], page_info['pageNum']))
+    redactions = redaction_rects(page_refs, data.get('redactions') or [])
 
-            if doc_id not in original_pdfs:
-                continue
+    job.start(len(pages_to_extract))
+    job.advance(len(pages_to_extract) - len(page_refs))
 
-            doc_data = original_pdfs[doc_id]
-            edits = all_elements_data.get(page_id, [])
-
-            if edits:
-                modified_page_bytes = apply_edits_to_page(
-                    doc_data, original_page_num, edits)
-                if modified_page_bytes:
-                    temp_doc = fitz.open(stream=modified_page_bytes,
-                                         filetype="pdf")
-                    extraction_pdf.insert_pdf(temp_doc)
-                    temp_doc.close()
-            else:
-                temp_doc = fitz.open(stream=doc_data, filetype="pdf")
-                extraction_pdf.insert_pdf(temp_doc,
-                                          from_page=original_page_num,
-                                          to_page=original_page_num)
-                temp_doc.close()
+    with _export_file('.pdf') as output_path:
+        if export_engine.merge_pages(page_refs, all_elements_data, job,
+                                     output_path, redactions) is None:
+            raise ExportError(
+                "No se pudieron extraer las páginas seleccionadas.", 404)
+
+    return output_path, 'documento_extraido.pdf', 'application/pdf'
+
+
+def build_split_zip(data, job):
+    """Divide cada página editada en un PDF individual y los comprime en un ZIP."""
+    import zipfile
 
-    if not extraction_pdf.page_count:
-        return "No se pudieron extraer las páginas seleccionadas.", 404
+    pages_order = data.get('pages_order', [])
+    all_elements_data = data.get('all_elements_data', {})
+    page_refs = [(page_info['docId'], page_info['pageNum'])
+                 for page_info in pages_order]
+    redactions = redaction_rects(page_refs, data.get('redactions') or [])
+    job.start(len(pages_order))
+
+    # Numerar según la posición en pages_order aunque se omitan páginas
+    numbers = [
+        i + 1 for i, (doc_id, _) in enumerate(page_refs)
+        if doc_id in original_pdfs
+    ]
+
+    with _export_file('.zip') as output_path, zipfile.ZipFile(
+            output_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        # Tramos de una página: cada uno ya es el PDF individual
+        runs = export_engine.export_page_runs(page_refs, all_elements_data,
+                                              job, 1, redactions)
+        for number, (_, page_bytes) in zip(numbers, runs):
+            if page_bytes:
+                zip_file.writestr(f"pagina_{number}.pdf", page_bytes)
+
+    return output_path, 'paginas_separadas.zip', 'application/zip'
+
+
+def merge_rows(data):
+    """Filas de una combinación: `rows` ([{campo: valor}, ...]) o `csv`.
+
+    `csv` es el texto de un CSV cuya primera línea son los nombres de los
+    campos. Los valores se convierten a texto.
+    """
+    if data.get('csv') is not None:
+        import csv
+        import io
+
+        rows = list(csv.DictReader(io.StringIO(str(data['csv']))))
+    else:
+        rows = data.get('rows') or []
+    if not isinstance(rows, list) or not all(
+            isinstance(row, dict) for row in rows):
+        raise ExportError("Las filas deben ser una lista de objetos.", 400)
+    if not rows:
+        raise ExportError("No hay filas con las que rellenar la plantilla.", 400)
+    if len(rows) > MERGE_MAX_ROWS:
+        raise ExportError(
+            f"Se admiten como mucho {MERGE_MAX_ROWS} filas por combinación.",
+            413)
+    return [{
+        str(field): '' if value is None else str(value)
+        for field, value in row.items() if field is not None
+    } for row in rows]
+
+
+def _merge_filename(pattern, values, number, used):
+    """Nombre en el ZIP del documento de la fila `number` (ver build_mail_merge)."""
+    import editing
+
+    name = editing.PLACEHOLDER.sub(lambda match: values[match.group(1)],
+                                   pattern) if pattern else ''
+    name = re.sub(r'[\x00-\x1f/\\]', '_', name).strip(' .')
+    if not name:
+        name = f"documento_{number}"
+    if not name.lower().endswith('.pdf'):
+        name += '.pdf'
+    if name.lower() in used:
+        name = f"{name[:-4]}_{number}.pdf"
+    used.add(name.lower())
+    return name
+
+
+def build_mail_merge(data, job):
+    """Rellena una plantilla con cada fila y devuelve los PDF en un ZIP.
+
+    La plantilla son las páginas `pages_order` con las ediciones de
+    `all_elements_data`, cuyos textos pueden tener campos {{campo}}; las
+    filas, `rows` o `csv` (ver merge_rows). Las páginas de la plantilla, con
+    los elementos que no tienen campos ya dibujados, se generan una sola vez
+    en un documento que se comparte con los workers, y cada worker lo abre
+    una vez y genera tramos de MERGE_RUN_ROWS documentos en paralelo con los
+    demás. Los elementos con campos quedan por encima de los demás. Si
+    alguna página de la plantilla no se puede generar, la combinación falla:
+    las ediciones de cada fila se dibujan por posición en la plantilla. Los
+    PDF se añaden al ZIP según terminan; el nombre de cada uno sale de
+    `filename` (p. ej. "carta_{{nombre}}.pdf") o es documento_<fila>.pdf.
+    Las filas que no se pueden generar se enumeran en errores.txt.
+    """
+    import editing
+    import zipfile
+
+    pages_order = data.get('pages_order', [])
+    all_elements_data = data.get('all_elements_data', {})
+    filename = str(data.get('filename') or '')
+    if not pages_order:
+        raise ExportError("No hay páginas en la plantilla.", 400)
+    rows = merge_rows(data)
+
+    page_refs = [(page_info['docId'], page_info['pageNum'])
+                 for page_info in pages_order]
+    missing = [doc_id for doc_id, _ in page_refs if doc_id not in original_pdfs]
+    if missing:
+        raise ExportError(f"El documento {missing[0]} ya no está cargado.", 404)
+    # Los elementos sin campos son iguales en todos los documentos: se
+    # dibujan una vez en la plantilla y no en cada fila
+    fixed_edits = {}
+    pages = []
+    for i, (doc_id, page_num) in enumerate(page_refs):
+        page_id = f"{doc_id}_{page_num}"
+        edits = all_elements_data.get(page_id, [])
+        fixed_edits[page_id] = [
+            element for element in edits
+            if not editing.placeholder_fields([element])
+        ]
+        row_edits = [
+            element for element in edits
+            if editing.placeholder_fields([element])
+        ]
+        if row_edits:
+            pages.append((i, row_edits))
+    fields = editing.placeholder_fields(
+        [element for _, edits in pages for element in edits])
+    fields.update(editing.PLACEHOLDER.findall(filename))
+    for number, values in enumerate(rows, 1):
+        for field in sorted(fields):
+            if field not in values:
+                raise ExportError(
+                    f"Falta el campo \"{field}\" en la fila {number}.", 400)
+
+    job.start(len(page_refs) + len(rows))
+    # Comprimida una vez, para no comprimir de nuevo sus imágenes en cada fila
+    template = editing.merge_pdfs([
+        part for _, part in export_engine.export_page_runs(
+            page_refs, fixed_edits, job, EXPORT_RUN_PAGES) if part
+    ], deflate=True)
+    template_id = f"plantilla-{uuid.uuid4()}"
+    original_pdfs.put(template_id, template)
+    try:
+        with original_pdfs.lease(template_id) as handles, _export_file(
+                '.zip') as output_path, zipfile.ZipFile(
+                    output_path, 'w', zipfile.ZIP_STORED) as zip_file:
+            handle = handles[template_id]
+            # Una página omitida desplazaría las ediciones de las siguientes
+            try:
+                template_pages = len(
+                    pdf_workers.call('open', template_id, handle))
+            except (PageLimitExceeded, WorkerError):
+                template_pages = None
+            if template_pages != len(page_refs):
+                raise ExportError(
+                    "No se pudieron generar todas las páginas de la "
+                    "plantilla.", 422)
+            batches = [(start, rows[start:start + MERGE_RUN_ROWS])
+                       for start in range(0, len(rows), MERGE_RUN_ROWS)]
+            calls = [(template_id, handle, {
+                'pages': pages,
+                'rows': batch,
+                'cost': len(batch) * max(len(pages), 1)
+            }) for _, batch in batches]
+            used = set()
+            errors = []
+            with contextlib.closing(pdf_workers.map('fill_template',
+                                                    calls)) as results:
+                for (start, batch), outputs in zip(batches, results):
+                    if isinstance(outputs, Exception):
+                        outputs = _fill_rows_individually(
+                            template_id, handle, pages, start, batch, errors)
+                    nbytes = 0
+                    for number, values, pdf_bytes in zip(
+                            range(start + 1, start + len(batch) + 1), batch,
+                            outputs):
+                        if pdf_bytes is None:
+                            continue
+                        zip_file.writestr(
+                            _merge_filename(filename, values, number, used),
+                            pdf_bytes)
+                        nbytes += len(pdf_bytes)
+                    job.advance(len(batch), nbytes)
+            if errors:
+                zip_file.writestr('errores.txt', ''.join(errors))
+    finally:
+        original_pdfs.discard(template_id)
+
+    return output_path, 'documentos_combinados.zip', 'application/zip'
+
+
+def _fill_rows_individually(template_id, handle, pages, start, rows, errors):
+    """Repite fila a fila un tramo de build_mail_merge que falló.
+
+    Devuelve el PDF de cada fila, o None en las que fallan, que se anotan en
+    `errors`.
+    """
+    outputs = []
+    for number, values in enumerate(rows, start + 1):
+        try:
+            outputs.extend(
+                pdf_workers.call('fill_template',
+                                 template_id,
+                                 handle,
+                                 cost=max(len(pages), 1),
+                                 pages=pages,
+                                 rows=[values]))
+        except (PageLimitExceeded, WorkerError) as e:
+            print(f"Error al rellenar la plantilla con la fila {number}: {e}")
+            errors.append(f"Fila {number}: {e}\n")
+            outputs.append(None)
+    return outputs
+
+
+# Tipos de exportación disponibles tanto en las rutas síncronas como en /jobs
+EXPORTERS = {
+    'final': build_final_pdf,
+    'extract': build_extracted_pdf,
+    'split': build_split_zip,
+    'mail_merge': build_mail_merge,
+}
+
+def remove_export(result):
+    """Borra el fichero de un resultado (ruta, nombre, tipo MIME)."""
+    if result is not None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(result[0])
+
+
+export_jobs = JobManager(
+    max_workers=int(os.environ.get('PDF_EXPORT_WORKERS', 2)),
+    max_pending=int(os.environ.get('PDF_EXPORT_QUEUE', 32)),
+    on_expire=lambda job: remove_export(job.result))
+
+
+def _send_export(result, remove=True):
+    """Envía al cliente el resultado (ruta, nombre, tipo MIME) de un exportador.
+
+    El fichero se sirve desde disco, así el servidor WSGI puede usar sendfile.
+    Con `remove` se borra en cuanto se abre: el descriptor abierto sigue
+    siendo legible hasta que termina la respuesta.
+    """
+    output_path, download_name, mimetype = result
+    if not remove:
+        return send_file(output_path,
+                         as_attachment=True,
+                         download_name=download_name,
+                         mimetype=mimetype)
+
+    output_file = open(output_path, 'rb')
+    size = os.fstat(output_file.fileno()).st_size
+    os.remove(output_path)
+    response = send_file(output_file,
+                         as_attachment=True,
+                         download_name=download_name,
+                         mimetype=mimetype)
+    response.content_length = size
+    return response
+
+
+def run_export(kind, data, job):
+    """Ejecuta una exportación y devuelve (ruta, nombre, tipo MIME).
+
+    Los errores, incluida la cancelación, se lanzan como ExportError con el
+    código HTTP que corresponde.
+    """
+    try:
+        result = EXPORTERS[kind](data, job)
+    except ExportError as e:
+        job.fail(str(e), e.status)
+        raise
+    except JobCancelled:
+        # El cliente se fue o canceló: no seguir con el resto de páginas
+        job.mark_cancelled()
+        raise ExportError("Exportación cancelada.", 499)
+    except Exception as e:
+        job.fail(str(e))
+        raise
+
+    job.finish(None)
+    return result
+
+
+def _run_export(kind):
+    """Ejecuta una exportación dentro de la petición actual."""
+    data = request.json
+    job = _request_job(kind, data.get('job_id'))
+    if job is None:
+        return "Identificador de trabajo no válido.", 400
+
+    try:
+        return _send_export(run_export(kind, data, job))
+    except ExportError as e:
+        return str(e), e.status
+
+
+@app.route('/download_final_pdf', methods=['POST'])
+def download_final_pdf():
+    """Combina todas las páginas editadas en un solo PDF final."""
+    return _run_export('final')
 
-    output_buffer = io.BytesIO()
-    extraction_pdf.save(output_buffer)
-    extraction_pdf.close()
-    output_buffer.seek(0)
 
-    return send_file(output_buffer,
-                     as_attachment=True,
-                     download_name='documento_extraido.pdf',
-                     mimetype='application/pdf')
+@app.route('/extract_pages', methods=['POST'])
+def extract_pages():
+    """Extrae páginas específicas de los documentos cargados."""
+    return _run_export('extract')
 
 
 @app.route('/split_all_pages', methods=['POST'])
 def split_all_pages():
     """Divide cada página editada en un PDF individual y los comprime en un ZIP."""
-    data = request.json
-    pages_order = data.get('pages_order', [])
-    all_elements_data = data.get('all_elements_data', {})
+    return _run_export('split')
 
-    zip_buffer = io.BytesIO()
 
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for i, page_info in enumerate(pages_order):
-            doc_id = page_info['docId']
-            page_num = page_info['pageNum']
-            page_id = f"{doc_id}_{page_num}"
+@app.route('/mail_merge', methods=['POST'])
+def mail_merge():
+    """Rellena la plantilla con cada fila y devuelve los PDF en un ZIP."""
+    return _run_export('mail_merge')
 
-            if doc_id not in original_pdfs:
-                continue
 
-            doc_data = original_pdfs[doc_id]
-            edits = all_elements_data.get(page_id, [])
+def job_status(job):
+    """Estado de un trabajo tal como lo ven el cliente y el flujo de eventos."""
+    status = job.to_dict()
+    if job.status == 'done' and job.result is not None:
+        status['resultUrl'] = f"/jobs/{job.id}/result"
+    return status
+
+
+def job_event(job):
+    """Mensaje Server-Sent Events con el estado actual del trabajo."""
+    return f"event: progress\ndata: {json.dumps(job_status(job))}\n\n"
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Encola una exportación (ver EXPORTERS) en segundo plano."""
+    data = request.json or {}
+    kind = data.get('kind')
+    if kind not in EXPORTERS:
+        return jsonify({"error": "Tipo de trabajo no válido"}), 400
+
+    try:
+        job = export_jobs.submit(kind, EXPORTERS[kind], data)
+    except QueueFull:
+        return jsonify({"error": "Demasiados trabajos en cola"}), 503
+
+    return jsonify(job_status(job)), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Devuelve el progreso de un trabajo y el enlace al resultado."""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(job_status(job))
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancela un trabajo en curso; se detiene antes de la siguiente página."""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    job.cancel()
+    return jsonify(job_status(job)), 202
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_beacon(job_id):
+    """Igual que DELETE /jobs/<id>, para navigator.sendBeacon al cerrar la pestaña."""
+    return cancel_job(job_id)
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Flujo Server-Sent Events con el progreso de un trabajo o una carga."""
+    # Una carga se registra cuando llega su cuerpo, que puede ser después de
+    # que el cliente abra este flujo
+    job = export_jobs.wait_for(job_id, timeout=30)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+
+    def generate():
+        version = None
+        while True:
+            new_version = job.wait_for_update(version, timeout=15)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield job_event(job)
+            if job.finished:
+                break
+
+    return Response(generate(),
+                    mimetype='text/event-stream',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Descarga el resultado de un trabajo terminado."""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    if job.status == 'error':
+        return job.error, job.error_status
+    if job.status != 'done':
+        return jsonify(job_status(job)), 409
+    if job.result is None:
+        return jsonify({"error": "El trabajo no tiene resultado"}), 404
+    # El fichero se conserva para otras descargas hasta que el trabajo caduca
+    return _send_export(job.result, remove=False)
 
-            # Crear un PDF de una sola página
-            if edits:
-                modified_page_bytes = apply_edits_to_page(
-                    doc_data, page_num, edits)
-                if modified_page_bytes:
-                    zip_file.writestr(f"pagina_{i+1}.pdf", modified_page_bytes)
-            else:
-                temp_doc = fitz.open(stream=doc_data, filetype="pdf")
-                single_page_doc = fitz.open()
-                single_page_doc.insert_pdf(temp_doc,
-                                           from_page=page_num,
-                                           to_page=page_num)
-                temp_doc.close()
-
-                output_buffer = io.BytesIO()
-                single_page_doc.save(output_buffer)
-                single_page_doc.close()
-
-                zip_file.writestr(f"pagina_{i+1}.pdf",
-                                  output_buffer.getvalue())
-
-    zip_buffer.seek(0)
-    return send_file(zip_buffer,
-                     as_attachment=True,
-                     download_name='paginas_separadas.zip',
-                     mimetype='application/zip')
-
-
-# --- Contenido HTML y JavaScript (Corregido y Completado) ---
-
-HTML_FORM = """
-<!DOCTYPE html>
-<html lang="es">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Editor y Combinador de PDF</title>
-    <link href="https://fonts.googleapis.com/css2?family=Bebas+Neue&display=swap" rel="stylesheet">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.2/css/all.min.css" integrity="sha512-SnH5WK+bZxgPHs44uWIX+LLJAJ9/2PkPKZ5QiAj6Ta86w+fsb2TkcmShkL7S7pE/F+VwE/K3M+Tq/8w/t3P9Sg==" crossorigin="anonymous" referrerpolicy="no-referrer" />
-    <style>
-        :root {
-            --dragon-orange: #f77f00; /* Naranja del uniforme */
-            --kamehameha-blue: #428bca; /* Azul del Kamehameha */
-            --kaioken-red: #dc3545; /* Rojo del Kaioken */
-            --super-saiyan-yellow: #ffc107; /* Amarillo/Dorado del aura */
-            --background-dark: #1f1f1f; /* Fondo oscuro */
-            --card-bg: #2c2c2c; /* Fondo de las tarjetas */
-            --text-light: #f5f5f5; /* Texto claro */
-            --text-faded: #cccccc; /* Texto secundario */
-            --border-color: #555555; /* Color de los bordes */
-            --danger-color: var(--kaioken-red); /* Rojo para acciones peligrosas */
-        }
-
-        body {
-            font-family: 'Bebas Neue', 'Arial Black', sans-serif;
-            text-align: center;
-            margin: 0;
-            padding: 40px 15px;
-            background-color: var(--background-dark);
-            color: var(--text-light);
-            line-height: 1.6;
-        }
-
-        .container {
-            max-width: 1100px;
-            margin: auto;
-            padding: 30px;
-            background-color: var(--card-bg);
-            border-radius: 15px;
-            border: 3px solid var(--dragon-orange);
-            box-shadow: 0 0 25px rgba(247, 127, 0, 0.4);
-            transition: all 0.3s ease;
-        }
-
-        h1 {
-            font-family: 'Bebas Neue', sans-serif;
-            color: var(--dragon-orange);
-            font-size: 4em;
-            letter-spacing: 2px;
-            text-shadow: 2px 2px 5px rgba(0, 0, 0, 0.5), 0 0 10px var(--super-saiyan-yellow);
-            margin-bottom: 5px;
-            transition: color 0.3s ease;
-        }
-
-        p {
-            font-family: 'Arial', sans-serif;
-            color: var(--text-faded);
-            font-size: 1.1em;
-            margin-bottom: 30px;
-        }
-
-        .file-upload-label, button {
-            font-family: 'Bebas Neue', sans-serif;
-            padding: 15px 30px;
-            font-size: 1.2em;
-            letter-spacing: 1px;
-            color: var(--background-dark);
-            background-color: var(--dragon-orange);
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-            transition: all 0.2s ease;
-            text-transform: uppercase;
-            font-weight: bold;
-            position: relative;
-            z-index: 1;
-            overflow: hidden;
-            border: 2px solid transparent;
-        }
-
-        .file-upload-label:before, button:before {
-            content: '';
-            position: absolute;
-            top: 50%;
-            left: 50%;
-            width: 0;
-            height: 0;
-            background: rgba(66, 139, 202, 0.2);
-            border-radius: 50%;
-            transition: all 0.4s ease;
-            transform: translate(-50%, -50%);
-            z-index: -1;
-        }
-
-        .file-upload-label:hover, button:hover {
-            background-color: var(--kamehameha-blue);
-            color: var(--text-light);
-            border-color: var(--super-saiyan-yellow);
-            box-shadow: 0 0 15px var(--super-saiyan-yellow);
-            transform: translateY(-3px);
-        }
-
-        .file-upload-label:hover:before, button:hover:before {
-            width: 200px;
-            height: 200px;
-            opacity: 0;
-        }
-
-        #reset-files-btn {
-            background-color: var(--danger-color);
-        }
-        #reset-files-btn:hover {
-            background-color: #a31120;
-            border-color: var(--text-light);
-            box-shadow: 0 0 15px var(--text-light);
-        }
-
-        #tools {
-            margin-top: 30px;
-            padding: 25px;
-            background-color: #242424;
-            border-radius: 12px;
-            border: 2px solid var(--border-color);
-            box-shadow: inset 0 0 10px rgba(0, 0, 0, 0.5);
-        }
-
-        .tool-group {
-            display: flex;
-            flex-wrap: wrap;
-            justify-content: center;
-            align-items: center;
-            gap: 20px;
-            margin-bottom: 20px;
-        }
-
-        #tools input, #tools select, #tools input::-webkit-color-swatch-wrapper {
-            font-family: 'Arial', sans-serif;
-            border: 2px solid var(--border-color);
-            padding: 10px 15px;
-            border-radius: 6px;
-            background-color: var(--background-dark);
-            color: var(--text-light);
-            font-size: 1em;
-            transition: border-color 0.2s ease, box-shadow 0.2s ease;
-        }
-
-        #tools input:focus, #tools select:focus, #tools input::-webkit-color-swatch-wrapper:focus {
-            border-color: var(--kamehameha-blue);
-            box-shadow: 0 0 8px rgba(66, 139, 202, 0.5);
-            outline: none;
-        }
-
-        #text-input {
-            width: 200px;
-        }
-
-        #pdf-thumbnails {
-            display: flex;
-            flex-wrap: wrap;
-            justify-content: center;
-            gap: 20px;
-            margin-top: 40px;
-        }
-
-        .page-thumbnail {
-            border: 2px solid var(--border-color);
-            border-radius: 8px;
-            padding: 10px;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            background-color: var(--card-bg);
-            box-shadow: 0 0 10px rgba(0, 0, 0, 0.3);
-            width: 150px;
-            height: auto;
-        }
-
-        .page-thumbnail img {
-            display: block;
-            width: 100%;
-            border-radius: 6px;
-            border: 1px solid var(--border-color);
-        }
-
-        .page-thumbnail.selected-thumb {
-            border-color: var(--dragon-orange);
-            box-shadow: 0 0 15px var(--dragon-orange), 0 0 5px rgba(255, 255, 255, 0.5);
-            transform: scale(1.08);
-        }
-
-        .page-thumbnail:hover {
-            transform: scale(1.05);
-            border-color: var(--kamehameha-blue);
-            box-shadow: 0 0 15px var(--kamehameha-blue);
-        }
-
-        #page-container {
-            position: relative;
-            width: 100%;
-            max-width: 800px;
-            margin: 40px auto;
-            border: 3px solid var(--border-color);
-            box-shadow: 0 0 20px rgba(0,0,0,0.7);
-            border-radius: 12px;
-            overflow: hidden;
-            background-color: var(--card-bg);
-            user-select: none; /* Evita la selección de texto durante el arrastre */
-        }
-
-        #page-image {
-            width: 100%;
-            height: auto;
-            display: block;
-        }
-
-        .added-element {
-            position: absolute;
-            cursor: move;
-            border: 2px dashed transparent;
-            transition: border-color 0.2s ease, box-shadow 0.2s ease;
-            box-sizing: border-box;
-        }
-
-        .added-element.selected {
-            border-color: var(--super-saiyan-yellow);
-            box-shadow: 0 0 10px var(--super-saiyan-yellow);
-        }
-
-        .added-text {
-            white-space: pre;
-            font-family: 'Arial', sans-serif;
-            text-align: left;
-            padding: 5px;
-        }
-
-        .resizer {
-            position: absolute;
-            width: 15px;
-            height: 15px;
-            background: var(--dragon-orange);
-            border: 3px solid var(--card-bg);
-            border-radius: 50%;
-            z-index: 100;
-            opacity: 0;
-            transition: opacity 0.2s ease;
-        }
-
-        .added-element.selected .resizer {
-            opacity: 1;
-        }
-
-        .resizer.bottom-right {
-            right: -8px;
-            bottom: -8px;
-            cursor: nwse-resize;
-        }
-
-        footer {
-            margin-top: 60px;
-            font-size: 1em;
-            color: var(--text-faded);
-        }
-
-        @media (max-width: 768px) {
-            .container {
-                padding: 15px;
-            }
-            h1 {
-                font-size: 3em;
-            }
-            .tool-group {
-                flex-direction: column;
-            }
-            #tools button, #tools select, #tools input {
-                width: 100%;
-                box-sizing: border-box;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>EDITOR Y COMBINADOR DE PDF</h1>
-        <p>Sube, edita y fusiona tus documentos PDF.</p>
-
-        <label for="pdf-files" class="file-upload-label">Cargar PDFs</label>
-        <input type="file" id="pdf-files" name="pdf_files" accept=".pdf" multiple style="display: none;">
-        <button id="reset-files-btn" style="display: none;">Reiniciar</button>
-
-        <div id="tools">
-            <div class="tool-group">
-                <input type="text" id="text-input" placeholder="Escribe el texto">
-                <select id="font-size">
-                    <option value="12">12pt</option>
-                    <option value="14">14pt</option>
-                    <option value="16">16pt</option>
-                    <option value="18">18pt</option>
-                    <option value="24">24pt</option>
-                </select>
-                <label for="font-color">Color:</label>
-                <input type="color" id="font-color" value="#feca34">
-                <button id="bold-btn">B</button>
-                <button id="italic-btn">I</button>
-                <button id="add-text-btn">Añadir Texto</button>
-            </div>
-            <div class="tool-group">
-                <label for="image-upload" class="file-upload-label">
-                    <i class="fas fa-image"></i> Subir Imagen/Firma
-                </label>
-                <input type="file" id="image-upload" accept="image/*" style="display: none;">
-            </div>
-            <div class="tool-group">
-                <label for="fill-color">Relleno:</label>
-                <input type="color" id="fill-color" value="#007bff">
-                <label for="border-color">Borde:</label>
-                <input type="color" id="border-color" value="#f77f00">
-                <button id="add-rect-btn">Añadir Rectángulo</button>
-                <button id="add-circle-btn">Añadir Círculo</button>
-            </div>
-            <div class="tool-group">
-                <button id="delete-element-btn">Eliminar Elemento</button>
-                <button id="delete-page-btn">Eliminar Página</button>
-                <button id="download-final-pdf-btn" style="display: none;">Descargar PDF Final</button>
-            </div>
-            <div class="tool-group">
-                <input type="text" id="extract-pages-input" placeholder="Ej: 1, 3, 5-8">
-                <button id="extract-pages-btn">Extraer Páginas</button>
-                <button id="split-all-btn">Dividir en todas las páginas</button>
-            </div>
-        </div>
-        <div id="pdf-thumbnails"></div>
-        <div id="page-container">
-            <img id="page-image" src="" alt="Página del PDF">
-        </div>
-    </div>
-    <footer>
-        <p>Desarrollado por Yeisson Rincon</p>
-        <p>&copy; 2025 Todos los derechos reservados.</p>
-    </footer>
-    <script src="https://cdn.jsdelivr.net/npm/sortablejs@1.14.0/Sortable.min.js"></script>
-    <script>
-        let uploadedPdfs = { pagesData: {}, pagesOrder: [] };
-        let currentDocumentId = null;
-        let currentPageIndex = 0;
-        let editedElements = {};
-        let isDragging = false;
-        let draggedElement = null;
-        let isResizing = false;
-        let selectedElement = null;
-        let startX, startY, startWidth, startHeight, startLeft, startTop;
-        let fontStyle = {
-            bold: false,
-            italic: false
-        };
-
-        const pageContainer = document.getElementById('page-container');
-        const thumbnailsContainer = document.getElementById('pdf-thumbnails');
-        const downloadFinalPdfBtn = document.getElementById('download-final-pdf-btn');
-        const resetFilesBtn = document.getElementById('reset-files-btn');
-        const pdfFilesInput = document.getElementById('pdf-files');
-        const boldBtn = document.getElementById('bold-btn');
-        const italicBtn = document.getElementById('italic-btn');
-
-        let sortableInstance = null;
-
-        function initSortable() {
-            if (sortableInstance) {
-                sortableInstance.destroy();
-            }
-            sortableInstance = new Sortable(thumbnailsContainer, {
-                animation: 150,
-                onUpdate: function (evt) {
-                    const newThumbsData = Array.from(thumbnailsContainer.children).map(el => el.getAttribute('data-page-id'));
-                    let newPagesOrder = [];
-                    newThumbsData.forEach(id => {
-                        const [doc, page] = id.split('_');
-                        newPagesOrder.push({ docId: doc, pageNum: parseInt(page) });
-                    });
-                    uploadedPdfs.pagesOrder = newPagesOrder;
-                }
-            });
-        }
-
-        function updateElementPositionAndSize(element, x, y, width, height) {
-            const pageId = `${currentDocumentId}_${currentPageIndex}`;
-            const elementData = (editedElements[pageId] || []).find(data => data.element === element);
-            if (elementData) {
-                elementData.x = x;
-                elementData.y = y;
-                elementData.width = width;
-                elementData.height = height;
-                element.style.left = `${x}px`;
-                element.style.top = `${y}px`;
-                element.style.width = `${width}px`;
-                element.style.height = `${height}px`;
-            }
-        }
-
-        function displayPage(docId, pageIndex) {
-            const pageId = `${docId}_${pageIndex}`;
-            const pageData = uploadedPdfs.pagesData[pageId];
-
-            pageContainer.innerHTML = '';
-
-            const mainPageImage = document.createElement('img');
-            mainPageImage.id = 'page-image';
-            mainPageImage.src = `data:image/png;base64,${pageData}`;
-            pageContainer.appendChild(mainPageImage);
-
-            currentDocumentId = docId;
-            currentPageIndex = pageIndex;
-            selectedElement = null;
-
-            document.querySelectorAll('.page-thumbnail').forEach(thumb => {
-                thumb.classList.remove('selected-thumb');
-            });
-            const selectedThumb = document.querySelector(`[data-page-id="${pageId}"]`);
-            if (selectedThumb) {
-                selectedThumb.classList.add('selected-thumb');
-            }
-
-            const currentPageEdits = editedElements[pageId] || [];
-            if (currentPageEdits.length > 0) {
-                currentPageEdits.forEach(elementData => {
-                    let newElement = createEditableElement(elementData);
-                    pageContainer.appendChild(newElement);
-                    elementData.element = newElement;
-                });
-            }
-            pageContainer.style.display = 'block';
-        }
-
-        function createEditableElement(elementData) {
-            let newElement = document.createElement('div');
-            newElement.className = 'added-element';
-
-            if (elementData.type === 'text') {
-                newElement.classList.add('added-text');
-                newElement.textContent = elementData.text;
-                newElement.style.fontSize = `${elementData.fontSize}px`;
-                newElement.style.color = elementData.fontColor;
-                newElement.style.fontWeight = elementData.bold ? 'bold' : 'normal';
-                newElement.style.fontStyle = elementData.italic ? 'italic' : 'normal';
-            } else if (elementData.type === 'image') {
-                newElement.classList.add('added-image');
-                let img = document.createElement('img');
-                img.src = elementData.src;
-                img.style.width = '100%';
-                img.style.height = '100%';
-                newElement.appendChild(img);
-            } else if (elementData.type === 'rect') {
-                newElement.classList.add('added-rect');
-                newElement.style.backgroundColor = elementData.fillColor;
-                newElement.style.border = `1px solid ${elementData.borderColor}`;
-            } else if (elementData.type === 'circle') {
-                newElement.classList.add('added-circle');
-                newElement.style.backgroundColor = elementData.fillColor;
-                newElement.style.border = `1px solid ${elementData.borderColor}`;
-                newElement.style.borderRadius = '50%';
-            }
-
-            newElement.style.left = `${elementData.x}px`;
-            newElement.style.top = `${elementData.y}px`;
-            newElement.style.width = `${elementData.width}px`;
-            newElement.style.height = `${elementData.height}px`;
-
-            if (elementData.type !== 'text') {
-                const resizer = document.createElement('div');
-                resizer.className = 'resizer bottom-right';
-                newElement.appendChild(resizer);
-                resizer.addEventListener('mousedown', function(e) {
-                    isResizing = true;
-                    draggedElement = newElement;
-                    selectElement(newElement);
-
-                    const elementRect = draggedElement.getBoundingClientRect();
-                    startWidth = elementRect.width;
-                    startHeight = elementRect.height;
-                    startX = e.clientX;
-                    startY = e.clientY;
-
-                    e.stopPropagation();
-                    e.preventDefault();
-                });
-            }
-
-            newElement.addEventListener('mousedown', function(e) {
-                if (e.target.classList.contains('resizer')) return;
-                isDragging = true;
-                draggedElement = newElement;
-                selectElement(newElement);
-
-                const elementRect = draggedElement.getBoundingClientRect();
-                startX = e.clientX;
-                startY = e.clientY;
-                startLeft = elementRect.left - pageContainer.getBoundingClientRect().left;
-                startTop = elementRect.top - pageContainer.getBoundingClientRect().top;
-
-                e.preventDefault();
-            });
-
-            return newElement;
-        }
-
-        function renderThumbnails() {
-            thumbnailsContainer.innerHTML = '';
-            uploadedPdfs.pagesOrder.forEach(pageInfo => {
-                const pageId = `${pageInfo.docId}_${pageInfo.pageNum}`;
-
-                const thumbWrapper = document.createElement('div');
-                thumbWrapper.className = 'page-thumbnail';
-                thumbWrapper.setAttribute('data-page-id', pageId);
-
-                const img = document.createElement('img');
-                img.src = `data:image/png;base64,${uploadedPdfs.pagesData[pageId]}`;
-                img.alt = `Página ${pageInfo.pageNum + 1}`;
-
-                thumbWrapper.appendChild(img);
-                thumbWrapper.addEventListener('click', () => {
-                    displayPage(pageInfo.docId, pageInfo.pageNum);
-                });
-                thumbnailsContainer.appendChild(thumbWrapper);
-            });
-
-            if (uploadedPdfs.pagesOrder.length > 0) {
-                const firstPageInfo = uploadedPdfs.pagesOrder[0];
-                displayPage(firstPageInfo.docId, firstPageInfo.pageNum);
-                downloadFinalPdfBtn.style.display = 'block';
-                resetFilesBtn.style.display = 'inline-block';
-            } else {
-                pageContainer.style.display = 'none';
-                downloadFinalPdfBtn.style.display = 'none';
-                resetFilesBtn.style.display = 'none';
-            }
-        }
-
-        async function uploadFiles(files) {
-            if (files.length === 0) return;
-
-            const formData = new FormData();
-            for(let i = 0; i < files.length; i++) {
-                formData.append('pdf_files', files[i]);
-            }
-
-            const isFreshUpload = uploadedPdfs.pagesOrder.length === 0;
-            const endpoint = isFreshUpload ? '/upload' : '/add_pdfs';
-
-            try {
-                const response = await fetch(endpoint, {
-                    method: 'POST',
-                    body: formData
-                });
-
-                if (!response.ok) {
-                    throw new Error(`Server responded with status ${response.status}`);
-                }
-
-                const responseData = await response.json();
-
-                if (isFreshUpload) {
-                    uploadedPdfs = responseData;
-                    editedElements = {};
-                } else {
-                    Object.assign(uploadedPdfs.pagesData, responseData.pagesData);
-                    uploadedPdfs.pagesOrder = uploadedPdfs.pagesOrder.concat(responseData.pagesOrder);
-                }
-
-                if (uploadedPdfs.pagesOrder.length > 0) {
-                    renderThumbnails();
-                    initSortable();
-                }
-
-            } catch (error) {
-                alert(`Error al cargar el PDF: ${error.message}`);
-            }
-        }
-
-        pdfFilesInput.addEventListener('change', async function(e) {
-            const files = Array.from(e.target.files);
-            await uploadFiles(files);
-            e.target.value = '';
-        });
-
-        resetFilesBtn.addEventListener('click', function() {
-            uploadedPdfs = { pagesData: {}, pagesOrder: [] };
-            editedElements = {};
-            pageContainer.style.display = 'none';
-            thumbnailsContainer.innerHTML = '';
-            downloadFinalPdfBtn.style.display = 'none';
-            resetFilesBtn.style.display = 'none';
-            if (sortableInstance) {
-                sortableInstance.destroy();
-                sortableInstance = null;
-            }
-        });
-
-        document.getElementById('image-upload').addEventListener('change', function(e) {
-            const file = e.target.files[0];
-            if (!file || !currentDocumentId) return;
-
-            const reader = new FileReader();
-            reader.onload = function(e) {
-                const imageSrc = e.target.result;
-                const pageId = `${currentDocumentId}_${currentPageIndex}`;
-                editedElements[pageId] = editedElements[pageId] || [];
-
-                const newElementData = {
-                    type: 'image',
-                    x: 50, y: 50, width: 100, height: 100,
-                    src: imageSrc,
-                    element: null
-                };
-                editedElements[pageId].push(newElementData);
-                displayPage(currentDocumentId, currentPageIndex);
-            };
-            reader.readAsDataURL(file);
-        });
-
-        document.getElementById('add-rect-btn').addEventListener('click', function() {
-            if (!currentDocumentId) { alert('Sube un PDF primero.'); return; }
-            const fillColor = document.getElementById('fill-color').value;
-            const borderColor = document.getElementById('border-color').value;
-            const pageId = `${currentDocumentId}_${currentPageIndex}`;
-            editedElements[pageId] = editedElements[pageId] || [];
-
-            editedElements[pageId].push({
-                type: 'rect', x: 50, y: 50, width: 100, height: 50,
-                fillColor: fillColor, borderColor: borderColor, element: null
-            });
-            displayPage(currentDocumentId, currentPageIndex);
-        });
-
-        document.getElementById('add-circle-btn').addEventListener('click', function() {
-            if (!currentDocumentId) { alert('Sube un PDF primero.'); return; }
-            const fillColor = document.getElementById('fill-color').value;
-            const borderColor = document.getElementById('border-color').value;
-            const pageId = `${currentDocumentId}_${currentPageIndex}`;
-            editedElements[pageId] = editedElements[pageId] || [];
-
-            editedElements[pageId].push({
-                type: 'circle', x: 50, y: 50, width: 100, height: 100,
-                fillColor: fillColor, borderColor: borderColor, element: null
-            });
-            displayPage(currentDocumentId, currentPageIndex);
-        });
-
-        document.getElementById('add-text-btn').addEventListener('click', async function() {
-            if (!currentDocumentId) { alert('Sube un PDF primero.'); return; }
-            const textToAdd = document.getElementById('text-input').value;
-            if (!textToAdd) { alert('Escribe un texto para añadir.'); return; }
-
-            const pageId = `${currentDocumentId}_${currentPageIndex}`;
-            editedElements[pageId] = editedElements[pageId] || [];
-
-            const fontSize = parseInt(document.getElementById('font-size').value);
-            const fontColor = document.getElementById('font-color').value;
-
-            // Medir el texto para darle un ancho inicial
-            const tempDiv = document.createElement('div');
-            tempDiv.style.position = 'absolute';
-            tempDiv.style.visibility = 'hidden';
-            tempDiv.style.whiteSpace = 'pre';
-            tempDiv.style.fontFamily = 'Arial';
-            tempDiv.style.fontSize = `${fontSize}px`;
-            tempDiv.style.fontWeight = fontStyle.bold ? 'bold' : 'normal';
-            tempDiv.style.fontStyle = fontStyle.italic ? 'italic' : 'normal';
-            tempDiv.textContent = textToAdd;
-            document.body.appendChild(tempDiv);
-            const textWidth = tempDiv.offsetWidth + 10;
-            const textHeight = tempDiv.offsetHeight + 10;
-            document.body.removeChild(tempDiv);
-
-            editedElements[pageId].push({
-                type: 'text', text: textToAdd, x: 50, y: 50, width: textWidth, height: textHeight,
-                fontSize: fontSize,
-                fontColor: fontColor,
-                bold: fontStyle.bold, italic: fontStyle.italic, element: null
-            });
-            displayPage(currentDocumentId, currentPageIndex);
-        });
-
-        boldBtn.addEventListener('click', function() {
-            fontStyle.bold = !fontStyle.bold;
-            boldBtn.style.backgroundColor = fontStyle.bold ? 'var(--super-saiyan-yellow)' : 'var(--dragon-orange)';
-        });
-
-        italicBtn.addEventListener('click', function() {
-            fontStyle.italic = !fontStyle.italic;
-            italicBtn.style.backgroundColor = fontStyle.italic ? 'var(--super-saiyan-yellow)' : 'var(--dragon-orange)';
-        });
-
-        document.getElementById('delete-element-btn').addEventListener('click', function() {
-            if (!selectedElement) {
-                alert('Selecciona un elemento para eliminar.');
-                return;
-            }
-            const pageId = `${currentDocumentId}_${currentPageIndex}`;
-            const elementDataIndex = (editedElements[pageId] || []).findIndex(
-                data => data.element === selectedElement
-            );
-            if (elementDataIndex > -1) {
-                editedElements[pageId].splice(elementDataIndex, 1);
-                selectedElement = null;
-                displayPage(currentDocumentId, currentPageIndex);
-            }
-        });
-
-        document.getElementById('delete-page-btn').addEventListener('click', function() {
-            const pageIdToDelete = `${currentDocumentId}_${currentPageIndex}`;
-            const pageIndexInOrder = uploadedPdfs.pagesOrder.findIndex(p => `${p.docId}_${p.pageNum}` === pageIdToDelete);
-
-            if (pageIndexInOrder > -1) {
-                uploadedPdfs.pagesOrder.splice(pageIndexInOrder, 1);
-
-                delete editedElements[pageIdToDelete];
-                delete uploadedPdfs.pagesData[pageIdToDelete];
-
-                const newPageIndex = Math.min(pageIndexInOrder, uploadedPdfs.pagesOrder.length - 1);
-
-                if (uploadedPdfs.pagesOrder.length > 0) {
-                    const newPageInfo = uploadedPdfs.pagesOrder[newPageIndex];
-                    displayPage(newPageInfo.docId, newPageInfo.pageNum);
-                } else {
-                    pageContainer.style.display = 'none';
-                    downloadFinalPdfBtn.style.display = 'none';
-                    resetFilesBtn.style.display = 'none';
-                }
-
-                renderThumbnails();
-            } else {
-                alert('No se puede eliminar la página seleccionada.');
-            }
-        });
-
-        document.getElementById('download-final-pdf-btn').addEventListener('click', async function() {
-            if (uploadedPdfs.pagesOrder.length === 0) {
-                alert('No hay páginas para descargar.');
-                return;
-            }
-
-            // Envía solo los datos necesarios para la descarga
-            const downloadData = {
-                pages_order: uploadedPdfs.pagesOrder,
-                all_elements_data: {}
-            };
-            for (const pageId in editedElements) {
-                if (editedElements[pageId].length > 0) {
-                    downloadData.all_elements_data[pageId] = editedElements[pageId].map(element => ({
-                        type: element.type,
-                        x: element.x,
-                        y: element.y,
-                        width: element.width,
-                        height: element.height,
-                        text: element.text,
-                        fontSize: element.fontSize,
-                        fontColor: element.fontColor,
-                        bold: element.bold,
-                        italic: element.italic,
-                        src: element.src,
-                        fillColor: element.fillColor,
-                        borderColor: element.borderColor
-                    }));
-                }
-            }
-
-            const response = await fetch('/download_final_pdf', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(downloadData)
-            });
-
-            if (response.ok) {
-                const blob = await response.blob();
-                const url = URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = `documento_final.pdf`;
-                document.body.appendChild(a);
-                a.click();
-                a.remove();
-                URL.revokeObjectURL(url);
-                alert('PDF descargado con éxito.');
-            } else {
-                const errorText = await response.text();
-                alert(`Error al descargar el PDF: ${errorText}`);
-            }
-        });
-
-        document.getElementById('extract-pages-btn').addEventListener('click', async function() {
-            const pagesInput = document.getElementById('extract-pages-input').value;
-            const pages = parsePageRanges(pagesInput);
-
-            if (pages.length === 0) {
-                alert('Formato de páginas no válido. Usa "1, 3, 5-8".');
-                return;
-            }
-
-            // Envía solo los datos necesarios para la descarga
-            const extractData = {
-                pages: pages,
-                pages_order: uploadedPdfs.pagesOrder,
-                all_elements_data: {}
-            };
-            for (const pageId in editedElements) {
-                if (editedElements[pageId].length > 0) {
-                    extractData.all_elements_data[pageId] = editedElements[pageId].map(element => ({
-                        type: element.type,
-                        x: element.x,
-                        y: element.y,
-                        width: element.width,
-                        height: element.height,
-                        text: element.text,
-                        fontSize: element.fontSize,
-                        fontColor: element.fontColor,
-                        bold: element.bold,
-                        italic: element.italic,
-                        src: element.src,
-                        fillColor: element.fillColor,
-                        borderColor: element.borderColor
-                    }));
-                }
-            }
-
-            const response = await fetch('/extract_pages', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(extractData)
-            });
-
-            if (response.ok) {
-                const blob = await response.blob();
-                const url = URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = `documento_extraido.pdf`;
-                document.body.appendChild(a);
-                a.click();
-                a.remove();
-                URL.revokeObjectURL(url);
-                alert('Páginas extraídas y descargadas con éxito.');
-            } else {
-                const errorText = await response.text();
-                alert(`Error al extraer las páginas: ${errorText}`);
-            }
-        });
-
-        document.getElementById('split-all-btn').addEventListener('click', async function() {
-            if (uploadedPdfs.pagesOrder.length === 0) { alert('Sube un PDF primero.'); return; }
-
-            // Envía solo los datos necesarios para la descarga
-            const splitData = {
-                pages_order: uploadedPdfs.pagesOrder,
-                all_elements_data: {}
-            };
-            for (const pageId in editedElements) {
-                if (editedElements[pageId].length > 0) {
-                    splitData.all_elements_data[pageId] = editedElements[pageId].map(element => ({
-                        type: element.type,
-                        x: element.x,
-                        y: element.y,
-                        width: element.width,
-                        height: element.height,
-                        text: element.text,
-                        fontSize: element.fontSize,
-                        fontColor: element.fontColor,
-                        bold: element.bold,
-                        italic: element.italic,
-                        src: element.src,
-                        fillColor: element.fillColor,
-                        borderColor: element.borderColor
-                    }));
-                }
-            }
-
-            const response = await fetch('/split_all_pages', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(splitData)
-            });
-
-            if (response.ok) {
-                const blob = await response.blob();
-                const url = URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = `paginas_separadas.zip`;
-                document.body.appendChild(a);
-                a.click();
-                a.remove();
-                URL.revokeObjectURL(url);
-                alert('PDF dividido y descargado con éxito.');
-            } else {
-                const errorText = await response.text();
-                alert(`Error al dividir todas las páginas: ${errorText}`);
-            }
-        });
-
-        function parsePageRanges(input) {
-            const parts = input.split(',').map(s => s.trim()).filter(s => s.length > 0);
-            let pages = [];
-            parts.forEach(part => {
-                if (part.includes('-')) {
-                    const [start, end] = part.split('-').map(Number);
-                    if (!isNaN(start) && !isNaN(end) && start <= end) {
-                        for (let i = start; i <= end; i++) {
-                            pages.push(i);
-                        }
-                    }
-                } else {
-                    const pageNum = Number(part);
-                    if (!isNaN(pageNum)) {
-                        pages.push(pageNum);
-                    }
-                }
-            });
-            return [...new Set(pages)].sort((a, b) => a - b);
-        }
-
-        function selectElement(element) {
-            if (selectedElement && selectedElement !== element) {
-                selectedElement.classList.remove('selected');
-            }
-            selectedElement = element;
-            selectedElement.classList.add('selected');
-        }
-
-        pageContainer.addEventListener('click', function(e) {
-            if (selectedElement && !e.target.closest('.added-element')) {
-                selectedElement.classList.remove('selected');
-                selectedElement = null;
-            }
-        });
-
-        document.addEventListener('mousemove', function(e) {
-            if (!draggedElement) return;
-
-            const pageContainerRect = pageContainer.getBoundingClientRect();
-
-            if (isResizing) {
-                const newWidth = Math.max(10, e.clientX - startX + startWidth);
-                const newHeight = Math.max(10, e.clientY - startY + startHeight);
-
-                updateElementPositionAndSize(
-                    draggedElement,
-                    startLeft,
-                    startTop,
-                    newWidth,
-                    newHeight
-                );
-            } else if (isDragging) {
-                const newLeft = e.clientX - startX + startLeft;
-                const newTop = e.clientY - startY + startTop;
-
-                updateElementPositionAndSize(
-                    draggedElement,
-                    newLeft,
-                    newTop,
-                    draggedElement.offsetWidth,
-                    draggedElement.offsetHeight
-                );
-            }
-        });
-
-        document.addEventListener('mouseup', function() {
-            isDragging = false;
-            isResizing = false;
-            draggedElement = null;
-        });
-
-        // Inicializar el renderizado si hay algo en el historial de navegación
-        window.onload = function() {
-            if (uploadedPdfs.pagesOrder.length > 0) {
-                renderThumbnails();
-            }
-        };
-    </script>
-</body>
-</html>
-"""
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,275 @@
+"""Variante ASGI del servidor (Quart sobre Hypercorn).
+
+Con gunicorn cada carga o exportación ocupa un hilo del servidor mientras
+espera a los workers de MuPDF, y un flujo de eventos abierto ocupa otro
+durante minutos. Aquí las rutas largas son corrutinas: el trabajo bloqueante
+(leer el cuerpo, repartir páginas entre los workers, comprimir) se ejecuta en
+un pool de hilos propio y el bucle de eventos sigue atendiendo peticiones,
+flujos SSE y descargas. Si el cliente se desconecta, Quart cancela la
+corrutina y el trabajo se cancela en la siguiente página.
+
+El resto de rutas (editor, estado de trabajos, métricas) se sirven con la
+aplicación Flask de app.py a través del adaptador WSGI de Hypercorn, así que
+ambas variantes comparten el estado de documentos, workers y trabajos.
+
+    python asgi.py    # escucha en el puerto $PORT (8080 por defecto)
+
+El servidor debe arrancarse así y no con el comando `hypercorn`, que ejecuta
+la aplicación en procesos daemon que no pueden lanzar los workers de MuPDF.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, Response, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+import app as pdf_app
+from app import (MAX_UPLOAD_BYTES, ExportError, export_jobs, job_event,
+                 job_status)
+
+# Bytes por bloque al enviar un resultado
+RESULT_CHUNK_SIZE = 256 * 1024
+# Cada cuánto se consulta el progreso de un trabajo en el flujo de eventos
+EVENT_POLL_INTERVAL = 0.25
+EVENT_KEEP_ALIVE = 15
+
+quart_app = Quart(__name__)
+quart_app.config.update(
+    MAX_CONTENT_LENGTH=MAX_UPLOAD_BYTES,
+    BODY_TIMEOUT=int(os.environ.get('PDF_BODY_TIMEOUT', 600)),
+    # Los flujos de eventos y las descargas lentas no tienen límite de tiempo
+    RESPONSE_TIMEOUT=None)
+
+# Hilos para el trabajo bloqueante de las rutas asíncronas; solo esperan a
+# los workers de MuPDF, así que pueden ser muchos más que los núcleos
+blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('PDF_ASGI_THREADS', 32)),
+    thread_name_prefix='asgi-blocking')
+
+
+async def run_blocking(job, func, *args):
+    """Ejecuta `func(*args)` en el pool de hilos sin bloquear el bucle.
+
+    Si la corrutina se cancela (el cliente cerró la conexión) se cancela
+    también el trabajo, que se detiene en la siguiente página.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(blocking_executor, func, *args)
+    except asyncio.CancelledError:
+        job.cancel()
+        raise
+
+
+async def stream_file(result, remove):
+    """Genera por bloques el fichero de un resultado sin bloquear el bucle."""
+    loop = asyncio.get_running_loop()
+    try:
+        with open(result[0], 'rb') as output_file:
+            while True:
+                chunk = await loop.run_in_executor(blocking_executor,
+                                                   output_file.read,
+                                                   RESULT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove:
+            pdf_app.remove_export(result)
+
+
+def export_response(result, remove=True):
+    """Respuesta de descarga para el resultado (ruta, nombre, tipo MIME).
+
+    Con `remove` el fichero se borra al terminar de enviarlo.
+    """
+    output_path, download_name, mimetype = result
+    response = Response(stream_file(result, remove), mimetype=mimetype)
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="{download_name}"')
+    response.headers['Content-Length'] = str(os.path.getsize(output_path))
+    return response
+
+
+async def _run_upload():
+    files = (await request.files).getlist('pdf_files')
+    if not files:
+        return jsonify({"error": "No se subieron archivos"}), 400
+
+    job = pdf_app.new_request_job('upload', (await request.form).get('job_id'))
+    if job is None:
+        return jsonify({"error": "Identificador de trabajo no válido"}), 400
+
+    render = pdf_app.page_render_options(
+        (await request.form).get('render_width'), request.accept_mimetypes)
+    body, status = await run_blocking(job, pdf_app.run_upload, job,
+                                      pdf_app.ingest_pdfs, files, render)
+    return jsonify(body), status
+
+
+@quart_app.route('/upload', methods=['POST'])
+async def upload_files():
+    """Sube uno o más PDFs y devuelve las páginas rasterizadas."""
+    return await _run_upload()
+
+
+@quart_app.route('/add_pdfs', methods=['POST'])
+async def add_pdfs():
+    """Agrega PDFs a los ya cargados."""
+    return await _run_upload()
+
+
+@quart_app.route('/uploads/<upload_id>/complete', methods=['POST'])
+async def complete_upload(upload_id):
+    """Comprueba el hash de una carga completa y rasteriza sus páginas."""
+    data = await request.get_json(silent=True) or {}
+    job = pdf_app.new_request_job('upload', data.get('job_id'))
+    if job is None:
+        return jsonify({"error": "Identificador de trabajo no válido"}), 400
+
+    render = pdf_app.page_render_options(data.get('render_width'),
+                                         request.accept_mimetypes)
+    body, status = await run_blocking(job, pdf_app.run_upload, job,
+                                      pdf_app.ingest_chunked_upload,
+                                      upload_id, render)
+    return jsonify(body), status
+
+
+@quart_app.route('/documents/<sha256>/attach', methods=['POST'])
+async def attach_document(sha256):
+    """Añade a la sesión un documento ya guardado, sin volver a subirlo."""
+    data = await request.get_json(silent=True) or {}
+    job = pdf_app.new_request_job('upload', data.get('job_id'))
+    if job is None:
+        return jsonify({"error": "Identificador de trabajo no válido"}), 400
+
+    render = pdf_app.page_render_options(data.get('render_width'),
+                                         request.accept_mimetypes)
+    body, status = await run_blocking(job, pdf_app.run_upload, job,
+                                      pdf_app.ingest_known_document,
+                                      sha256.lower(), render)
+    return jsonify(body), status
+
+
+async def _run_export(kind):
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return "Se esperaba un cuerpo JSON.", 400
+    job = pdf_app.new_request_job(kind, data.get('job_id'))
+    if job is None:
+        return "Identificador de trabajo no válido.", 400
+
+    try:
+        result = await run_blocking(job, pdf_app.run_export, kind, data, job)
+    except ExportError as e:
+        return str(e), e.status
+    return export_response(result)
+
+
+@quart_app.route('/download_final_pdf', methods=['POST'])
+async def download_final_pdf():
+    """Combina todas las páginas editadas en un solo PDF final."""
+    return await _run_export('final')
+
+
+@quart_app.route('/extract_pages', methods=['POST'])
+async def extract_pages():
+    """Extrae páginas específicas de los documentos cargados."""
+    return await _run_export('extract')
+
+
+@quart_app.route('/split_all_pages', methods=['POST'])
+async def split_all_pages():
+    """Divide cada página editada en un PDF individual y los comprime en un ZIP."""
+    return await _run_export('split')
+
+
+@quart_app.route('/mail_merge', methods=['POST'])
+async def mail_merge():
+    """Rellena la plantilla con cada fila y devuelve los PDF en un ZIP."""
+    return await _run_export('mail_merge')
+
+
+@quart_app.route('/jobs/<job_id>/events', methods=['GET'])
+async def job_events(job_id):
+    """Flujo Server-Sent Events con el progreso de un trabajo o una carga."""
+    # Una carga se registra cuando llega su cuerpo, que puede ser después de
+    # que el cliente abra este flujo
+    job = export_jobs.get(job_id)
+    for _ in range(int(30 / EVENT_POLL_INTERVAL)):
+        if job is not None:
+            break
+        await asyncio.sleep(EVENT_POLL_INTERVAL)
+        job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+
+    async def generate():
+        version = None
+        idle = 0
+        while True:
+            if job.version != version:
+                version = job.version
+                idle = 0
+                yield job_event(job)
+                if job.finished:
+                    break
+            elif idle >= EVENT_KEEP_ALIVE:
+                idle = 0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+            idle += EVENT_POLL_INTERVAL
+
+    return Response(generate(),
+                    mimetype='text/event-stream',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
+@quart_app.route('/jobs/<job_id>/result', methods=['GET'])
+async def get_job_result(job_id):
+    """Descarga el resultado de un trabajo terminado."""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    if job.status == 'error':
+        return job.error, job.error_status
+    if job.status != 'done':
+        return jsonify(job_status(job)), 409
+    if job.result is None:
+        return jsonify({"error": "El trabajo no tiene resultado"}), 404
+    return export_response(job.result, remove=False)
+
+
+wsgi_fallback = AsyncioWSGIMiddleware(pdf_app.app,
+                                      max_body_size=MAX_UPLOAD_BYTES)
+_async_routes = quart_app.url_map.bind('')
+
+
+def _is_async_route(scope):
+    try:
+        _async_routes.match(scope['path'], method=scope['method'])
+    except HTTPException:
+        return False
+    return True
+
+
+async def app(scope, receive, send):
+    """Aplicación ASGI: rutas asíncronas con Quart y el resto con Flask."""
+    if scope['type'] == 'http' and not _is_async_route(scope):
+        await wsgi_fallback(scope, receive, send)
+    else:
+        await quart_app(scope, receive, send)
+
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"0.0.0.0:{os.environ.get('PORT', 8080)}"]
+    asyncio.run(serve(app, config))
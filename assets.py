@@ -0,0 +1,114 @@
+"""Interfaz del editor como recursos estáticos cacheables.
+
+El editor está en static/: index.html (el armazón de la página),
+editor.css y editor.js. Al arrancar, cada recurso recibe un nombre con el
+hash de su contenido (editor.3f2a91c0.js), y se comprime una sola vez con
+gzip y, si está instalado el paquete brotli, con Brotli: al servirlo por
+primera vez o antes con compress(), para no alargar el arranque (ver
+main.py). Como el nombre cambia con el contenido, los recursos se sirven
+con caché inmutable de un año; solo el armazón, que enlaza los nombres con
+hash, se revalida en cada carga con su ETag. Una recarga de la página
+transfiere una respuesta 304 vacía y nada más.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'static')
+# Prefijo de las URL de los recursos con hash
+STATIC_URL = '/static/'
+# Fichero de static/ que se sirve como página principal
+SHELL_NAME = 'index.html'
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+class Asset:
+    """Un recurso con su cuerpo sin comprimir y sus versiones comprimidas."""
+
+    def __init__(self, name, data, mimetype):
+        self.name = name
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        self.bodies = {'identity': data}
+
+    def compress(self):
+        """Genera las versiones comprimidas que aún no existan."""
+        data = self.bodies['identity']
+        if 'gzip' not in self.bodies:
+            self.bodies['gzip'] = gzip.compress(data, 9, mtime=0)
+        if brotli is not None and 'br' not in self.bodies:
+            self.bodies['br'] = brotli.compress(data)
+
+    def body(self, accept_encodings):
+        """Devuelve (codificación, bytes) según `accept_encodings`.
+
+        `accept_encodings` es la cabecera Accept-Encoding ya analizada
+        (request.accept_encodings). Se prefiere Brotli, luego gzip, y solo
+        si comprimido ocupa menos.
+        """
+        self.compress()
+        for encoding in ('br', 'gzip'):
+            body = self.bodies.get(encoding)
+            if (body is not None and accept_encodings[encoding] > 0 and
+                    len(body) < len(self.bodies['identity'])):
+                return encoding, body
+        return 'identity', self.bodies['identity']
+
+
+class AssetBundle:
+    """Recursos de `directory`, por nombre con hash, y el armazón HTML.
+
+    Las referencias del armazón a los recursos (href="editor.css",
+    src="editor.js") se reescriben a sus URL con hash.
+    """
+
+    def __init__(self, directory=STATIC_DIR):
+        self._assets = {}  # nombre con hash -> Asset
+        self.urls = {}  # nombre original -> URL con hash
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name == SHELL_NAME or not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as asset_file:
+                asset = Asset(name, asset_file.read(), _mimetype(name))
+            stem, extension = os.path.splitext(name)
+            hashed_name = f"{stem}.{asset.digest}{extension}"
+            self._assets[hashed_name] = asset
+            self.urls[name] = STATIC_URL + hashed_name
+
+        with open(os.path.join(directory, SHELL_NAME), encoding='utf-8') as shell_file:
+            shell = shell_file.read()
+        shell = re.sub(r'\b(href|src)="([^"/:]+)"', self._link, shell)
+        self.shell = Asset(SHELL_NAME, shell.encode('utf-8'),
+                           'text/html; charset=utf-8')
+
+    def _link(self, match):
+        attribute, name = match.groups()
+        return f'{attribute}="{self.urls.get(name, name)}"'
+
+    def get(self, hashed_name):
+        """Recurso con ese nombre con hash, o None si no existe."""
+        return self._assets.get(hashed_name)
+
+    def compress(self):
+        """Comprime de antemano el armazón y todos los recursos."""
+        self.shell.compress()
+        for asset in self._assets.values():
+            asset.compress()
+
+
+def _mimetype(name):
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if mimetype.startswith('text/') or mimetype.endswith('javascript'):
+        mimetype += '; charset=utf-8'
+    return mimetype
@@ -0,0 +1,68 @@
+"""Compara el tiempo de codificación y el tamaño de las páginas por formato.
+
+Rasteriza cada página de los PDFs indicados como lo hace el servidor para el
+editor (mismo ancho, sin alfa, escala de grises si no hay color) y la
+codifica en cada formato disponible y con la elección automática de
+editing.encode_pixmap. Las páginas se separan en fotos y texto/dibujo según
+editing.is_photo.
+
+    python benchmarks/encode_formats.py corpus/*.pdf --width 1200 --quality 80
+"""
+import argparse
+import collections
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF  # noqa: E402
+
+import editing  # noqa: E402
+
+AUTO = 'auto'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('pdfs', nargs='+', help='PDFs del corpus')
+    parser.add_argument('--width', type=int, default=1200,
+                        help='ancho en píxeles de las páginas (1200)')
+    parser.add_argument('--quality', type=int, default=80,
+                        help='calidad de JPEG y WebP (80)')
+    args = parser.parse_args()
+
+    formats = [(fmt, (fmt,)) for fmt in editing.IMAGE_FORMATS]
+    formats.append((AUTO, editing.IMAGE_FORMATS))
+    # (formato, tipo de página) -> [páginas, bytes, segundos]
+    totals = collections.defaultdict(lambda: [0, 0, 0.0])
+
+    for path in args.pdfs:
+        with fitz.open(path) as pdf_document:
+            for page in pdf_document:
+                pix = editing.render_pixmap(pdf_document, page.number,
+                                            args.width / page.rect.width)
+                kind = 'foto' if editing.is_photo(pix) else 'texto'
+                for name, allowed in formats:
+                    start = time.perf_counter()
+                    data = editing.encode_pixmap(pix, allowed, args.quality)
+                    elapsed = time.perf_counter() - start
+                    for key in ((name, kind), (name, 'total')):
+                        totals[key][0] += 1
+                        totals[key][1] += len(data)
+                        totals[key][2] += elapsed
+            editing.forget_document(pdf_document)
+
+    print(f"{'formato':8} {'páginas':>8} {'tipo':>6} {'KB/página':>10} "
+          f"{'ms/página':>10} {'total MB':>9}")
+    for name, _ in formats:
+        for kind in ('foto', 'texto', 'total'):
+            pages, size, seconds = totals.get((name, kind), (0, 0, 0.0))
+            if not pages:
+                continue
+            print(f"{name:8} {pages:8d} {kind:>6} {size / pages / 1024:10.1f} "
+                  f"{seconds / pages * 1000:10.1f} {size / 1024 / 1024:9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Mide el arranque en frío del servidor hasta la primera respuesta.
+
+Arranca el servidor (main.py por defecto) en un puerto libre y mide, desde
+que se lanza el proceso, cuánto tarda en aceptar conexiones y en responder
+a GET /. Con --pdf mide además la primera carga de un PDF, que es la que
+necesita MuPDF y un worker. Repite el arranque --runs veces y muestra la
+mediana de cada fase.
+
+    python benchmarks/startup.py --runs 5 --pdf corpus/ejemplo.pdf
+"""
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Tiempo máximo de espera por cada fase, en segundos
+TIMEOUT = 60
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_for_port(port, deadline):
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.005)
+    raise TimeoutError('el servidor no abrió el puerto')
+
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port,
+                                            timeout=TIMEOUT)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f'{method} {path}: {response.status}')
+    finally:
+        connection.close()
+
+
+def upload(port, pdf_path):
+    boundary = uuid.uuid4().hex
+    with open(pdf_path, 'rb') as pdf_file:
+        data = pdf_file.read()
+    body = b''.join([
+        f'--{boundary}\r\n'.encode(),
+        (f'Content-Disposition: form-data; name="pdf_files"; '
+         f'filename="{os.path.basename(pdf_path)}"\r\n').encode(),
+        b'Content-Type: application/pdf\r\n\r\n', data,
+        f'\r\n--{boundary}--\r\n'.encode()
+    ])
+    request(port, 'POST', '/upload', body,
+            {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+
+def run_once(script, pdf_path):
+    """Arranca el servidor una vez y devuelve {fase: segundos}."""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port))
+    env.pop('FLASK_DEBUG', None)
+    start = time.monotonic()
+    deadline = start + TIMEOUT
+    server = subprocess.Popen([sys.executable, script], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        timings = {}
+        wait_for_port(port, deadline)
+        timings['puerto'] = time.monotonic() - start
+        request(port, 'GET', '/')
+        timings['GET /'] = time.monotonic() - start
+        if pdf_path:
+            upload(port, pdf_path)
+            timings['carga PDF'] = time.monotonic() - start
+        return timings
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--script', default='main.py',
+                        help='servidor que se arranca (main.py)')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='arranques que se miden (5)')
+    parser.add_argument('--pdf', help='PDF para medir la primera carga')
+    args = parser.parse_args()
+
+    runs = []
+    for number in range(1, args.runs + 1):
+        timings = run_once(args.script, args.pdf)
+        runs.append(timings)
+        print(f"arranque {number}: " +
+              ', '.join(f"{phase} {seconds * 1000:.0f} ms"
+                        for phase, seconds in timings.items()))
+
+    print(f"{'fase':10} {'mediana ms':>11} {'mín ms':>8} {'máx ms':>8}")
+    for phase in runs[0]:
+        values = [timings[phase] * 1000 for timings in runs]
+        print(f"{phase:10} {statistics.median(values):11.0f} "
+              f"{min(values):8.0f} {max(values):8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+"""Documentos subidos, compartidos con los workers sin copias.
+
+Las subidas se vuelcan por bloques a ficheros de un directorio de spool y los
+workers las abren desde la ruta: MuPDF lee del disco lo que necesita y el
+servidor nunca tiene el PDF completo en memoria. Los documentos que ya están
+en memoria (p. ej. generados por el propio servidor) se copian una sola vez a
+un segmento de memoria compartida (multiprocessing.shared_memory), que los
+workers adjuntan por nombre y MuPDF lee directamente. En ambos casos a los
+workers solo se les envía un handle, así que repartir un documento de cientos
+de MB entre todos ellos no cuesta ninguna copia ni serialización.
+
+La vida de los documentos se gestiona con un contador de referencias: el
+almacén tiene una mientras el documento forma parte de la sesión y cada
+operación en curso otra (ver lease()). El fichero o el segmento se libera
+cuando el documento se descarta y la última operación que lo usaba termina.
+Un worker que aún lo tenga abierto conserva los datos hasta que lo expulsa de
+su caché, como ocurre con cualquier fichero borrado que sigue abierto.
+
+El almacenamiento es direccionado por contenido: cada documento se guarda
+una sola vez por su SHA-256 y los doc_id son alias de ese contenido, así que
+subir (o adjuntar con attach()) un documento que el servidor ya tiene no
+ocupa más espacio.
+
+El directorio de spool también guarda los resultados de las exportaciones,
+que se sirven desde disco (ver temp_path()).
+"""
+import atexit
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from multiprocessing import shared_memory
+
+import metrics
+
+# Tamaño de los bloques al volcar una subida al spool
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+metrics.describe('pdf_shared_memory_bytes',
+                 'Bytes de documentos en segmentos de memoria compartida',
+                 kind='gauge')
+metrics.describe('pdf_spooled_bytes',
+                 'Bytes de documentos subidos en el directorio de spool',
+                 kind='gauge')
+
+
+class _Document:
+
+    def __init__(self, handle, sha256, shm=None, owned=True):
+        self.handle = handle  # ('file', ruta, tamaño) | ('shm', nombre, tamaño)
+        self.sha256 = sha256
+        self.shm = shm
+        self.owned = owned  # el fichero es del almacén y se borra al liberarlo
+        self.refs = 1  # alias (doc_id) y operaciones en curso
+
+    @property
+    def size(self):
+        return self.handle[2]
+
+
+class DocumentStore:
+    """Documentos por doc_id, en ficheros del spool o en memoria compartida.
+
+    `spool_dir` es el directorio para las subidas y los resultados; si no se
+    indica se crea uno temporal que se borra al salir.
+    """
+
+    def __init__(self, spool_dir=None):
+        self._owns_spool_dir = spool_dir is None
+        if spool_dir is None:
+            spool_dir = tempfile.mkdtemp(prefix='pdf-spool-')
+        os.makedirs(spool_dir, exist_ok=True)
+        self.spool_dir = spool_dir
+        self._documents = {}  # doc_id -> _Document
+        self._blobs = {}  # sha256 -> _Document
+        self._lock = threading.Lock()
+        # Los segmentos sobreviven al proceso si no se liberan
+        atexit.register(self.close)
+
+    def put(self, doc_id, data):
+        """Copia `data` (los bytes del PDF) a un segmento nuevo, si no existe ya.
+
+        Devuelve el SHA-256 del documento.
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        if self.attach(doc_id, sha256):
+            return sha256
+        # Un segmento no puede estar vacío; MuPDF rechazará el documento
+        shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        shm.buf[:len(data)] = data
+        metrics.inc('pdf_shared_memory_bytes', len(data))
+        duplicate = self._add(
+            doc_id, _Document(('shm', shm.name, len(data)), sha256, shm=shm))
+        if duplicate is not None:
+            # Otro hilo guardó el mismo contenido mientras se copiaba
+            self._free(duplicate)
+        return sha256
+
+    def spool(self, doc_id, stream):
+        """Vuelca por bloques el fichero `stream` al spool y lo registra.
+
+        Devuelve el SHA-256 del documento; en memoria solo hay un bloque cada
+        vez y el hash se calcula mientras se copia.
+        """
+        path = self.temp_path('.pdf')
+        digest = hashlib.sha256()
+        try:
+            with open(path, 'wb') as spool_file:
+                for block in iter(lambda: stream.read(SPOOL_CHUNK_SIZE), b''):
+                    digest.update(block)
+                    spool_file.write(block)
+        except BaseException:
+            os.remove(path)
+            raise
+        return self.add_file(doc_id, path, digest.hexdigest())
+
+    def add_file(self, doc_id, path, sha256=None):
+        """Registra un fichero ya escrito en el spool, que pasa a ser del almacén.
+
+        El fichero se renombra según su SHA-256 (que se calcula si no se
+        indica) o se borra si ese contenido ya estaba guardado. Devuelve el
+        SHA-256.
+        """
+        if sha256 is None:
+            sha256 = file_sha256(path)
+        # Todo dentro del lock: dos subidas iguales comparten la ruta final
+        with self._lock:
+            document = self._blobs.get(sha256)
+            if document is None:
+                blob_path = os.path.join(self.spool_dir, f"{sha256}.pdf")
+                os.replace(path, blob_path)
+                document = _Document(
+                    ('file', blob_path, os.path.getsize(blob_path)), sha256)
+                self._blobs[sha256] = document
+                metrics.inc('pdf_spooled_bytes', document.size)
+            else:
+                document.refs += 1
+                os.remove(path)
+            previous = self._set_alias(doc_id, document)
+        if previous is not None:
+            self._release(previous)
+        return sha256
+
+    def add_path(self, doc_id, path, sha256=None):
+        """Registra un fichero local sin copiarlo ni hacerse cargo de él.
+
+        Los workers lo leen de su ruta y el almacén nunca lo borra (ver
+        pdfedit.py). El SHA-256 se calcula si no se indica; si ese contenido
+        ya estaba guardado se usa el existente. Devuelve el SHA-256.
+        """
+        path = os.path.abspath(path)
+        if sha256 is None:
+            sha256 = file_sha256(path)
+        document = _Document(('file', path, os.path.getsize(path)), sha256,
+                             owned=False)
+        self._add(doc_id, document)
+        return sha256
+
+    def attach(self, doc_id, sha256):
+        """Registra `doc_id` como alias de un contenido ya guardado.
+
+        Devuelve False si el almacén no tiene ese contenido.
+        """
+        with self._lock:
+            document = self._blobs.get(sha256)
+            if document is None:
+                return False
+            document.refs += 1
+            previous = self._set_alias(doc_id, document)
+        if previous is not None:
+            self._release(previous)
+        return True
+
+    def find(self, sha256):
+        """Tamaño en bytes del contenido con ese SHA-256, o None si no existe."""
+        with self._lock:
+            document = self._blobs.get(sha256)
+            return document.size if document is not None else None
+
+    def sha256(self, doc_id):
+        """SHA-256 del contenido de `doc_id`, o None si no existe."""
+        with self._lock:
+            document = self._documents.get(doc_id)
+            return document.sha256 if document is not None else None
+
+    def temp_path(self, suffix=''):
+        """Crea un fichero vacío en el spool y devuelve su ruta.
+
+        Quien lo crea es responsable de borrarlo.
+        """
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.spool_dir)
+        os.close(fd)
+        return path
+
+    def _add(self, doc_id, document):
+        """Registra `document` como doc_id.
+
+        Si su contenido ya estaba guardado se usa el existente y se devuelve
+        `document`, que sobra; si no, devuelve None.
+        """
+        duplicate = None
+        with self._lock:
+            existing = self._blobs.get(document.sha256)
+            if existing is not None:
+                existing.refs += 1
+                duplicate, document = document, existing
+            else:
+                self._blobs[document.sha256] = document
+            previous = self._set_alias(doc_id, document)
+        if previous is not None:
+            self._release(previous)
+        return duplicate
+
+    def _set_alias(self, doc_id, document):
+        # Se llama con el lock tomado; devuelve el documento que tenía doc_id
+        previous = self._documents.pop(doc_id, None)
+        self._documents[doc_id] = document
+        return previous
+
+    def __contains__(self, doc_id):
+        with self._lock:
+            return doc_id in self._documents
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documents)
+
+    @contextlib.contextmanager
+    def lease(self, *doc_ids):
+        """Reserva los documentos mientras se usan y genera {doc_id: handle}.
+
+        Un handle es lo que se envía a los workers (ver open_document); solo
+        es válido dentro del bloque. Los documentos que no existen no
+        aparecen en el diccionario.
+        """
+        handles = {}
+        leased = []
+        with self._lock:
+            for doc_id in dict.fromkeys(doc_ids):
+                document = self._documents.get(doc_id)
+                if document is not None:
+                    document.refs += 1
+                    leased.append(document)
+                    handles[doc_id] = document.handle
+        try:
+            yield handles
+        finally:
+            for document in leased:
+                self._release(document)
+
+    def copy_to(self, doc_id, path):
+        """Copia los bytes del documento al fichero `path`."""
+        with self._lock:
+            document = self._documents[doc_id]
+            document.refs += 1
+        try:
+            kind, location, size = document.handle
+            if kind == 'file':
+                shutil.copyfile(location, path)
+            else:
+                with open(path, 'wb') as output:
+                    output.write(document.shm.buf[:size])
+        finally:
+            self._release(document)
+
+    def discard(self, doc_id):
+        """Retira el documento; sus datos se liberan al terminar de usarse."""
+        with self._lock:
+            document = self._documents.pop(doc_id, None)
+        if document is not None:
+            self._release(document)
+
+    def close(self):
+        """Descarta todos los documentos."""
+        with self._lock:
+            doc_ids = list(self._documents)
+        for doc_id in doc_ids:
+            self.discard(doc_id)
+        if self._owns_spool_dir:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def _release(self, document):
+        with self._lock:
+            document.refs -= 1
+            if document.refs:
+                return
+            del self._blobs[document.sha256]
+            # Borrar dentro del lock: una subida igual podría reutilizar la ruta
+            if document.shm is None and document.owned:
+                os.remove(document.handle[1])
+        if document.shm is not None:
+            self._free(document)
+        elif document.owned:
+            metrics.inc('pdf_spooled_bytes', -document.size)
+
+    def _free(self, document):
+        """Libera un segmento de memoria compartida que ya no se usa."""
+        document.shm.close()
+        document.shm.unlink()
+        metrics.inc('pdf_shared_memory_bytes', -document.size)
+
+
+def file_sha256(path):
+    """SHA-256 en hexadecimal del fichero `path`, leído por bloques."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(SPOOL_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def open_document(handle):
+    """Abre en un worker el documento de `handle`.
+
+    Devuelve (documento de MuPDF, función que lo cierra y libera sus datos).
+    """
+    import fitz  # PyMuPDF
+
+    kind, location, size = handle
+    if kind == 'file':
+        doc = fitz.open(location, filetype="pdf")
+        return doc, doc.close
+
+    shm = shared_memory.SharedMemory(name=location)
+    view = shm.buf[:size]
+    try:
+        doc = fitz.open(stream=view, filetype="pdf")
+    except Exception:
+        view.release()
+        shm.close()
+        raise
+
+    def close():
+        doc.close()
+        # MuPDF ya no lee de la vista; sin exportaciones el segmento se cierra
+        view.release()
+        shm.close()
+
+    return doc, close
@@ -0,0 +1,463 @@
+"""Operaciones de MuPDF sobre páginas: dibujar ediciones, exportar y rasterizar."""
+import base64
+import collections
+import functools
+import re
+import shutil
+
+import fitz  # PyMuPDF
+
+try:
+    # Opcional: solo hace falta para codificar en WebP
+    import PIL.features
+except ImportError:
+    PIL = None
+
+# Lado máximo, en píxeles, de la imagen de aviso de una página no renderizable
+PLACEHOLDER_MAX_PIXELS = 1600
+
+# Formatos de imagen de las páginas rasterizadas y su tipo MIME
+IMAGE_MIMETYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+}
+# Formatos que se pueden codificar: WebP requiere Pillow
+IMAGE_FORMATS = tuple(
+    fmt for fmt in IMAGE_MIMETYPES
+    if fmt != 'webp' or (PIL is not None and PIL.features.check('webp')))
+# Colores distintos (en una copia reducida de ~64K píxeles o más) a partir de
+# los cuales se considera una foto o un escaneo en color: el texto y los
+# dibujos vectoriales, incluso con suavizado, tienen unos cientos
+PHOTO_MIN_COLORS = 4096
+
+# Campo de una plantilla en los textos de las ediciones: {{nombre}}
+PLACEHOLDER = re.compile(r'\{\{\s*([^{}]+?)\s*\}\}')
+
+# Memoria estimada, en bytes, de las DisplayList que conserva cada proceso
+DISPLAY_LIST_CACHE_BYTES = 256 * 1024 * 1024
+
+# (id del documento, página) -> (DisplayList, tamaño estimado)
+_display_lists = collections.OrderedDict()
+_display_lists_size = 0
+
+
+def _hex_to_rgb(color_hex):
+    """Convierte un color '#rrggbb' del cliente a una tupla RGB normalizada."""
+    return tuple(int(color_hex[i:i + 2], 16) / 255.0 for i in (1, 3, 5))
+
+
+def draw_elements(page, edits):
+    """Dibuja los elementos del cliente (texto, formas, imágenes) sobre una página."""
+    # Escalar coordenadas del cliente a las del PDF
+    page_rect = page.rect
+    page_width, page_height = page_rect.width, page_rect.height
+
+    # El cliente trabaja con un ancho fijo de 800px, necesitamos el ratio
+    scale_factor = page_width / 800
+
+    for element in edits:
+        x, y = element['x'] * scale_factor, element['y'] * scale_factor
+        width, height = element['width'] * scale_factor, element[
+            'height'] * scale_factor
+
+        if element['type'] == 'text':
+            font_size = element['fontSize'] * scale_factor
+            text = element['text']
+            color_rgb = _hex_to_rgb(element['fontColor'])
+
+            # Ajustar el punto de inserción para que no se "corte" el texto
+            page.insert_textbox(
+                fitz.Rect(x, y, x + width, y +
+                          height),  # El ancho y alto son estimados en el cliente
+                text,
+                fontname="helv",  # Usar una fuente estándar
+                fontsize=font_size,
+                color=color_rgb)
+
+        elif element['type'] == 'image':
+            page.insert_image(fitz.Rect(x, y, x + width, y + height),
+                              stream=_image_data(element['src']))
+
+        elif element['type'] == 'rect':
+            page.draw_rect(fitz.Rect(x, y, x + width, y + height),
+                           fill=_hex_to_rgb(element['fillColor']),
+                           color=_hex_to_rgb(element['borderColor']),
+                           width=1)
+
+        elif element['type'] == 'circle':
+            page.draw_oval(fitz.Rect(x, y, x + width, y + height),
+                           fill=_hex_to_rgb(element['fillColor']),
+                           color=_hex_to_rgb(element['borderColor']),
+                           width=1)
+
+
+@functools.lru_cache(maxsize=32)
+def _image_data(src):
+    """Bytes de una imagen 'data:...;base64,...' del cliente.
+
+    Una misma imagen (el logotipo de una plantilla) se decodifica una sola
+    vez aunque se dibuje en miles de documentos.
+    """
+    return base64.b64decode(src.split(',')[1])
+
+
+def placeholder_fields(edits):
+    """Campos {{campo}} de los textos e imágenes de `edits`."""
+    return {
+        field for element in edits for key in ('text', 'src')
+        if isinstance(element.get(key), str)
+        for field in PLACEHOLDER.findall(element[key])
+    }
+
+
+def fill_placeholders(edits, values):
+    """Copia de `edits` con cada {{campo}} sustituido por values[campo].
+
+    Una imagen cuyo `src` es solo un campo toma como imagen el valor de la
+    fila (una URL data: en base64).
+    """
+    filled = []
+    for element in edits:
+        element = dict(element)
+        for key in ('text', 'src'):
+            if isinstance(element.get(key), str):
+                element[key] = PLACEHOLDER.sub(
+                    lambda match: values.get(match.group(1), ''),
+                    element[key])
+        filled.append(element)
+    return filled
+
+
+def fill_template(pdf_document, pages, rows):
+    """Genera un PDF por fila dibujando sobre la plantilla los valores de la fila.
+
+    `pdf_document` es la plantilla, ya abierta (el worker la conserva entre
+    tramos de filas); `pages` es [(page_num, edits), ...] con las ediciones de
+    cada página, que pueden tener campos {{campo}}, y `rows` es
+    [{campo: valor}, ...]. Devuelve los bytes de cada PDF, en orden.
+    """
+    outputs = []
+    for values in rows:
+        output_doc = fitz.open()
+        try:
+            output_doc.insert_pdf(pdf_document)
+            for page_num, edits in pages:
+                draw_elements(output_doc.load_page(page_num),
+                              fill_placeholders(edits, values))
+            # Comprimido aquí, en paralelo, y no al guardarlo en el ZIP
+            outputs.append(output_doc.tobytes(deflate=True))
+        finally:
+            output_doc.close()
+    return outputs
+
+
+def page_sizes(pdf_document):
+    """Tamaño (ancho, alto) de cada página del documento."""
+    return [(page.rect.width, page.rect.height) for page in pdf_document]
+
+
+def page_words(pdf_document, page_nums):
+    """Palabras de las páginas `page_nums`, por bloques y líneas de texto.
+
+    Devuelve, por página, [(x0, y0, x1, y1, palabra), ...] con el rectángulo
+    de cada palabra en puntos, en la página tal como se muestra (girada si
+    tiene rotación; ver search.py).
+    """
+    pages = []
+    for page_num in page_nums:
+        page = pdf_document[page_num]
+        words = []
+        for x0, y0, x1, y1, word, *_ in page.get_text('words'):
+            rect = fitz.Rect(x0, y0, x1, y1) * page.rotation_matrix
+            words.append((round(rect.x0, 1), round(rect.y0, 1),
+                          round(rect.x1, 1), round(rect.y1, 1), word))
+        pages.append(words)
+    return pages
+
+
+def redact_page(page, rects):
+    """Tacha los rectángulos `rects` [(x0, y0, x1, y1), ...] de la página.
+
+    Los rectángulos están en puntos de la página tal como se muestra (como
+    los de page_words). El texto, los dibujos y los píxeles de las imágenes
+    que cubren se eliminan del contenido, no solo se tapan con negro.
+    """
+    for rect in rects:
+        page.add_redact_annot(fitz.Rect(rect) * page.derotation_matrix,
+                              fill=(0, 0, 0))
+    page.apply_redactions()
+
+
+def export_pages(pdf_document, pages, redactions=None):
+    """Copia las páginas [(page_num, edits), ...] a un PDF nuevo con sus ediciones.
+
+    Las ediciones se dibujan sobre la copia, así el documento de origen no se
+    modifica y puede seguir abierto para otras páginas. `redactions` es
+    {page_num: rectángulos} con lo que hay que tachar en cada página (ver
+    redact_page); se tacha antes de dibujar las ediciones.
+    """
+    redactions = redactions or {}
+    output_doc = fitz.open()
+    try:
+        for page_num, edits in pages:
+            output_doc.insert_pdf(pdf_document,
+                                  from_page=page_num,
+                                  to_page=page_num)
+            if redactions.get(page_num):
+                redact_page(output_doc.load_page(-1), redactions[page_num])
+            if edits:
+                draw_elements(output_doc.load_page(-1), edits)
+        # Sin el contenido anterior al tachado, que quedaría sin referencias
+        return output_doc.tobytes(garbage=3 if redactions else 0)
+    finally:
+        output_doc.close()
+
+
+def incremental_update(pdf_document, edited_pages, output_path):
+    """Añade las ediciones [(page_num, edits), ...] como actualización incremental.
+
+    MuPDF solo guarda de forma incremental sobre el fichero del que leyó, así
+    que se trabaja sobre una copia del original en `output_path` y
+    `pdf_document` no se modifica. Devuelve `output_path`, o None si el
+    documento no admite guardado incremental (p. ej. si MuPDF tuvo que
+    repararlo al abrirlo).
+    """
+    if pdf_document.stream is not None:
+        with open(output_path, 'wb') as output_file:
+            output_file.write(pdf_document.stream)
+    else:
+        shutil.copyfile(pdf_document.name, output_path)
+
+    target_doc = fitz.open(output_path)
+    try:
+        if target_doc.needs_pass or not target_doc.can_save_incrementally():
+            return None
+        for page_num, edits in edited_pages:
+            draw_elements(target_doc.load_page(page_num), edits)
+        target_doc.saveIncr()
+    finally:
+        target_doc.close()
+    return output_path
+
+
+def merge_pdfs(parts, output_path=None, deflate=False):
+    """Une en un solo PDF los PDFs generados por export_pages (o avisos).
+
+    Devuelve los bytes del resultado, o lo guarda en `output_path` si se
+    indica. Con `deflate` se comprimen los flujos que no lo estén.
+    """
+    merged_doc = fitz.open()
+    try:
+        for part in parts:
+            part_doc = fitz.open(stream=part, filetype="pdf")
+            merged_doc.insert_pdf(part_doc)
+            part_doc.close()
+        if output_path is not None:
+            merged_doc.save(output_path, deflate=deflate)
+            return output_path
+        return merged_doc.tobytes(deflate=deflate)
+    finally:
+        merged_doc.close()
+
+
+def _display_list_size(page):
+    """Estimación de la memoria de la DisplayList de una página.
+
+    MuPDF no informa de ella: se aproxima con el tamaño de su contenido y de
+    sus imágenes decodificadas, que es lo que domina en las páginas pesadas.
+    """
+    size = len(page.read_contents())
+    for image in page.get_images(full=True):
+        width, height, bits = image[2], image[3], image[4]
+        size += width * height * max(bits, 8) // 8 * 4
+    return size
+
+
+def display_list(pdf_document, page_num):
+    """DisplayList de una página, interpretada una sola vez por documento abierto.
+
+    Rasterizar a otra escala o un recorte de la página solo reproduce la
+    lista, sin volver a interpretar su contenido, lo que en las páginas
+    vectoriales pesadas cuesta más que rasterizar. Las listas usadas hace más
+    tiempo se descartan al superar DISPLAY_LIST_CACHE_BYTES; quien cierra el
+    documento debe llamar antes a forget_document.
+    """
+    global _display_lists_size
+
+    key = (id(pdf_document), page_num)
+    cached = _display_lists.get(key)
+    if cached is not None:
+        _display_lists.move_to_end(key)
+        return cached[0]
+
+    page = pdf_document.load_page(page_num)
+    page_display_list = page.get_displaylist()
+    size = _display_list_size(page)
+    if size <= DISPLAY_LIST_CACHE_BYTES:
+        _display_lists[key] = (page_display_list, size)
+        _display_lists_size += size
+        while _display_lists_size > DISPLAY_LIST_CACHE_BYTES:
+            _display_lists_size -= _display_lists.popitem(last=False)[1][1]
+    return page_display_list
+
+
+def forget_document(pdf_document):
+    """Descarta las DisplayList de un documento que se va a cerrar."""
+    global _display_lists_size
+
+    document_id = id(pdf_document)
+    for key in [key for key in _display_lists if key[0] == document_id]:
+        _display_lists_size -= _display_lists.pop(key)[1]
+
+
+def clear_display_lists():
+    """Descarta todas las DisplayList (p. ej. al quedarse sin memoria)."""
+    global _display_lists_size
+
+    _display_lists.clear()
+    _display_lists_size = 0
+
+
+def _is_gray(pix):
+    """Indica si un pixmap RGB no tiene color (R = G = B en todos los píxeles)."""
+    samples = pix.samples_mv
+    red = samples[0::3]
+    return red == samples[1::3] and red == samples[2::3]
+
+
+def is_photo(pix):
+    """Indica si un pixmap parece una foto (muchos colores) y no texto o dibujo."""
+    # Contar sobre una copia reducida, pero sin bajar de ~64K píxeles (una
+    # tesela se cuenta entera)
+    shrink = 0
+    while shrink < 3 and pix.width * pix.height >> (2 * shrink + 2) >= 65536:
+        shrink += 1
+    small = fitz.Pixmap(pix)
+    if shrink:
+        small.shrink(shrink)
+    return small.color_count() >= PHOTO_MIN_COLORS
+
+
+def encode_pixmap(pix, formats=('png',), quality=80):
+    """Codifica un pixmap en el mejor de los formatos `formats`.
+
+    Las fotos y escaneos en color, donde PNG ocupa de 5 a 10 veces más, se
+    codifican con pérdida (WebP, o JPEG) con la calidad `quality`; el texto
+    y los dibujos, donde la pérdida se nota en los bordes, en PNG. Con un
+    solo formato se usa ese. Los formatos que no se pueden codificar aquí
+    (ver IMAGE_FORMATS) se ignoran.
+    """
+    formats = [fmt for fmt in formats if fmt in IMAGE_FORMATS] or ['png']
+    lossy = [fmt for fmt in ('webp', 'jpeg') if fmt in formats]
+    if 'png' in formats and (not lossy or not is_photo(pix)):
+        fmt = 'png'
+    else:
+        fmt = lossy[0]
+
+    if fmt == 'webp':
+        return pix.pil_tobytes(format='WEBP', quality=quality)
+    if fmt == 'jpeg':
+        return pix.tobytes('jpeg', jpg_quality=quality)
+    return pix.tobytes('png')
+
+
+def image_mimetype(data):
+    """Tipo MIME de una imagen codificada por encode_pixmap, por su cabecera."""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return IMAGE_MIMETYPES['webp']
+    if data[:2] == b'\xff\xd8':
+        return IMAGE_MIMETYPES['jpeg']
+    return IMAGE_MIMETYPES['png']
+
+
+def render_pixmap(pdf_document, page_num, zoom=2, clip=None):
+    """Rasteriza una página (o el recorte `clip`, en puntos) a un pixmap.
+
+    El pixmap no tiene canal alfa, y las páginas sin color (escaneos en
+    blanco y negro, texto) quedan en escala de grises, que ocupa un tercio.
+    """
+    pix = display_list(pdf_document, page_num).get_pixmap(
+        matrix=fitz.Matrix(zoom, zoom),
+        alpha=False,
+        clip=fitz.Rect(clip) if clip is not None else None)
+    if _is_gray(pix):
+        pix = fitz.Pixmap(fitz.csGRAY, pix)
+    return pix
+
+
+def render_page(pdf_document,
+                page_num,
+                zoom=2,
+                clip=None,
+                formats=('png',),
+                quality=80):
+    """Rasteriza una página para mostrarla en el editor.
+
+    Con `clip` (x0, y0, x1, y1, en puntos) solo se rasteriza ese recorte. El
+    formato se elige entre `formats` según el contenido (ver encode_pixmap).
+    """
+    return encode_pixmap(render_pixmap(pdf_document, page_num, zoom, clip),
+                         formats, quality)
+
+
+def render_sprite(pdf_document,
+                  width,
+                  height,
+                  placements,
+                  formats=('png',),
+                  quality=80):
+    """Rasteriza varias páginas en una sola imagen de `width` x `height` píxeles.
+
+    `placements` es [(página, x, y, ancho, alto), ...] (ver
+    thumbnails.sprite_layout). Cada página se escala a su hueco; una página
+    que no se puede rasterizar queda en blanco.
+    """
+    sheet = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, height), False)
+    sheet.clear_with(255)
+    for page_num, x, y, page_width, page_height in placements:
+        try:
+            page_list = display_list(pdf_document, page_num)
+        except (fitz.mupdf.FzErrorFormat, fitz.mupdf.FzErrorSyntax):
+            # Página dañada: el resto de la hoja sigue siendo útil
+            continue
+        rect = page_list.rect
+        pix = page_list.get_pixmap(matrix=fitz.Matrix(
+            page_width / rect.width, page_height / rect.height),
+                                   alpha=False)
+        pix.set_origin(x, y)
+        sheet.copy(pix, pix.irect)
+    if _is_gray(sheet):
+        sheet = fitz.Pixmap(fitz.csGRAY, sheet)
+    return encode_pixmap(sheet, formats, quality)
+
+
+def placeholder_page(width, height, message):
+    """PDF de una página del tamaño indicado que solo contiene un aviso."""
+    placeholder_doc = fitz.open()
+    try:
+        page = placeholder_doc.new_page(width=width, height=height)
+        page.insert_textbox(fitz.Rect(36, 36, width - 36, height - 36),
+                            message,
+                            fontname="helv",
+                            fontsize=max(8, min(width, height) / 30),
+                            color=(0.4, 0.4, 0.4),
+                            align=fitz.TEXT_ALIGN_CENTER)
+        return placeholder_doc.tobytes()
+    finally:
+        placeholder_doc.close()
+
+
+def placeholder_png(width, height, message, zoom=2):
+    """Imagen que sustituye a una página que no se pudo rasterizar."""
+    # Las páginas que superan los límites suelen ser enormes: acotar el aviso
+    zoom = min(zoom, PLACEHOLDER_MAX_PIXELS / max(width, height))
+    placeholder_doc = fitz.open(stream=placeholder_page(width, height, message),
+                                filetype="pdf")
+    try:
+        # Sin pasar por la caché de DisplayList: el documento es temporal
+        pix = placeholder_doc.load_page(0).get_pixmap(
+            matrix=fitz.Matrix(zoom, zoom))
+        return pix.tobytes("png")
+    finally:
+        placeholder_doc.close()
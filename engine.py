@@ -0,0 +1,151 @@
+"""Montaje y exportación de páginas en los workers, sin depender de Flask.
+
+Las exportaciones del servidor (app.py) y la API de Python (pdfedit.py)
+usan este motor: las páginas de los documentos de un DocumentStore se
+agrupan en tramos que se exportan en paralelo en un WorkerPool, con las
+ediciones del editor (ver editing.draw_elements) y los tachados de cada
+página. Las páginas que superan los límites de los workers se sustituyen por
+un aviso del mismo tamaño.
+"""
+import contextlib
+
+from workers import PageLimitExceeded, WorkerError
+
+# Páginas consecutivas de un mismo documento que se exportan en una sola
+# operación de worker
+EXPORT_RUN_PAGES = 8
+
+PLACEHOLDER_MESSAGE = ("Esta página no se pudo procesar: superó los límites "
+                       "de procesamiento o está dañada.")
+
+
+def _run_redactions(doc_id, pages, redactions):
+    """Rectángulos a tachar {page_num: rectángulos} de las páginas de un tramo."""
+    return {page_num: redactions[doc_id, page_num]
+            for page_num, _ in pages if (doc_id, page_num) in redactions}
+
+
+class Engine:
+    """Exporta páginas de los documentos de `store` con los workers de `pool`.
+
+    `page_sizes` es {doc_id: [(ancho, alto), ...]} con los documentos ya
+    abiertos (ver open()); app.py le pasa el suyo, que también rellena al
+    cargar los documentos.
+    """
+
+    def __init__(self, store, pool, page_sizes=None):
+        self.store = store
+        self.pool = pool
+        self.page_sizes = {} if page_sizes is None else page_sizes
+
+    def open(self, doc_id):
+        """Abre el documento en un worker y devuelve el tamaño de sus páginas.
+
+        Lanza KeyError si el almacén no tiene el documento, y
+        PageLimitExceeded o WorkerError si no se puede abrir como PDF.
+        """
+        with self.store.lease(doc_id) as handles:
+            if doc_id not in handles:
+                raise KeyError(doc_id)
+            sizes = self.pool.call('open', doc_id, handles[doc_id])
+        self.page_sizes[doc_id] = sizes
+        return sizes
+
+    def placeholder_pdf(self, doc_id, page_num):
+        """PDF de una página con el aviso de página no procesable."""
+        import editing
+
+        width, height = self.page_sizes[doc_id][page_num]
+        return editing.placeholder_page(width, height, PLACEHOLDER_MESSAGE)
+
+    def _export_pages_individually(self, doc_id, handle, pages, redactions):
+        """Repite página a página un tramo cuya exportación falló.
+
+        Las páginas que superan los límites se sustituyen por un aviso y las
+        que fallan por otro motivo se omiten. Devuelve None si no queda
+        ninguna.
+        """
+        import editing
+
+        parts = []
+        for page_num, edits in pages:
+            try:
+                parts.append(
+                    self.pool.call('export_pages',
+                                   doc_id,
+                                   handle,
+                                   pages=[(page_num, edits)],
+                                   redactions=_run_redactions(
+                                       doc_id, [(page_num, edits)],
+                                       redactions)))
+            except PageLimitExceeded:
+                parts.append(self.placeholder_pdf(doc_id, page_num))
+            except WorkerError as e:
+                print(f"Error al aplicar ediciones a la página {page_num}: {e}")
+
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else editing.merge_pdfs(parts)
+
+    def export_page_runs(self, page_refs, all_elements_data, job, run_pages,
+                         redactions=None):
+        """Exporta páginas [(doc_id, page_num), ...] en paralelo en los workers.
+
+        Agrupa las páginas consecutivas de un mismo documento en tramos de
+        hasta `run_pages` páginas y genera, en orden, (páginas del tramo, PDF
+        del tramo o None). Las ediciones de cada página son
+        all_elements_data["<doc_id>_<page_num>"], como las envía el editor.
+        Las páginas de documentos desconocidos se omiten. `redactions` es
+        {(doc_id, page_num): rectángulos} con lo que se tacha (ver
+        app.redaction_rects). El progreso se anota en `job`.
+        """
+        redactions = redactions or {}
+        # Los documentos no se liberan mientras dure la exportación
+        doc_ids = [doc_id for doc_id, _ in page_refs]
+        with self.store.lease(*doc_ids) as handles:
+            runs = []
+            for doc_id, page_num in page_refs:
+                if doc_id not in handles:
+                    job.advance()
+                    continue
+                edits = all_elements_data.get(f"{doc_id}_{page_num}", [])
+                if (runs and runs[-1][0] == doc_id
+                        and len(runs[-1][1]) < run_pages):
+                    runs[-1][1].append((page_num, edits))
+                else:
+                    runs.append((doc_id, [(page_num, edits)]))
+
+            calls = [(doc_id, handles[doc_id], {
+                'pages': pages,
+                'redactions': _run_redactions(doc_id, pages, redactions),
+                'cost': len(pages)
+            }) for doc_id, pages in runs]
+            with contextlib.closing(self.pool.map('export_pages',
+                                                  calls)) as results:
+                for (doc_id, pages), result in zip(runs, results):
+                    if (isinstance(result, PageLimitExceeded)
+                            and len(pages) == 1):
+                        result = self.placeholder_pdf(doc_id, pages[0][0])
+                    elif isinstance(result, Exception):
+                        result = self._export_pages_individually(
+                            doc_id, handles[doc_id], pages, redactions)
+                    job.advance(len(pages), len(result or b''))
+                    yield pages, result
+
+    def merge_pages(self, page_refs, all_elements_data, job, output_path=None,
+                    redactions=None):
+        """Exporta las páginas a un solo PDF en `output_path`.
+
+        Devuelve `output_path` (o los bytes del PDF si no se indica), o None
+        si no se pudo exportar ninguna página.
+        """
+        import editing
+
+        parts = [
+            part for _, part in self.export_page_runs(
+                page_refs, all_elements_data, job, EXPORT_RUN_PAGES,
+                redactions) if part
+        ]
+        if not parts:
+            return None
+        return editing.merge_pdfs(parts, output_path)
@@ -0,0 +1,240 @@
+"""Cola de trabajos de exportación que se ejecutan fuera del hilo de la petición."""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    """La cola de trabajos ha alcanzado su límite de trabajos pendientes."""
+
+
+class JobCancelled(Exception):
+    """El cliente canceló el trabajo; se lanza entre páginas."""
+
+
+class Job:
+    """Estado y progreso de un trabajo (exportación, carga...).
+
+    Las rutas síncronas también crean un Job sin registrarlo, así las
+    funciones de exportación informan del progreso siempre de la misma forma.
+    """
+
+    def __init__(self, kind, job_id=None):
+        self.id = job_id or str(uuid.uuid4())
+        self.kind = kind
+        self.status = 'pending'  # pending | running | done | error | cancelled
+        self.total = 0
+        self.done = 0
+        self.bytes_written = 0
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self._cancel_probes = []
+        # Cada cambio incrementa la versión y despierta a quien espere en
+        # wait_for_update (p. ej. el flujo de eventos SSE)
+        self.version = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def _touch(self):
+        self.version += 1
+        self._changed.notify_all()
+
+    def start(self, total):
+        """Marca el trabajo como en curso con `total` páginas por procesar."""
+        self.check()
+        with self._lock:
+            self.status = 'running'
+            self.total = total
+            self.started_at = time.time()
+            self._touch()
+
+    def advance(self, pages=1, nbytes=0):
+        """Registra páginas procesadas y bytes escritos.
+
+        Lanza JobCancelled si el cliente canceló el trabajo, de modo que el
+        bucle de páginas que llama a este método se detiene en la página actual.
+        """
+        self.check()
+        with self._lock:
+            self.done += pages
+            self.bytes_written += nbytes
+            self._touch()
+
+    def add_cancel_probe(self, probe):
+        """Añade una función que indica si el trabajo debe cancelarse.
+
+        Se consulta en cada check(), por ejemplo para detectar que el cliente
+        cerró la conexión de una exportación síncrona.
+        """
+        self._cancel_probes.append(probe)
+
+    def check(self):
+        """Lanza JobCancelled si se pidió la cancelación; se llama entre páginas."""
+        if not self.cancel_requested and any(
+                probe() for probe in self._cancel_probes):
+            self.cancel_requested = True
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def cancel(self):
+        """Pide la cancelación; el trabajo se detiene en la siguiente página."""
+        with self._lock:
+            if self.status in ('pending', 'running'):
+                self.cancel_requested = True
+                self._touch()
+
+    def finish(self, result):
+        with self._lock:
+            self.result = result
+            self.status = 'done'
+            self.finished_at = time.time()
+            self._touch()
+
+    def fail(self, message, status=500):
+        with self._lock:
+            self.error = message
+            self.error_status = status
+            self.status = 'error'
+            self.finished_at = time.time()
+            self._touch()
+
+    def mark_cancelled(self):
+        with self._lock:
+            self.status = 'cancelled'
+            self.finished_at = time.time()
+            self._touch()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'error', 'cancelled')
+
+    def wait_for_update(self, version, timeout=None):
+        """Espera hasta que la versión del trabajo cambie respecto a `version`."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def to_dict(self):
+        with self._lock:
+            eta = None
+            if self.status == 'running' and 0 < self.done < self.total:
+                elapsed = time.time() - self.started_at
+                eta = round(elapsed / self.done * (self.total - self.done), 1)
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "total": self.total,
+                "done": self.done,
+                "bytesWritten": self.bytes_written,
+                "eta": eta,
+                "error": self.error,
+            }
+
+
+class JobManager:
+    """Ejecuta trabajos en un pool de hilos con concurrencia acotada.
+
+    Los trabajos terminados se conservan `ttl` segundos para que el cliente
+    pueda descargar el resultado; después se descartan y se llama a
+    `on_expire(job)`, p. ej. para borrar el fichero del resultado. Se
+    descartan al usar el gestor y, aunque el servidor esté inactivo, cada
+    `sweep_interval` segundos desde un hilo propio.
+    """
+
+    def __init__(self,
+                 max_workers=2,
+                 max_pending=32,
+                 ttl=1800,
+                 on_expire=None,
+                 sweep_interval=60):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='pdf-job')
+        self._max_pending = max_pending
+        self._ttl = ttl
+        self._on_expire = on_expire
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._registered = threading.Condition(self._lock)
+        self._closed = threading.Event()
+        threading.Thread(target=self._sweep,
+                         args=(sweep_interval,),
+                         name='pdf-job-expiry',
+                         daemon=True).start()
+
+    def submit(self, kind, func, *args):
+        """Encola `func(*args, job)` y devuelve el Job asociado."""
+        self._expire()
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+            if pending >= self._max_pending:
+                raise QueueFull()
+            job = Job(kind)
+            self._jobs[job.id] = job
+            self._registered.notify_all()
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def track(self, kind, job_id):
+        """Registra un trabajo que se ejecuta dentro de una petición (p. ej. una carga).
+
+        El cliente elige el id para poder abrir el flujo de progreso antes de
+        que termine de enviar el cuerpo de la petición. Devuelve None si el id
+        ya está en uso.
+        """
+        self._expire()
+        with self._lock:
+            if job_id in self._jobs:
+                return None
+            job = Job(kind, job_id)
+            self._jobs[job_id] = job
+            self._registered.notify_all()
+        return job
+
+    def get(self, job_id):
+        self._expire()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait_for(self, job_id, timeout):
+        """Como get(), pero espera hasta `timeout` segundos a que se registre."""
+        self._expire()
+        with self._registered:
+            self._registered.wait_for(lambda: job_id in self._jobs, timeout)
+            return self._jobs.get(job_id)
+
+    def _run(self, job, func, args):
+        try:
+            job.finish(func(*args, job))
+        except JobCancelled:
+            job.mark_cancelled()
+        except Exception as e:
+            job.fail(str(e), getattr(e, 'status', 500))
+
+    def close(self):
+        """Detiene el hilo que descarta los trabajos caducados."""
+        self._closed.set()
+
+    def _sweep(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self._expire()
+            except Exception as e:
+                print(f"Error al descartar trabajos caducados: {e}")
+
+    def _expire(self):
+        limit = time.time() - self._ttl
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished and job.finished_at < limit]
+            for job in expired:
+                del self._jobs[job.id]
+        if self._on_expire is not None:
+            for job in expired:
+                self._on_expire(job)
@@ -0,0 +1,37 @@
+"""Contadores del proceso, expuestos en /metrics con el formato de texto de Prometheus."""
+import threading
+
+_lock = threading.Lock()
+_values = {}  # (nombre, etiquetas) -> valor
+_descriptions = {}  # nombre -> (tipo, ayuda)
+
+
+def describe(name, help_text, kind='counter'):
+    """Registra la ayuda y el tipo ('counter' o 'gauge') de una métrica."""
+    _descriptions[name] = (kind, help_text)
+
+
+def inc(name, value=1, **labels):
+    """Incrementa un contador."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+
+
+def render():
+    """Devuelve todas las métricas en el formato de exposición de Prometheus."""
+    with _lock:
+        values = sorted(_values.items())
+
+    lines = []
+    described = set()
+    for (name, labels), value in values:
+        if name not in described and name in _descriptions:
+            kind, help_text = _descriptions[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            described.add(name)
+        label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else
+                     f"{name} {value}")
+    return "\n".join(lines) + "\n"
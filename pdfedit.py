@@ -0,0 +1,582 @@
+"""API de Python y línea de órdenes para combinar, extraer y dividir PDFs.
+
+Usa el mismo motor que las exportaciones del editor (engine.py): las
+páginas se exportan en paralelo en procesos worker, con los mismos límites
+por página, y las ediciones tienen el formato de las del editor (ver
+editing.draw_elements), con coordenadas en una página de 800 de ancho.
+
+Desde otro programa de Python, sin pasar por el servidor:
+
+    import pdfedit
+
+    with pdfedit.Editor(workers=4) as editor:
+        contrato = editor.open('contrato.pdf')
+        anexo = editor.open(pdf_bytes)  # o un fichero binario abierto
+        editor.export(contrato.pages('1-3') + anexo.pages(), to='final.pdf',
+                      edits={contrato.page(0): [{'type': 'text', ...}]})
+        pdf_bytes = editor.export(anexo.pages('2'))  # sin `to`, los bytes
+        for result in editor.batch([{'pages': ..., 'to': ...}, ...]):
+            ...
+
+El Editor conserva los documentos abiertos entre llamadas: abrir de nuevo
+el mismo fichero (sin cambios) o el mismo contenido no lo vuelve a leer, y
+cada worker lo abre una sola vez. Se puede usar desde varios hilos. Los
+ficheros se leen de su ruta, sin copiarlos.
+
+Desde la línea de órdenes:
+
+    python -m pdfedit merge a.pdf b.pdf:2-5 -o combinado.pdf
+    python -m pdfedit extract a.pdf --pages 1,3,5-8 -o extracto.pdf
+    python -m pdfedit split a.pdf -o paginas/
+    python -m pdfedit run lote.yaml --jobs 8
+
+`run` ejecuta los trabajos de un manifiesto JSON (o YAML, si está instalado
+PyYAML): una lista de trabajos, o un objeto con la lista en `jobs`:
+
+    [{"op": "merge", "inputs": ["a.pdf", "b.pdf:2-5"], "output": "c.pdf"},
+     {"op": "extract", "inputs": ["a.pdf"], "pages": "1,3", "output": "e.pdf"},
+     {"op": "split", "inputs": ["a.pdf"], "output": "paginas/",
+      "edits": {"a.pdf:1": [{"type": "text", "x": 40, "y": 40, ...}]}}]
+
+Las rutas son relativas al manifiesto. `edits` asigna a páginas de origen
+("fichero:1-3", o el fichero solo para todas) los elementos que se dibujan
+sobre ellas. Con --jobs N se usan N workers y se ejecutan N trabajos a la
+vez. Los PDFs se escriben en un fichero temporal que se renombra al
+terminar, así que un resultado nunca queda a medias. Si algún trabajo falla,
+el resto continúa y el código de salida es 1.
+"""
+import argparse
+import collections
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from docstore import DocumentStore, file_sha256
+from engine import Engine
+from jobs import Job, JobCancelled
+from workers import PageLimitExceeded, WorkerError, WorkerPool
+
+OPERATIONS = ('merge', 'extract', 'split')
+# Páginas de una fuente: "fichero.pdf:1-3,7"
+PAGES_SUFFIX = re.compile(r':(\d+(-\d*)?(,\d+(-\d*)?)*)$')
+
+
+class PdfEditError(Exception):
+    """Un documento no se puede abrir o exportar, o la petición no es válida."""
+
+
+class ManifestError(PdfEditError):
+    """Un trabajo del manifiesto no es válido."""
+
+
+def parse_pages(spec, count):
+    """Páginas (desde 0) de una lista "1,3,5-8" de páginas desde 1.
+
+    Un rango abierto ("5-") llega hasta la última de las `count` páginas.
+    """
+    pages = []
+    for part in str(spec).replace(' ', '').split(','):
+        if not part:
+            continue
+        start, dash, end = part.partition('-')
+        if not start.isdigit() or (end and not end.isdigit()):
+            raise PdfEditError(f"Páginas no válidas: {spec}")
+        last = int(end) if end else (count if dash else int(start))
+        for page_num in range(int(start), last + 1):
+            if not 1 <= page_num <= count:
+                raise PdfEditError(
+                    f"La página {page_num} no existe (hay {count}).")
+            pages.append(page_num - 1)
+    return pages
+
+
+def split_source(source):
+    """Separa "fichero.pdf:1-3" en ("fichero.pdf", "1-3"); sin páginas, None."""
+    match = PAGES_SUFFIX.search(source)
+    if match is None:
+        return source, None
+    return source[:match.start()], match.group(1)
+
+
+class Document:
+    """Un PDF abierto con Editor.open().
+
+    Las páginas se indican como (doc_id, page_num), que es lo que devuelven
+    page() y pages() y lo que reciben Editor.export() y Editor.split().
+    """
+
+    def __init__(self, doc_id, name, page_sizes):
+        self.doc_id = doc_id
+        self.name = name
+        self.page_sizes = page_sizes  # [(ancho, alto), ...] en puntos
+
+    def __len__(self):
+        return len(self.page_sizes)
+
+    def __repr__(self):
+        return f"<Document {self.name!r}, {len(self)} páginas>"
+
+    def page(self, page_num):
+        """La página `page_num`, contando desde 0."""
+        if not 0 <= page_num < len(self):
+            raise PdfEditError(
+                f"La página {page_num + 1} no existe (hay {len(self)}).")
+        return (self.doc_id, page_num)
+
+    def pages(self, spec=None):
+        """Las páginas "1,3,5-8" (desde 1, como en el editor), o todas."""
+        page_nums = (range(len(self)) if spec is None
+                     else parse_pages(spec, len(self)))
+        return [(self.doc_id, page_num) for page_num in page_nums]
+
+
+class Editor:
+    """Motor de exportación para usarlo dentro de otro programa de Python.
+
+    Tiene su propio almacén de documentos (en `spool_dir`, o en un
+    directorio temporal) y su propio pool de `workers` procesos (por
+    defecto, uno por CPU), con los límites por página de
+    PDF_PAGE_CPU_SECONDS, PDF_PAGE_MEMORY_MB y PDF_WORKER_MAX_JOBS.
+    close() libera los documentos y detiene los workers.
+    """
+
+    def __init__(self, workers=None, spool_dir=None):
+        self.workers = workers or os.cpu_count() or 2
+        self.store = DocumentStore(spool_dir)
+        self.engine = Engine(
+            self.store,
+            WorkerPool(
+                size=self.workers,
+                cpu_seconds=int(os.environ.get('PDF_PAGE_CPU_SECONDS', 30)),
+                memory_mb=int(os.environ.get('PDF_PAGE_MEMORY_MB', 1024)),
+                max_jobs=int(os.environ.get('PDF_WORKER_MAX_JOBS', 500))))
+        # Documentos abiertos, por fichero (ruta, tamaño y fecha) o contenido
+        self._documents = {}
+        self._loading = {}  # clave -> Event mientras se abre
+        self._jobs = set()  # exportaciones en curso, para cancelarlas
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self, source, name=None):
+        """Abre un PDF: una ruta, sus bytes o un fichero binario abierto.
+
+        Devuelve un Document. Si ese fichero (sin cambios) o ese contenido
+        ya estaba abierto, devuelve el mismo sin volver a leerlo.
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data = bytes(source)
+            sha256 = hashlib.sha256(data).hexdigest()
+            return self._cached(('sha256', sha256), lambda: self._load(
+                sha256, name or sha256[:12],
+                lambda: self.store.put(sha256, data)))
+
+        if hasattr(source, 'read'):
+            # Se vuelca al spool por bloques, calculando su SHA-256
+            spooled = uuid.uuid4().hex
+            try:
+                sha256 = self.store.spool(spooled, source)
+                return self._cached(('sha256', sha256), lambda: self._load(
+                    sha256, name or getattr(source, 'name', sha256[:12]),
+                    lambda: self.store.attach(sha256, sha256)))
+            finally:
+                self.store.discard(spooled)
+
+        path = os.path.abspath(os.fspath(source))
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            raise PdfEditError(f"No se pudo leer {source}: {e.strerror}.") from e
+
+        def load():
+            try:
+                sha256 = file_sha256(path)
+                return self._load(
+                    sha256, name or os.path.basename(path),
+                    lambda: self.store.add_path(sha256, path, sha256))
+            except OSError as e:
+                raise PdfEditError(
+                    f"No se pudo leer {source}: {e.strerror}.") from e
+
+        return self._cached(('path', path, stat.st_size, stat.st_mtime_ns),
+                            load)
+
+    def _cached(self, key, load):
+        """Documento de `key`; lo abre con load() si no lo ha hecho otro hilo."""
+        while True:
+            with self._lock:
+                document = self._documents.get(key)
+                if document is not None:
+                    return document
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # Otro hilo lo está abriendo; si falla, se vuelve a intentar
+            loading.wait()
+        try:
+            document = load()
+            with self._lock:
+                self._documents[key] = document
+            return document
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def _load(self, sha256, name, register):
+        """Registra el contenido `sha256` con register() y lo abre."""
+        # El doc_id es el SHA-256: un mismo contenido, llegue como llegue,
+        # es un solo documento en el almacén y en la caché de cada worker
+        register()
+        sizes = self.engine.page_sizes.get(sha256)
+        if sizes is None:
+            try:
+                sizes = self.engine.open(sha256)
+            except (PageLimitExceeded, WorkerError) as e:
+                self.store.discard(sha256)
+                raise PdfEditError(f"No se pudo abrir {name} como PDF.") from e
+        return Document(sha256, name, sizes)
+
+    def release(self, document):
+        """Libera un documento que ya no se va a usar."""
+        with self._lock:
+            for key in [key for key, cached in self._documents.items()
+                        if cached.doc_id == document.doc_id]:
+                del self._documents[key]
+        self.engine.page_sizes.pop(document.doc_id, None)
+        self.store.discard(document.doc_id)
+
+    @contextlib.contextmanager
+    def _running(self, kind, pages, job):
+        """Job con el que se sigue (y se puede cancelar) una exportación."""
+        job = job or Job(kind)
+        with self._lock:
+            self._jobs.add(job)
+        try:
+            job.start(len(pages))
+            yield job
+        finally:
+            with self._lock:
+                self._jobs.discard(job)
+
+    def export(self, pages, edits=None, to=None, job=None):
+        """Exporta las páginas [(doc_id, page_num), ...] a un solo PDF.
+
+        `edits` es {página: [elemento, ...]} con lo que se dibuja sobre cada
+        página. Con una ruta `to` el PDF se escribe allí de forma atómica;
+        con un fichero binario abierto, se escribe en él; en ambos casos se
+        devuelve `to`. Sin `to` se devuelven los bytes. El progreso se anota
+        en `job` (un jobs.Job), si se indica: Job.cancel() la detiene antes
+        de su siguiente tramo con JobCancelled.
+        """
+        all_elements_data = _elements_data(edits)
+        with self._running('export', pages, job) as job:
+            if to is None or hasattr(to, 'write'):
+                pdf_bytes = self.engine.merge_pages(pages, all_elements_data,
+                                                    job)
+                if pdf_bytes is None:
+                    raise PdfEditError("No se pudo exportar ninguna página.")
+                if to is None:
+                    return pdf_bytes
+                to.write(pdf_bytes)
+                return to
+
+            path = os.path.abspath(os.fspath(to))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = os.path.join(
+                os.path.dirname(path),
+                f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+            try:
+                if self.engine.merge_pages(pages, all_elements_data, job,
+                                           temp_path) is None:
+                    raise PdfEditError("No se pudo exportar ninguna página.")
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            return to
+
+    def split(self, pages, edits=None, to=None, job=None):
+        """Exporta cada página a un PDF propio.
+
+        Sin `to` devuelve la lista de sus bytes; con un directorio `to`
+        escribe en él pagina_1.pdf, pagina_2.pdf... (según la posición en
+        `pages`) y devuelve sus rutas. Las páginas que no se pudieron
+        exportar, o de documentos ya liberados, quedan como None. `edits` y
+        `job` son como en export().
+        """
+        all_elements_data = _elements_data(edits)
+        if to is not None:
+            os.makedirs(to, exist_ok=True)
+        outputs = [None] * len(pages)
+        # export_page_runs omite las páginas de documentos desconocidos: los
+        # PDF se numeran según su posición en `pages`, como en
+        # app.build_split_zip
+        positions = [i for i, (doc_id, _) in enumerate(pages)
+                     if doc_id in self.store]
+        with self._running('split', pages, job) as job:
+            # Tramos de una página: cada uno ya es el PDF individual
+            runs = self.engine.export_page_runs(pages, all_elements_data,
+                                                job, 1)
+            for i, (_, page_bytes) in zip(positions, runs):
+                if not page_bytes or to is None:
+                    outputs[i] = page_bytes or None
+                    continue
+                path = os.path.join(to, f"pagina_{i + 1}.pdf")
+                with open(path + '.tmp', 'wb') as page_file:
+                    page_file.write(page_bytes)
+                os.replace(path + '.tmp', path)
+                outputs[i] = path
+        return outputs
+
+    def batch(self, requests, concurrency=None):
+        """Ejecuta muchas exportaciones a la vez y genera sus resultados en orden.
+
+        Cada petición es un diccionario con los argumentos de export() (o de
+        split(), con "op": "split"), o una función sin argumentos que lo
+        devuelve, para que abrir sus documentos también se haga en paralelo.
+        Se ejecutan `concurrency` a la vez (por defecto, tantas como
+        workers) y las siguientes se leen de `requests` según terminan, como
+        en WorkerPool.map. Si una falla, se genera su excepción en lugar del
+        resultado. Si se cierra el generador antes de tiempo, las pendientes
+        se descartan y las que están en curso se cancelan.
+        """
+        concurrency = concurrency or self.workers
+        requests = iter(requests)
+        pending = collections.deque()
+        jobs = set()
+
+        def run(request):
+            if callable(request):
+                request = request()
+            request = dict(request)
+            op = request.pop('op', 'export')
+            if op not in ('export', 'split'):
+                raise PdfEditError(f"Operación no válida: {op}")
+            job = Job(op)
+            jobs.add(job)
+            try:
+                return getattr(self, op)(job=job, **request)
+            finally:
+                jobs.discard(job)
+
+        executor = ThreadPoolExecutor(max_workers=concurrency,
+                                      thread_name_prefix='pdfedit')
+
+        def submit(count):
+            for request in itertools.islice(requests, count):
+                pending.append(executor.submit(run, request))
+
+        try:
+            submit(concurrency)
+            while pending:
+                future = pending.popleft()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = e
+                submit(1)
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+            for job in list(jobs):
+                job.cancel()
+            executor.shutdown(wait=True)
+
+    def cancel(self):
+        """Cancela las exportaciones en curso antes de su siguiente tramo."""
+        with self._lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+
+    def close(self):
+        """Libera los documentos y detiene los workers."""
+        self.cancel()
+        with self._lock:
+            self._documents.clear()
+        self.engine.page_sizes.clear()
+        self.store.close()
+        self.engine.pool.close()
+
+
+def _elements_data(edits):
+    """Ediciones {(doc_id, page_num): elementos} con las claves del editor."""
+    return {f"{doc_id}_{page_num}": elements
+            for (doc_id, page_num), elements in (edits or {}).items()}
+
+
+def load_manifest(path):
+    """Trabajos del manifiesto, con las rutas relativas a su directorio."""
+    with open(path, encoding='utf-8') as manifest_file:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ManifestError(
+                    "Los manifiestos YAML necesitan PyYAML (pip install pyyaml).")
+            manifest = yaml.safe_load(manifest_file)
+        else:
+            manifest = json.load(manifest_file)
+    tasks = manifest.get('jobs') if isinstance(manifest, dict) else manifest
+    if not isinstance(tasks, list) or not all(
+            isinstance(task, dict) for task in tasks):
+        raise ManifestError("El manifiesto debe ser una lista de trabajos.")
+
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(source):
+        return os.path.join(base, os.path.expanduser(str(source)))
+
+    for task in tasks:
+        inputs = task.get('inputs') or []
+        task['inputs'] = [resolve(source)
+                          for source in ([inputs] if isinstance(inputs, str)
+                                         else inputs)]
+        if task.get('output'):
+            task['output'] = resolve(task['output'])
+        if task.get('edits'):
+            task['edits'] = {resolve(source): elements
+                             for source, elements in task['edits'].items()}
+    return tasks
+
+
+def plan_task(editor, task):
+    """Petición de Editor.batch() para un trabajo del manifiesto."""
+    if task.get('op') not in OPERATIONS:
+        raise ManifestError(f"Operación no válida: {task.get('op')}")
+    inputs = task.get('inputs') or []
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if not inputs or not task.get('output'):
+        raise ManifestError("Faltan las entradas o la salida.")
+    if task['op'] != 'merge' and len(inputs) != 1:
+        raise ManifestError(f"{task['op']} admite un solo PDF de entrada.")
+
+    pages = []
+    for source in inputs:
+        path, spec = split_source(source)
+        pages.extend(editor.open(path).pages(spec))
+    if task['op'] == 'extract':
+        if not task.get('pages'):
+            raise ManifestError("Faltan las páginas a extraer.")
+        pages = [pages[i] for i in parse_pages(task['pages'], len(pages))]
+
+    edits = {}
+    for source, elements in (task.get('edits') or {}).items():
+        path, spec = split_source(source)
+        for page in editor.open(path).pages(spec):
+            edits[page] = elements
+    return {
+        'op': 'split' if task['op'] == 'split' else 'export',
+        'pages': pages,
+        'edits': edits,
+        'to': task['output']
+    }
+
+
+def run_tasks(tasks, jobs):
+    """Ejecuta los trabajos de N en N; devuelve cuántos fallaron."""
+    failed = 0
+    started = {}  # trabajo -> (instante de inicio, páginas)
+
+    def plan(number, task):
+        start = time.monotonic()
+        request = plan_task(editor, task)
+        started[number] = (start, len(request['pages']))
+        return request
+
+    with Editor(workers=jobs) as editor:
+        requests = (lambda number=number, task=task: plan(number, task)
+                    for number, task in enumerate(tasks))
+        with contextlib.closing(editor.batch(requests)) as results:
+            for number, (task, result) in enumerate(zip(tasks, results)):
+                output = task.get('output')
+                if isinstance(result, JobCancelled):
+                    failed += 1
+                    print(f"cancelado {output}", file=sys.stderr)
+                elif isinstance(result, Exception):
+                    failed += 1
+                    print(f"error {output}: {result}", file=sys.stderr)
+                else:
+                    start, pages = started.pop(number)
+                    if isinstance(result, list):
+                        pages = sum(1 for path in result if path)
+                    print(f"ok {output} ({pages} páginas, "
+                          f"{time.monotonic() - start:.1f} s)")
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m pdfedit', description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    merge = commands.add_parser('merge', help='combina PDFs en uno')
+    merge.add_argument('inputs', nargs='+',
+                       help='PDFs, opcionalmente con páginas: a.pdf:1-3')
+    extract = commands.add_parser('extract',
+                                  help='extrae páginas de un PDF')
+    extract.add_argument('inputs', nargs=1, help='PDF de entrada')
+    extract.add_argument('--pages', required=True,
+                         help='páginas desde 1, p. ej. 1,3,5-8')
+    split = commands.add_parser('split',
+                                help='divide un PDF en un PDF por página')
+    split.add_argument('inputs', nargs=1, help='PDF de entrada')
+    for command in (merge, extract, split):
+        command.add_argument('-o', '--output', required=True,
+                             help='PDF de salida (directorio para split)')
+        command.add_argument('--edits',
+                             help='JSON con las ediciones (ver "edits")')
+    run = commands.add_parser('run', help='ejecuta un manifiesto JSON o YAML')
+    run.add_argument('manifest')
+    for command in (merge, extract, split, run):
+        command.add_argument('--jobs', type=int, default=os.cpu_count() or 2,
+                             help='workers y trabajos simultáneos '
+                             '(por defecto, el número de CPUs)')
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error('--jobs debe ser al menos 1')
+
+    try:
+        if args.command == 'run':
+            tasks = load_manifest(args.manifest)
+        else:
+            task = {'op': args.command, 'inputs': args.inputs,
+                    'output': args.output, 'pages': getattr(args, 'pages', None)}
+            if args.edits:
+                with open(args.edits, encoding='utf-8') as edits_file:
+                    task['edits'] = json.load(edits_file)
+            tasks = [task]
+    except (ManifestError, OSError, ValueError) as e:
+        parser.exit(2, f"{parser.prog}: error: {e}\n")
+
+    try:
+        failed = run_tasks(tasks, args.jobs)
+    except KeyboardInterrupt:
+        return 130
+    if failed:
+        print(f"{failed} de {len(tasks)} trabajos fallaron", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
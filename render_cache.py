@@ -0,0 +1,163 @@
+"""Caché en disco de páginas rasterizadas, que sobrevive a los reinicios.
+
+Cada imagen se guarda en un fichero cuyo nombre es su clave (SHA-256 del
+documento, página, resolución, formato y, para las teselas, su posición), así que
+el índice en memoria se reconstruye al arrancar recorriendo el directorio,
+sin ficheros auxiliares que puedan quedar desincronizados. Las escrituras son atómicas (fichero
+temporal y os.replace): un proceso que muere a mitad de escritura no deja
+imágenes truncadas y varios procesos pueden compartir el directorio.
+
+El tamaño total está acotado: al superarlo se descartan las imágenes usadas
+hace más tiempo. El orden de uso se conserva entre reinicios con la fecha de
+modificación de cada fichero, que se actualiza en cada acierto.
+"""
+import collections
+import os
+import tempfile
+import threading
+
+import metrics
+
+metrics.describe('pdf_render_cache_hits_total',
+                 'Páginas servidas desde la caché de renderizado')
+metrics.describe('pdf_render_cache_misses_total',
+                 'Páginas que no estaban en la caché de renderizado')
+metrics.describe('pdf_render_cache_evictions_total',
+                 'Imágenes descartadas de la caché de renderizado por espacio')
+metrics.describe('pdf_render_cache_bytes',
+                 'Bytes de imágenes en la caché de renderizado',
+                 kind='gauge')
+metrics.describe('pdf_render_cache_entries',
+                 'Imágenes en la caché de renderizado',
+                 kind='gauge')
+
+
+class RenderCache:
+    """Imágenes de páginas por (sha256, página, resolución, formato) en `cache_dir`.
+
+    `max_bytes` acota el tamaño total; con 0 la caché está desactivada y
+    get() siempre devuelve None.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()  # nombre -> tamaño
+        self._size = 0
+        self._lock = threading.Lock()
+        if max_bytes:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load()
+
+    @staticmethod
+    def _name(sha256, page_num, resolution, fmt, tile):
+        if tile is not None:
+            level, x, y = tile
+            return f"{sha256}-{page_num}-t{level}-{x}-{y}.{fmt}"
+        return f"{sha256}-{page_num}-{resolution}.{fmt}"
+
+    def _path(self, name):
+        # Un subdirectorio por prefijo para no tener millones de ficheros juntos
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def _load(self):
+        """Reconstruye el índice con las imágenes que ya hay en el directorio."""
+        found = []
+        for prefix in os.listdir(self.cache_dir):
+            directory = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if entry.name.startswith('.'):
+                    # Temporal de una escritura interrumpida
+                    os.remove(entry.path)
+                    continue
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._size += size
+        metrics.inc('pdf_render_cache_bytes', self._size)
+        metrics.inc('pdf_render_cache_entries', len(self._entries))
+        self._evict()
+
+    def get(self, sha256, page_num, resolution, fmt, tile=None):
+        """Bytes de la imagen guardada, o None si no está en la caché.
+
+        `resolution` identifica el tamaño de la imagen (p. ej. 'w800' para
+        800 píxeles de ancho). `tile` es (nivel, x, y) para una tesela (ver
+        tiles.py); su resolución depende del nivel y `resolution` se ignora.
+        """
+        if not self.max_bytes:
+            return None
+        name = self._name(sha256, page_num, resolution, fmt, tile)
+        with self._lock:
+            known = name in self._entries
+            if known:
+                self._entries.move_to_end(name)
+        if known:
+            path = self._path(name)
+            try:
+                with open(path, 'rb') as image_file:
+                    data = image_file.read()
+                os.utime(path)
+            except FileNotFoundError:
+                # Otro proceso que comparte el directorio la descartó
+                self._forget(name)
+            else:
+                metrics.inc('pdf_render_cache_hits_total')
+                return data
+        metrics.inc('pdf_render_cache_misses_total')
+        return None
+
+    def put(self, sha256, page_num, resolution, fmt, data, tile=None):
+        """Guarda la imagen de una página y descarta las más antiguas si sobra."""
+        if not self.max_bytes or len(data) > self.max_bytes:
+            return
+        name = self._name(sha256, page_num, resolution, fmt, tile)
+        path = self._path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            self._entries[name] = len(data)
+            self._size += len(data) - (previous or 0)
+        metrics.inc('pdf_render_cache_bytes', len(data) - (previous or 0))
+        if previous is None:
+            metrics.inc('pdf_render_cache_entries')
+        self._evict()
+
+    def _forget(self, name):
+        with self._lock:
+            size = self._entries.pop(name, None)
+            if size is None:
+                return
+            self._size -= size
+        metrics.inc('pdf_render_cache_bytes', -size)
+        metrics.inc('pdf_render_cache_entries', -1)
+
+    def _evict(self):
+        """Borra las imágenes usadas hace más tiempo hasta caber en max_bytes."""
+        while True:
+            with self._lock:
+                if self._size <= self.max_bytes or not self._entries:
+                    return
+                name, size = self._entries.popitem(last=False)
+                self._size -= size
+            metrics.inc('pdf_render_cache_bytes', -size)
+            metrics.inc('pdf_render_cache_entries', -1)
+            metrics.inc('pdf_render_cache_evictions_total')
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,254 @@
+"""Búsqueda de texto en las páginas de los documentos.
+
+El texto de cada página se extrae en los workers en segundo plano al cargar
+el documento (ver app.index_documents), como una lista de palabras con su
+rectángulo. SearchIndex guarda por documento un índice invertido (término ->
+posiciones), con el que una consulta sobre miles de páginas se resuelve en
+milisegundos sin recorrer el texto. Los documentos se identifican por su
+SHA-256, así que los alias de un mismo contenido comparten el índice.
+
+Los términos se comparan sin mayúsculas, acentos ni la puntuación que los
+rodea, y una consulta de varias palabras busca la frase: esas palabras
+seguidas en la página.
+
+Con `index_dir` las palabras extraídas se guardan en disco (un fichero por
+documento, escrito de forma atómica como en render_cache) y un documento ya
+indexado, en otra sesión o antes de un reinicio, no se vuelve a extraer. En
+memoria se conservan los documentos usados más recientemente hasta
+`max_words` palabras; los demás se recargan del disco al buscar en ellos.
+"""
+import bisect
+import collections
+import gzip
+import json
+import os
+import re
+import string
+import tempfile
+import threading
+import unicodedata
+
+import metrics
+
+# Caracteres que se quitan del principio y el final de cada palabra
+PUNCTUATION = string.punctuation + '«»“”‘’¿¡…–—·'
+
+metrics.describe('pdf_search_queries_total', 'Búsquedas de texto atendidas')
+metrics.describe('pdf_search_indexed_pages_total',
+                 'Páginas cuyo texto se ha extraído para la búsqueda')
+metrics.describe('pdf_search_index_words',
+                 'Palabras de los documentos indexados en memoria',
+                 kind='gauge')
+
+
+def fold(text):
+    """`text` sin acentos y en minúsculas."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed
+                   if not unicodedata.combining(char)).casefold()
+
+
+def normalize(word):
+    """Forma en que se compara una palabra: sin acentos, en minúsculas."""
+    return fold(word).strip(PUNCTUATION)
+
+
+def query_terms(query):
+    """Términos de la consulta `query`, en orden."""
+    return [term for term in map(normalize, query.split()) if term]
+
+
+class DocumentIndex:
+    """Índice invertido de las palabras de un documento.
+
+    `pages` es, por página, [(x0, y0, x1, y1, palabra), ...] (ver
+    editing.page_words), o None si no se pudo extraer su texto.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.words = sum(len(words or ()) for words in pages)
+        # Por página, la palabra de cada posición: las que solo tienen
+        # puntuación no ocupan posición y no cortan una frase
+        self._positions = []
+        postings = collections.defaultdict(list)
+        for page_num, words in enumerate(pages):
+            positions = []
+            for word_index, word in enumerate(words or ()):
+                term = normalize(word[4])
+                if term:
+                    postings[term].append((page_num, len(positions)))
+                    positions.append(word_index)
+            self._positions.append(positions)
+        self._postings = dict(postings)
+        self._folded = {}  # página -> palabras sin acentos (ver contains)
+
+    def find(self, terms):
+        """Apariciones de la frase `terms` (ver query_terms).
+
+        Devuelve {página: [[rectángulo de cada palabra], ...]} con una lista
+        por aparición.
+        """
+        if not terms or any(term not in self._postings for term in terms):
+            return {}
+        following = [set(self._postings[term]) for term in terms[1:]]
+        hits = collections.defaultdict(list)
+        for page_num, position in self._postings[terms[0]]:
+            if all((page_num, position + offset) in positions
+                   for offset, positions in enumerate(following, 1)):
+                words = self.pages[page_num]
+                hits[page_num].append([
+                    list(words[self._positions[page_num][position + offset]][:4])
+                    for offset in range(len(terms))
+                ])
+        return hits
+
+    def match(self, pattern, folded=False):
+        """Apariciones de la expresión regular compilada `pattern`.
+
+        El texto de cada página son sus palabras separadas por un espacio,
+        así que una expresión puede abarcar varias palabras (un IBAN escrito
+        en grupos de cuatro cifras). Con `folded` se busca en el texto sin
+        acentos ni mayúsculas (ver fold). Devuelve lo mismo que find(), con
+        las palabras que toca cada aparición, enteras.
+        """
+        hits = collections.defaultdict(list)
+        for page_num, words in enumerate(self.pages):
+            if not words:
+                continue
+            texts = (self._folded_words(page_num) if folded
+                     else [word[4] for word in words])
+            starts = []
+            offset = 0
+            for text in texts:
+                starts.append(offset)
+                offset += len(text) + 1
+            for found in pattern.finditer(' '.join(texts)):
+                if found.start() == found.end():
+                    continue
+                first = bisect.bisect_right(starts, found.start()) - 1
+                if found.start() >= starts[first] + len(texts[first]):
+                    first += 1  # empieza en el espacio tras una palabra
+                last = bisect.bisect_right(starts, found.end() - 1) - 1
+                hits[page_num].append(
+                    [list(word[:4]) for word in words[first:last + 1]])
+        return hits
+
+    def contains(self, text):
+        """Apariciones de `text` dentro del texto de las páginas.
+
+        A diferencia de find(), `text` puede estar en medio de una palabra
+        ("DNI:12345678Z") y se compara sin acentos ni mayúsculas, pero no
+        sin la puntuación. Devuelve lo mismo que match().
+        """
+        text = ' '.join(fold(text).split())
+        if not text:
+            return {}
+        return self.match(re.compile(re.escape(text)), folded=True)
+
+    def _folded_words(self, page_num):
+        """Las palabras de la página sin acentos ni mayúsculas (ver fold)."""
+        folded = self._folded.get(page_num)
+        if folded is None:
+            folded = self._folded[page_num] = [
+                fold(word[4]) for word in self.pages[page_num]]
+        return folded
+
+    def unreadable_pages(self):
+        """Páginas cuyo texto no se pudo extraer."""
+        return [page_num for page_num, words in enumerate(self.pages)
+                if words is None]
+
+
+class SearchIndex:
+    """Índices de los documentos por SHA-256, en memoria y opcionalmente en disco."""
+
+    def __init__(self, index_dir=None, max_words=10_000_000):
+        self.index_dir = index_dir
+        self.max_words = max_words
+        self._documents = collections.OrderedDict()  # sha256 -> DocumentIndex
+        self._words = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+    def _path(self, sha256):
+        return os.path.join(self.index_dir, f"{sha256}.json.gz")
+
+    def has(self, sha256):
+        """Indica si el documento está indexado o se está indexando."""
+        with self._lock:
+            if sha256 in self._documents or sha256 in self._pending:
+                return True
+        return bool(self.index_dir) and os.path.exists(self._path(sha256))
+
+    def start(self, sha256):
+        """Marca el documento como pendiente; False si ya lo estaba."""
+        with self._lock:
+            if sha256 in self._pending:
+                return False
+            self._pending.add(sha256)
+            return True
+
+    def cancel(self, sha256):
+        """Retira la marca de pendiente sin indexar el documento."""
+        with self._lock:
+            self._pending.discard(sha256)
+
+    def add(self, sha256, pages):
+        """Indexa el documento con las palabras `pages` y lo guarda en disco.
+
+        Si el texto de alguna página no se pudo extraer no se guarda, para
+        volver a intentarlo cuando se cargue de nuevo (o al tachar, ver
+        app.document_index). Devuelve su DocumentIndex, que sustituye al
+        anterior.
+        """
+        if self.index_dir and None not in pages:
+            fd, temp_path = tempfile.mkstemp(prefix='.', dir=self.index_dir)
+            try:
+                with os.fdopen(fd, 'wb') as raw_file, gzip.open(
+                        raw_file, 'wt', encoding='utf-8') as index_file:
+                    json.dump(pages, index_file, ensure_ascii=False)
+                os.replace(temp_path, self._path(sha256))
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        metrics.inc('pdf_search_indexed_pages_total', len(pages))
+        document = DocumentIndex(pages)
+        self._insert(sha256, document)
+        with self._lock:
+            self._pending.discard(sha256)
+        return document
+
+    def get(self, sha256):
+        """Índice del documento, o None si no está indexado."""
+        with self._lock:
+            document = self._documents.get(sha256)
+            if document is not None:
+                self._documents.move_to_end(sha256)
+                return document
+        if not self.index_dir:
+            return None
+        try:
+            with gzip.open(self._path(sha256), 'rt',
+                           encoding='utf-8') as index_file:
+                pages = json.load(index_file)
+        except FileNotFoundError:
+            return None
+        document = DocumentIndex(pages)
+        self._insert(sha256, document)
+        return document
+
+    def _insert(self, sha256, document):
+        with self._lock:
+            previous = self._documents.pop(sha256, None)
+            self._documents[sha256] = document
+            change = document.words - (previous.words if previous else 0)
+            self._words += change
+            # Descartar los usados hace más tiempo, salvo el recién añadido
+            while self._words > self.max_words and len(self._documents) > 1:
+                _, evicted = self._documents.popitem(last=False)
+                self._words -= evicted.words
+                change -= evicted.words
+        metrics.inc('pdf_search_index_words', change)
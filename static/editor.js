@@ -0,0 +1,1479 @@
+let uploadedPdfs = { pagesData: {}, pagesType: {}, pagesOrder: [] };
+let currentDocumentId = null;
+let currentPageIndex = 0;
+let editedElements = {};
+let isDragging = false;
+let draggedElement = null;
+let isResizing = false;
+let selectedElement = null;
+let startX, startY, startWidth, startHeight, startLeft, startTop;
+let fontStyle = {
+    bold: false,
+    italic: false
+};
+
+const pageContainer = document.getElementById('page-container');
+const thumbnailsContainer = document.getElementById('pdf-thumbnails');
+const thumbnailsList = document.getElementById('thumbnails-list');
+const downloadFinalPdfBtn = document.getElementById('download-final-pdf-btn');
+const resetFilesBtn = document.getElementById('reset-files-btn');
+const pdfFilesInput = document.getElementById('pdf-files');
+const boldBtn = document.getElementById('bold-btn');
+const italicBtn = document.getElementById('italic-btn');
+const loadingOverlay = document.getElementById('loading-overlay');
+const loadingMessage = document.getElementById('loading-message');
+const loadingProgress = document.getElementById('loading-progress');
+const loadingDetails = document.getElementById('loading-details');
+const searchInput = document.getElementById('search-input');
+const searchResults = document.getElementById('search-results');
+const redactionList = document.getElementById('redaction-list');
+
+// Trabajo que muestra la capa de progreso: { id, controller }
+let activeJob = null;
+
+let sortableInstance = null;
+
+function initSortable() {
+    if (sortableInstance) {
+        sortableInstance.destroy();
+    }
+    sortableInstance = new Sortable(thumbnailsList, {
+        animation: 150,
+        // La ventana de miniaturas no cambia mientras se arrastra
+        onStart: function () {
+            thumbnailsDragging = true;
+        },
+        onEnd: function () {
+            thumbnailsDragging = false;
+            updateThumbnailWindow();
+        },
+        onUpdate: function (evt) {
+            // Los índices son relativos a los nodos de la ventana
+            const order = uploadedPdfs.pagesOrder;
+            const [moved] = order.splice(thumbnailsStart + evt.oldIndex, 1);
+            order.splice(thumbnailsStart + evt.newIndex, 0, moved);
+        }
+    });
+}
+
+function updateElementPositionAndSize(element, x, y, width, height) {
+    const pageId = `${currentDocumentId}_${currentPageIndex}`;
+    const elementData = (editedElements[pageId] || []).find(data => data.element === element);
+    if (elementData) {
+        elementData.x = x;
+        elementData.y = y;
+        elementData.width = width;
+        elementData.height = height;
+        element.style.left = `${x}px`;
+        element.style.top = `${y}px`;
+        element.style.width = `${width}px`;
+        element.style.height = `${height}px`;
+    }
+}
+
+// Imagen de una página como URL data: el servidor indica su formato
+// (PNG, JPEG o WebP) en pagesType
+function pageImageSrc(pageId) {
+    const type = uploadedPdfs.pagesType[pageId] || 'image/png';
+    return `data:${type};base64,${uploadedPdfs.pagesData[pageId]}`;
+}
+
+function displayPage(docId, pageIndex) {
+    const pageId = `${docId}_${pageIndex}`;
+
+    pageContainer.innerHTML = '';
+
+    const mainPageImage = document.createElement('img');
+    mainPageImage.id = 'page-image';
+    mainPageImage.src = pageImageSrc(pageId);
+    pageContainer.appendChild(mainPageImage);
+
+    currentDocumentId = docId;
+    currentPageIndex = pageIndex;
+    selectedElement = null;
+
+    thumbnailsList.querySelectorAll('.selected-thumb').forEach(thumb => {
+        thumb.classList.remove('selected-thumb');
+    });
+    const selectedThumb = thumbnailNodes.get(pageId);
+    if (selectedThumb) {
+        selectedThumb.classList.add('selected-thumb');
+    }
+
+    const currentPageEdits = editedElements[pageId] || [];
+    if (currentPageEdits.length > 0) {
+        currentPageEdits.forEach(elementData => {
+            let newElement = createEditableElement(elementData);
+            pageContainer.appendChild(newElement);
+            elementData.element = newElement;
+        });
+    }
+    drawSearchHits();
+    pageContainer.style.display = 'block';
+}
+
+function createEditableElement(elementData) {
+    let newElement = document.createElement('div');
+    newElement.className = 'added-element';
+
+    if (elementData.type === 'text') {
+        newElement.classList.add('added-text');
+        newElement.textContent = elementData.text;
+        newElement.style.fontSize = `${elementData.fontSize}px`;
+        newElement.style.color = elementData.fontColor;
+        newElement.style.fontWeight = elementData.bold ? 'bold' : 'normal';
+        newElement.style.fontStyle = elementData.italic ? 'italic' : 'normal';
+    } else if (elementData.type === 'image') {
+        newElement.classList.add('added-image');
+        let img = document.createElement('img');
+        img.src = elementData.src;
+        img.style.width = '100%';
+        img.style.height = '100%';
+        newElement.appendChild(img);
+    } else if (elementData.type === 'rect') {
+        newElement.classList.add('added-rect');
+        newElement.style.backgroundColor = elementData.fillColor;
+        newElement.style.border = `1px solid ${elementData.borderColor}`;
+    } else if (elementData.type === 'circle') {
+        newElement.classList.add('added-circle');
+        newElement.style.backgroundColor = elementData.fillColor;
+        newElement.style.border = `1px solid ${elementData.borderColor}`;
+        newElement.style.borderRadius = '50%';
+    }
+
+    newElement.style.left = `${elementData.x}px`;
+    newElement.style.top = `${elementData.y}px`;
+    newElement.style.width = `${elementData.width}px`;
+    newElement.style.height = `${elementData.height}px`;
+
+    if (elementData.type !== 'text') {
+        const resizer = document.createElement('div');
+        resizer.className = 'resizer bottom-right';
+        newElement.appendChild(resizer);
+        resizer.addEventListener('mousedown', function(e) {
+            isResizing = true;
+            draggedElement = newElement;
+            selectElement(newElement);
+
+            const elementRect = draggedElement.getBoundingClientRect();
+            startWidth = elementRect.width;
+            startHeight = elementRect.height;
+            startX = e.clientX;
+            startY = e.clientY;
+
+            e.stopPropagation();
+            e.preventDefault();
+        });
+    }
+
+    newElement.addEventListener('mousedown', function(e) {
+        if (e.target.classList.contains('resizer')) return;
+        isDragging = true;
+        draggedElement = newElement;
+        selectElement(newElement);
+
+        const elementRect = draggedElement.getBoundingClientRect();
+        startX = e.clientX;
+        startY = e.clientY;
+        startLeft = elementRect.left - pageContainer.getBoundingClientRect().left;
+        startTop = elementRect.top - pageContainer.getBoundingClientRect().top;
+
+        e.preventDefault();
+    });
+
+    return newElement;
+}
+
+// Mapas de las hojas de miniaturas por documento (/thumbnails/<docId>)
+// y carga de cada hoja: la tira entera se carga con unas pocas imágenes
+const thumbnailMaps = {};
+const thumbnailSheets = {};
+
+function getThumbnailMap(docId) {
+    if (!(docId in thumbnailMaps)) {
+        thumbnailMaps[docId] = fetch(`/thumbnails/${docId}`)
+            .then(response => response.ok ? response.json() : null)
+            .catch(() => null);
+    }
+    return thumbnailMaps[docId];
+}
+
+function loadThumbnailSheet(url) {
+    if (!(url in thumbnailSheets)) {
+        thumbnailSheets[url] = new Promise(resolve => {
+            const sheet = new Image();
+            sheet.onload = () => resolve(true);
+            sheet.onerror = () => resolve(false);
+            sheet.src = url;
+        });
+    }
+    return thumbnailSheets[url];
+}
+
+function createThumbnailImage(pageInfo) {
+    const pageId = `${pageInfo.docId}_${pageInfo.pageNum}`;
+    const image = document.createElement('div');
+    image.className = 'thumb-image';
+    image.setAttribute('role', 'img');
+    image.setAttribute('aria-label', `Página ${pageInfo.pageNum + 1}`);
+
+    const showPageImage = () => {
+        // Sin hoja de miniaturas se usa la imagen de la página
+        const img = document.createElement('img');
+        img.src = pageImageSrc(pageId);
+        img.alt = `Página ${pageInfo.pageNum + 1}`;
+        image.replaceWith(img);
+    };
+
+    getThumbnailMap(pageInfo.docId).then(async map => {
+        const entry = map && map.pages[pageInfo.pageNum];
+        if (!entry) {
+            showPageImage();
+            return;
+        }
+        const sheet = map.sheets[entry.sheet];
+        const scale = Math.min(THUMB_IMAGE_WIDTH / entry.width, THUMB_IMAGE_HEIGHT / entry.height);
+        image.style.width = `${entry.width * scale}px`;
+        image.style.height = `${entry.height * scale}px`;
+        if (!await loadThumbnailSheet(sheet.url)) {
+            showPageImage();
+            return;
+        }
+        // Posición en porcentajes: no depende del tamaño en pantalla
+        const percent = (offset, size, sheetSize) =>
+            sheetSize > size ? `${offset / (sheetSize - size) * 100}%` : '0%';
+        Object.assign(image.style, {
+            backgroundImage: `url(${sheet.url})`,
+            backgroundSize: `${sheet.width / entry.width * 100}% ${sheet.height / entry.height * 100}%`,
+            backgroundPosition: `${percent(entry.x, entry.width, sheet.width)} ${percent(entry.y, entry.height, sheet.height)}`
+        });
+    });
+    return image;
+}
+
+// Tira de miniaturas virtualizada: solo están en el DOM las filas
+// visibles (más THUMB_OVERSCAN_ROWS por arriba y por abajo) y cada
+// imagen se carga cuando su miniatura entra en la tira. Los nodos se
+// reutilizan por pageId, así que reordenar o eliminar una página solo
+// toca los nodos afectados. Las medidas coinciden con el CSS.
+const THUMB_WIDTH = 150;
+const THUMB_HEIGHT = 210;
+const THUMB_GAP = 20;
+// Espacio para la imagen: sin el borde y el relleno de la miniatura
+const THUMB_IMAGE_WIDTH = THUMB_WIDTH - 26;
+const THUMB_IMAGE_HEIGHT = THUMB_HEIGHT - 26;
+const THUMB_OVERSCAN_ROWS = 2;
+
+const thumbnailNodes = new Map();  // pageId -> nodo
+const thumbnailPages = new WeakMap();  // nodo -> pageInfo
+let thumbnailsStart = 0;  // índice en pagesOrder del primer nodo
+let thumbnailsDragging = false;
+let thumbnailsFrame = null;
+
+const thumbnailLoader = new IntersectionObserver(entries => {
+    entries.forEach(entry => {
+        if (!entry.isIntersecting) return;
+        thumbnailLoader.unobserve(entry.target);
+        entry.target.appendChild(createThumbnailImage(thumbnailPages.get(entry.target)));
+    });
+}, { root: thumbnailsContainer, rootMargin: `${THUMB_HEIGHT}px 0px` });
+
+function createThumbnailNode(pageInfo) {
+    const pageId = `${pageInfo.docId}_${pageInfo.pageNum}`;
+    const thumbWrapper = document.createElement('div');
+    thumbWrapper.className = 'page-thumbnail';
+    thumbWrapper.setAttribute('data-page-id', pageId);
+    if (pageInfo.docId === currentDocumentId && pageInfo.pageNum === currentPageIndex) {
+        thumbWrapper.classList.add('selected-thumb');
+    }
+    thumbWrapper.addEventListener('click', () => {
+        displayPage(pageInfo.docId, pageInfo.pageNum);
+    });
+    thumbnailPages.set(thumbWrapper, pageInfo);
+    thumbnailLoader.observe(thumbWrapper);
+    return thumbWrapper;
+}
+
+function dropThumbnailNode(pageId) {
+    const node = thumbnailNodes.get(pageId);
+    if (node) {
+        thumbnailLoader.unobserve(node);
+        node.remove();
+        thumbnailNodes.delete(pageId);
+    }
+}
+
+function thumbnailColumns() {
+    return Math.max(1, Math.floor((thumbnailsList.clientWidth + THUMB_GAP) / (THUMB_WIDTH + THUMB_GAP)));
+}
+
+// Ajusta los nodos de la tira a las filas visibles
+function updateThumbnailWindow() {
+    if (thumbnailsDragging) return;
+    const order = uploadedPdfs.pagesOrder;
+    const columns = thumbnailColumns();
+    const rowHeight = THUMB_HEIGHT + THUMB_GAP;
+    const rows = Math.ceil(order.length / columns);
+    const scrollTop = thumbnailsContainer.scrollTop;
+    const firstRow = Math.max(0, Math.floor(scrollTop / rowHeight) - THUMB_OVERSCAN_ROWS);
+    const lastRow = Math.min(rows, Math.ceil((scrollTop + thumbnailsContainer.clientHeight) / rowHeight) + THUMB_OVERSCAN_ROWS);
+    const start = firstRow * columns;
+    const end = Math.min(order.length, lastRow * columns);
+
+    const visible = order.slice(start, end);
+    const visibleIds = new Set(visible.map(p => `${p.docId}_${p.pageNum}`));
+    Array.from(thumbnailNodes.keys()).forEach(pageId => {
+        if (!visibleIds.has(pageId)) dropThumbnailNode(pageId);
+    });
+
+    // Solo se mueven los nodos que no están ya en su sitio
+    let expected = thumbnailsList.firstChild;
+    visible.forEach(pageInfo => {
+        const pageId = `${pageInfo.docId}_${pageInfo.pageNum}`;
+        let node = thumbnailNodes.get(pageId);
+        if (!node) {
+            node = createThumbnailNode(pageInfo);
+            thumbnailNodes.set(pageId, node);
+        }
+        if (node === expected) {
+            expected = node.nextSibling;
+        } else {
+            thumbnailsList.insertBefore(node, expected);
+        }
+    });
+
+    thumbnailsStart = start;
+    thumbnailsList.style.paddingTop = `${firstRow * rowHeight}px`;
+    thumbnailsList.style.paddingBottom = `${Math.max(0, rows - lastRow) * rowHeight}px`;
+}
+
+function scheduleThumbnailWindow() {
+    if (thumbnailsFrame) return;
+    thumbnailsFrame = requestAnimationFrame(() => {
+        thumbnailsFrame = null;
+        updateThumbnailWindow();
+    });
+}
+
+thumbnailsContainer.addEventListener('scroll', scheduleThumbnailWindow);
+// También cuando cambia el ancho (columnas) o crece la tira
+new ResizeObserver(scheduleThumbnailWindow).observe(thumbnailsContainer);
+
+function removeThumbnail(pageId) {
+    dropThumbnailNode(pageId);
+    updateThumbnailWindow();
+}
+
+function clearThumbnails() {
+    Array.from(thumbnailNodes.keys()).forEach(dropThumbnailNode);
+    thumbnailsList.style.paddingTop = '';
+    thumbnailsList.style.paddingBottom = '';
+    thumbnailsContainer.scrollTop = 0;
+}
+
+function renderThumbnails() {
+    updateThumbnailWindow();
+
+    if (uploadedPdfs.pagesOrder.length > 0) {
+        const firstPageInfo = uploadedPdfs.pagesOrder[0];
+        displayPage(firstPageInfo.docId, firstPageInfo.pageNum);
+        downloadFinalPdfBtn.style.display = 'block';
+        resetFilesBtn.style.display = 'inline-block';
+    } else {
+        pageContainer.style.display = 'none';
+        downloadFinalPdfBtn.style.display = 'none';
+        resetFilesBtn.style.display = 'none';
+    }
+}
+
+// Los archivos a partir de este tamaño se suben por bloques reanudables
+const CHUNKED_UPLOAD_MIN_SIZE = 8 * 1024 * 1024;
+const PARALLEL_CHUNKS = 4;
+const CHUNK_RETRIES = 5;
+
+// Añade a la sesión las páginas devueltas por una carga
+function addUploadedPages(responseData) {
+    if (uploadedPdfs.pagesOrder.length === 0) {
+        uploadedPdfs = responseData;
+        editedElements = {};
+    } else {
+        Object.assign(uploadedPdfs.pagesData, responseData.pagesData);
+        Object.assign(uploadedPdfs.pagesType, responseData.pagesType);
+        uploadedPdfs.pagesOrder = uploadedPdfs.pagesOrder.concat(responseData.pagesOrder);
+    }
+
+    if (uploadedPdfs.pagesOrder.length > 0) {
+        renderThumbnails();
+        initSortable();
+    }
+}
+
+// Ejecuta una carga: send(jobId, controller) devuelve la respuesta del servidor.
+// Devuelve false si se canceló o falló.
+async function runUpload(send) {
+    const jobId = newJobId();
+    const controller = new AbortController();
+    showProgress(jobId, 'Subiendo...', controller);
+
+    try {
+        const response = await send(jobId, controller);
+        if (response.status === 499) {
+            return false;
+        }
+        const responseData = await response.json();
+        if (!response.ok) {
+            throw new Error(responseData.error || `Server responded with status ${response.status}`);
+        }
+        addUploadedPages(responseData);
+        return true;
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            alert(`Error al cargar el PDF: ${error.message}`);
+        }
+        return false;
+    } finally {
+        hideProgress(jobId);
+    }
+}
+
+// Ancho en píxeles con el que el servidor debe rasterizar las páginas:
+// el del editor en pantalla por la densidad de píxeles del dispositivo
+function renderWidth() {
+    const cssWidth = Math.min(pageContainer.clientWidth || 800, 800);
+    return Math.round(cssWidth * (window.devicePixelRatio || 1));
+}
+
+// Formatos de imagen que el navegador puede mostrar, para que el
+// servidor codifique las fotos y escaneos con pérdida (cabecera Accept)
+const PAGE_IMAGE_ACCEPT = ['application/json', 'image/png', 'image/jpeg']
+    .concat(document.createElement('canvas').toDataURL('image/webp').startsWith('data:image/webp')
+        ? ['image/webp'] : [])
+    .join(', ');
+
+function sendMultipartUpload(files, jobId, controller) {
+    const formData = new FormData();
+    for (const file of files) {
+        formData.append('pdf_files', file);
+    }
+    formData.append('job_id', jobId);
+    formData.append('render_width', renderWidth());
+    watchJob(jobId, 'Procesando páginas...', controller);
+
+    const endpoint = uploadedPdfs.pagesOrder.length === 0 ? '/upload' : '/add_pdfs';
+    return fetch(endpoint, {
+        method: 'POST',
+        headers: { 'Accept': PAGE_IMAGE_ACCEPT },
+        body: formData,
+        signal: controller.signal
+    });
+}
+
+// Bytes que se leen cada vez al calcular el SHA-256 de un archivo grande
+const HASH_SLICE_SIZE = 4 * 1024 * 1024;
+
+const SHA256_K = Int32Array.of(
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2);
+
+// SHA-256 incremental: crypto.subtle solo calcula el de un bloque de
+// memoria entero, y un escaneo de cientos de MB no debe leerse de una vez
+class Sha256 {
+    constructor() {
+        this.state = Int32Array.of(0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+                                    0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19);
+        this.block = new Uint8Array(64);
+        this.blockLength = 0;
+        this.length = 0;
+        this.w = new Int32Array(64);
+    }
+
+    update(bytes) {
+        this.length += bytes.length;
+        let offset = 0;
+        if (this.blockLength > 0) {
+            const taken = Math.min(64 - this.blockLength, bytes.length);
+            this.block.set(bytes.subarray(0, taken), this.blockLength);
+            this.blockLength += taken;
+            offset = taken;
+            if (this.blockLength < 64) {
+                return;
+            }
+            this.compress(this.block, 0);
+            this.blockLength = 0;
+        }
+        for (; offset + 64 <= bytes.length; offset += 64) {
+            this.compress(bytes, offset);
+        }
+        this.block.set(bytes.subarray(offset));
+        this.blockLength = bytes.length - offset;
+    }
+
+    compress(bytes, offset) {
+        const w = this.w, k = SHA256_K, state = this.state;
+        for (let i = 0; i < 16; i++, offset += 4) {
+            w[i] = (bytes[offset] << 24) | (bytes[offset + 1] << 16)
+                | (bytes[offset + 2] << 8) | bytes[offset + 3];
+        }
+        for (let i = 16; i < 64; i++) {
+            const x = w[i - 15], y = w[i - 2];
+            const s0 = ((x >>> 7) | (x << 25)) ^ ((x >>> 18) | (x << 14)) ^ (x >>> 3);
+            const s1 = ((y >>> 17) | (y << 15)) ^ ((y >>> 19) | (y << 13)) ^ (y >>> 10);
+            w[i] = (((w[i - 16] + s0) | 0) + ((w[i - 7] + s1) | 0)) | 0;
+        }
+        let a = state[0], b = state[1], c = state[2], d = state[3];
+        let e = state[4], f = state[5], g = state[6], h = state[7];
+        for (let i = 0; i < 64; i++) {
+            const s1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+            const t1 = (((((h + s1) | 0) + ((e & f) ^ (~e & g))) | 0) + ((k[i] + w[i]) | 0)) | 0;
+            const s0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+            const t2 = (s0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+            h = g; g = f; f = e; e = (d + t1) | 0;
+            d = c; c = b; b = a; a = (t1 + t2) | 0;
+        }
+        state[0] += a; state[1] += b; state[2] += c; state[3] += d;
+        state[4] += e; state[5] += f; state[6] += g; state[7] += h;
+    }
+
+    hex() {
+        const bits = this.length * 8;
+        const padding = new Uint8Array((this.blockLength < 56 ? 56 : 120) - this.blockLength + 8);
+        padding[0] = 0x80;
+        const view = new DataView(padding.buffer);
+        view.setUint32(padding.length - 8, Math.floor(bits / 2 ** 32));
+        view.setUint32(padding.length - 4, bits >>> 0);
+        this.update(padding);
+        return Array.from(this.state, word => (word >>> 0).toString(16).padStart(8, '0')).join('');
+    }
+}
+
+// SHA-256 del archivo en hexadecimal. Los archivos grandes se leen por
+// partes, como al subirlos por bloques, sin cargarlos enteros en memoria
+// (crypto.subtle, además, solo existe en contextos seguros)
+async function sha256Hex(file) {
+    if (file.size < CHUNKED_UPLOAD_MIN_SIZE && window.crypto && crypto.subtle) {
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+    }
+    const hash = new Sha256();
+    for (let offset = 0; offset < file.size; offset += HASH_SLICE_SIZE) {
+        hash.update(new Uint8Array(await file.slice(offset, offset + HASH_SLICE_SIZE).arrayBuffer()));
+    }
+    return hash.hex();
+}
+
+function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+// Sube un archivo grande en bloques paralelos. Los bloques que fallan se
+// reintentan y, si se recarga la página, la carga sigue donde se quedó.
+async function sendChunkedUpload(file, sha256, jobId, controller) {
+    const storageKey = `pdf-upload:${file.name}:${file.size}:${file.lastModified}`;
+    let upload = null;
+    const savedId = localStorage.getItem(storageKey);
+    if (savedId) {
+        const response = await fetch(`/uploads/${savedId}`, { signal: controller.signal });
+        if (response.ok) {
+            upload = await response.json();
+        }
+    }
+    if (!upload) {
+        loadingMessage.textContent = 'Preparando archivo...';
+        const response = await fetch('/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size, sha256: sha256 }),
+            signal: controller.signal
+        });
+        upload = await response.json();
+        if (!response.ok) {
+            throw new Error(upload.error || `Server responded with status ${response.status}`);
+        }
+        localStorage.setItem(storageKey, upload.id);
+    }
+
+    const chunks = [];
+    for (const [start, end] of upload.missing) {
+        for (let offset = start; offset < end; offset += upload.chunkSize) {
+            chunks.push([offset, Math.min(offset + upload.chunkSize, end)]);
+        }
+    }
+
+    let sent = upload.received;
+    const showSent = () => {
+        loadingMessage.textContent = `Subiendo ${file.name}...`;
+        loadingProgress.value = sent / file.size;
+        loadingDetails.textContent = `${formatBytes(sent)} / ${formatBytes(file.size)}`;
+    };
+    showSent();
+
+    async function sendChunk([start, end]) {
+        for (let attempt = 1; ; attempt++) {
+            let response = null;
+            try {
+                response = await fetch(`/uploads/${upload.id}?offset=${start}`, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/octet-stream' },
+                    body: file.slice(start, end),
+                    signal: controller.signal
+                });
+            } catch (error) {
+                if (error.name === 'AbortError' || attempt === CHUNK_RETRIES) {
+                    throw error;
+                }
+            }
+            if (response && response.ok) {
+                sent += end - start;
+                showSent();
+                return;
+            }
+            // Los errores del cliente (4xx) no se arreglan repitiendo el bloque
+            if (response && (response.status < 500 || attempt === CHUNK_RETRIES)) {
+                const error = await response.json().catch(() => ({}));
+                throw new Error(error.error || `Server responded with status ${response.status}`);
+            }
+            await sleep(1000 * 2 ** (attempt - 1));
+        }
+    }
+
+    const pending = chunks.slice();
+    await Promise.all(Array.from({ length: PARALLEL_CHUNKS }, async () => {
+        while (pending.length > 0) {
+            try {
+                await sendChunk(pending.shift());
+            } catch (error) {
+                pending.length = 0;  // no seguir subiendo si la carga ya falló
+                throw error;
+            }
+        }
+    }));
+
+    watchJob(jobId, 'Procesando páginas...', controller);
+    const response = await fetch(`/uploads/${upload.id}/complete`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': PAGE_IMAGE_ACCEPT },
+        body: JSON.stringify({ job_id: jobId, render_width: renderWidth() }),
+        signal: controller.signal
+    });
+    // Salvo que falten bloques, la carga ya no existe en el servidor
+    if (response.status !== 409) {
+        localStorage.removeItem(storageKey);
+    }
+    return response;
+}
+
+// Indica si el servidor ya tiene el documento con ese SHA-256
+async function documentExists(sha256) {
+    try {
+        return (await fetch(`/documents/${sha256}`, { method: 'HEAD' })).ok;
+    } catch (error) {
+        return false;
+    }
+}
+
+function attachDocument(sha256, jobId, controller) {
+    watchJob(jobId, 'Procesando páginas...', controller);
+    return fetch(`/documents/${sha256}/attach`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': PAGE_IMAGE_ACCEPT },
+        body: JSON.stringify({ job_id: jobId, render_width: renderWidth() }),
+        signal: controller.signal
+    });
+}
+
+// Sube los archivos en el orden elegido. Los que el servidor ya tiene
+// (por su SHA-256) se adjuntan sin subirlos; los pequeños se agrupan en
+// una sola petición y los grandes se suben por bloques.
+async function uploadFiles(files) {
+    let batch = [];
+    const sendBatch = async () => {
+        const smallFiles = batch;
+        batch = [];
+        return smallFiles.length === 0
+            || runUpload((jobId, controller) => sendMultipartUpload(smallFiles, jobId, controller));
+    };
+
+    for (const file of files) {
+        const sha256 = await sha256Hex(file);
+        if (sha256 && await documentExists(sha256)) {
+            if (!await sendBatch()
+                || !await runUpload((jobId, controller) => attachDocument(sha256, jobId, controller))) {
+                return;
+            }
+        } else if (file.size < CHUNKED_UPLOAD_MIN_SIZE) {
+            batch.push(file);
+        } else if (!await sendBatch()
+                   || !await runUpload((jobId, controller) => sendChunkedUpload(file, sha256, jobId, controller))) {
+            return;
+        }
+    }
+    await sendBatch();
+}
+
+pdfFilesInput.addEventListener('change', async function(e) {
+    const files = Array.from(e.target.files);
+    await uploadFiles(files);
+    e.target.value = '';
+});
+
+resetFilesBtn.addEventListener('click', function() {
+    uploadedPdfs = { pagesData: {}, pagesType: {}, pagesOrder: [] };
+    editedElements = {};
+    clearSearch();
+    redactions = [];
+    renderRedactions();
+    pageContainer.style.display = 'none';
+    clearThumbnails();
+    downloadFinalPdfBtn.style.display = 'none';
+    resetFilesBtn.style.display = 'none';
+    if (sortableInstance) {
+        sortableInstance.destroy();
+        sortableInstance = null;
+    }
+});
+
+document.getElementById('image-upload').addEventListener('change', function(e) {
+    const file = e.target.files[0];
+    if (!file || !currentDocumentId) return;
+
+    const reader = new FileReader();
+    reader.onload = function(e) {
+        const imageSrc = e.target.result;
+        const pageId = `${currentDocumentId}_${currentPageIndex}`;
+        editedElements[pageId] = editedElements[pageId] || [];
+
+        const newElementData = {
+            type: 'image',
+            x: 50, y: 50, width: 100, height: 100,
+            src: imageSrc,
+            element: null
+        };
+        editedElements[pageId].push(newElementData);
+        displayPage(currentDocumentId, currentPageIndex);
+    };
+    reader.readAsDataURL(file);
+});
+
+document.getElementById('add-rect-btn').addEventListener('click', function() {
+    if (!currentDocumentId) { alert('Sube un PDF primero.'); return; }
+    const fillColor = document.getElementById('fill-color').value;
+    const borderColor = document.getElementById('border-color').value;
+    const pageId = `${currentDocumentId}_${currentPageIndex}`;
+    editedElements[pageId] = editedElements[pageId] || [];
+
+    editedElements[pageId].push({
+        type: 'rect', x: 50, y: 50, width: 100, height: 50,
+        fillColor: fillColor, borderColor: borderColor, element: null
+    });
+    displayPage(currentDocumentId, currentPageIndex);
+});
+
+document.getElementById('add-circle-btn').addEventListener('click', function() {
+    if (!currentDocumentId) { alert('Sube un PDF primero.'); return; }
+    const fillColor = document.getElementById('fill-color').value;
+    const borderColor = document.getElementById('border-color').value;
+    const pageId = `${currentDocumentId}_${currentPageIndex}`;
+    editedElements[pageId] = editedElements[pageId] || [];
+
+    editedElements[pageId].push({
+        type: 'circle', x: 50, y: 50, width: 100, height: 100,
+        fillColor: fillColor, borderColor: borderColor, element: null
+    });
+    displayPage(currentDocumentId, currentPageIndex);
+});
+
+document.getElementById('add-text-btn').addEventListener('click', async function() {
+    if (!currentDocumentId) { alert('Sube un PDF primero.'); return; }
+    const textToAdd = document.getElementById('text-input').value;
+    if (!textToAdd) { alert('Escribe un texto para añadir.'); return; }
+
+    const pageId = `${currentDocumentId}_${currentPageIndex}`;
+    editedElements[pageId] = editedElements[pageId] || [];
+
+    const fontSize = parseInt(document.getElementById('font-size').value);
+    const fontColor = document.getElementById('font-color').value;
+
+    // Medir el texto para darle un ancho inicial
+    const tempDiv = document.createElement('div');
+    tempDiv.style.position = 'absolute';
+    tempDiv.style.visibility = 'hidden';
+    tempDiv.style.whiteSpace = 'pre';
+    tempDiv.style.fontFamily = 'Arial';
+    tempDiv.style.fontSize = `${fontSize}px`;
+    tempDiv.style.fontWeight = fontStyle.bold ? 'bold' : 'normal';
+    tempDiv.style.fontStyle = fontStyle.italic ? 'italic' : 'normal';
+    tempDiv.textContent = textToAdd;
+    document.body.appendChild(tempDiv);
+    const textWidth = tempDiv.offsetWidth + 10;
+    const textHeight = tempDiv.offsetHeight + 10;
+    document.body.removeChild(tempDiv);
+
+    editedElements[pageId].push({
+        type: 'text', text: textToAdd, x: 50, y: 50, width: textWidth, height: textHeight,
+        fontSize: fontSize,
+        fontColor: fontColor,
+        bold: fontStyle.bold, italic: fontStyle.italic, element: null
+    });
+    displayPage(currentDocumentId, currentPageIndex);
+});
+
+boldBtn.addEventListener('click', function() {
+    fontStyle.bold = !fontStyle.bold;
+    boldBtn.style.backgroundColor = fontStyle.bold ? 'var(--super-saiyan-yellow)' : 'var(--dragon-orange)';
+});
+
+italicBtn.addEventListener('click', function() {
+    fontStyle.italic = !fontStyle.italic;
+    italicBtn.style.backgroundColor = fontStyle.italic ? 'var(--super-saiyan-yellow)' : 'var(--dragon-orange)';
+});
+
+document.getElementById('delete-element-btn').addEventListener('click', function() {
+    if (!selectedElement) {
+        alert('Selecciona un elemento para eliminar.');
+        return;
+    }
+    const pageId = `${currentDocumentId}_${currentPageIndex}`;
+    const elementDataIndex = (editedElements[pageId] || []).findIndex(
+        data => data.element === selectedElement
+    );
+    if (elementDataIndex > -1) {
+        editedElements[pageId].splice(elementDataIndex, 1);
+        selectedElement = null;
+        displayPage(currentDocumentId, currentPageIndex);
+    }
+});
+
+// Visor de ampliación: la página se compone de teselas del servidor
+// (/pages/<id>/tiles) y solo se piden y se conservan las visibles
+const zoomViewer = document.getElementById('zoom-viewer');
+const zoomViewport = document.getElementById('zoom-viewport');
+const zoomLevelLabel = document.getElementById('zoom-level');
+const tileInfoCache = {};
+let zoomView = null;
+
+function getTileInfo(pageId) {
+    if (!(pageId in tileInfoCache)) {
+        tileInfoCache[pageId] = fetch(`/pages/${pageId}/tiles`)
+            .then(response => response.ok ? response.json() : null)
+            .catch(() => null);
+    }
+    return tileInfoCache[pageId];
+}
+
+async function openZoomViewer(pageId) {
+    const info = await getTileInfo(pageId);
+    if (!info) {
+        alert('No se puede ampliar esta página.');
+        return;
+    }
+    zoomViewer.classList.add('visible');
+    zoomViewport.innerHTML = '';
+
+    // Imagen del editor como fondo mientras llegan las teselas
+    const preview = document.createElement('img');
+    preview.src = pageImageSrc(pageId);
+    zoomViewport.appendChild(preview);
+
+    const fitScale = Math.min(zoomViewport.clientWidth / info.width,
+                              zoomViewport.clientHeight / info.height);
+    const longSide = Math.max(info.width, info.height);
+    zoomView = {
+        pageId, info, preview, fitScale,
+        // Sin sobrepasar la resolución del nivel más profundo
+        maxScale: info.tileSize * 2 ** info.maxLevel / longSide / (window.devicePixelRatio || 1),
+        scale: fitScale,
+        offsetX: (zoomViewport.clientWidth - info.width * fitScale) / 2,
+        offsetY: (zoomViewport.clientHeight - info.height * fitScale) / 2,
+        tiles: new Map(),
+        frame: null
+    };
+    updateZoomView();
+}
+
+function closeZoomViewer() {
+    zoomViewer.classList.remove('visible');
+    zoomViewport.innerHTML = '';
+    zoomView = null;
+}
+
+function updateZoomView() {
+    if (!zoomView || zoomView.frame) return;
+    zoomView.frame = requestAnimationFrame(() => {
+        zoomView.frame = null;
+        layoutTiles();
+    });
+}
+
+function layoutTiles() {
+    const view = zoomView;
+    const { info, scale, offsetX, offsetY } = view;
+    Object.assign(view.preview.style, {
+        left: `${offsetX}px`,
+        top: `${offsetY}px`,
+        width: `${info.width * scale}px`,
+        height: `${info.height * scale}px`
+    });
+    zoomLevelLabel.textContent = `${Math.round(scale / view.fitScale * 100)}%`;
+
+    // Nivel con al menos un píxel de tesela por píxel de pantalla
+    const longSide = Math.max(info.width, info.height);
+    const devicePixels = longSide * scale * (window.devicePixelRatio || 1);
+    const level = Math.min(info.maxLevel, Math.max(0,
+        Math.ceil(Math.log2(devicePixels / info.tileSize))));
+    const side = longSide / 2 ** level;  // puntos por tesela
+
+    const left = Math.max(0, -offsetX / scale);
+    const top = Math.max(0, -offsetY / scale);
+    const right = Math.min(info.width, (zoomViewport.clientWidth - offsetX) / scale);
+    const bottom = Math.min(info.height, (zoomViewport.clientHeight - offsetY) / scale);
+
+    const visible = new Set();
+    for (let y = Math.floor(top / side); y * side < bottom; y++) {
+        for (let x = Math.floor(left / side); x * side < right; x++) {
+            const key = `${level}/${x}/${y}`;
+            visible.add(key);
+            let tile = view.tiles.get(key);
+            if (!tile) {
+                tile = document.createElement('img');
+                tile.src = `/pages/${view.pageId}/tiles/${key}`;
+                zoomViewport.appendChild(tile);
+                view.tiles.set(key, tile);
+            }
+            Object.assign(tile.style, {
+                left: `${offsetX + x * side * scale}px`,
+                top: `${offsetY + y * side * scale}px`,
+                width: `${Math.min(side, info.width - x * side) * scale}px`,
+                height: `${Math.min(side, info.height - y * side) * scale}px`
+            });
+        }
+    }
+    // Las teselas que ya no se ven se descartan: la memoria no crece
+    // con el aumento ni con el tamaño de la página
+    view.tiles.forEach((tile, key) => {
+        if (!visible.has(key)) {
+            tile.remove();
+            view.tiles.delete(key);
+        }
+    });
+}
+
+function zoomAt(factor, clientX, clientY) {
+    const view = zoomView;
+    const box = zoomViewport.getBoundingClientRect();
+    const x = clientX - box.left;
+    const y = clientY - box.top;
+    const scale = Math.min(view.maxScale, Math.max(view.fitScale / 2, view.scale * factor));
+    view.offsetX = x - (x - view.offsetX) * scale / view.scale;
+    view.offsetY = y - (y - view.offsetY) * scale / view.scale;
+    view.scale = scale;
+    updateZoomView();
+}
+
+function zoomAtCenter(factor) {
+    const box = zoomViewport.getBoundingClientRect();
+    zoomAt(factor, box.left + box.width / 2, box.top + box.height / 2);
+}
+
+zoomViewport.addEventListener('wheel', function(e) {
+    e.preventDefault();
+    zoomAt(Math.exp(-e.deltaY / 300), e.clientX, e.clientY);
+}, { passive: false });
+
+let zoomPan = null;
+zoomViewport.addEventListener('pointerdown', function(e) {
+    zoomPan = { x: e.clientX, y: e.clientY };
+    zoomViewport.setPointerCapture(e.pointerId);
+});
+zoomViewport.addEventListener('pointermove', function(e) {
+    if (!zoomPan || !zoomView) return;
+    zoomView.offsetX += e.clientX - zoomPan.x;
+    zoomView.offsetY += e.clientY - zoomPan.y;
+    zoomPan = { x: e.clientX, y: e.clientY };
+    updateZoomView();
+});
+zoomViewport.addEventListener('pointerup', function() {
+    zoomPan = null;
+});
+
+document.getElementById('zoom-in-btn').addEventListener('click', () => zoomAtCenter(2));
+document.getElementById('zoom-out-btn').addEventListener('click', () => zoomAtCenter(0.5));
+document.getElementById('zoom-close-btn').addEventListener('click', closeZoomViewer);
+document.addEventListener('keydown', function(e) {
+    if (e.key === 'Escape' && zoomView) closeZoomViewer();
+});
+window.addEventListener('resize', updateZoomView);
+
+document.getElementById('zoom-page-btn').addEventListener('click', function() {
+    if (!currentDocumentId) {
+        alert('Sube un PDF primero.');
+        return;
+    }
+    openZoomViewer(`${currentDocumentId}_${currentPageIndex}`);
+});
+
+document.getElementById('delete-page-btn').addEventListener('click', function() {
+    const pageIdToDelete = `${currentDocumentId}_${currentPageIndex}`;
+    const pageIndexInOrder = uploadedPdfs.pagesOrder.findIndex(p => `${p.docId}_${p.pageNum}` === pageIdToDelete);
+
+    if (pageIndexInOrder > -1) {
+        uploadedPdfs.pagesOrder.splice(pageIndexInOrder, 1);
+
+        delete editedElements[pageIdToDelete];
+        delete uploadedPdfs.pagesData[pageIdToDelete];
+        delete uploadedPdfs.pagesType[pageIdToDelete];
+
+        const newPageIndex = Math.min(pageIndexInOrder, uploadedPdfs.pagesOrder.length - 1);
+
+        if (uploadedPdfs.pagesOrder.length > 0) {
+            const newPageInfo = uploadedPdfs.pagesOrder[newPageIndex];
+            displayPage(newPageInfo.docId, newPageInfo.pageNum);
+        } else {
+            pageContainer.style.display = 'none';
+            downloadFinalPdfBtn.style.display = 'none';
+            resetFilesBtn.style.display = 'none';
+        }
+
+        removeThumbnail(pageIdToDelete);
+    } else {
+        alert('No se puede eliminar la página seleccionada.');
+    }
+});
+
+// Envía solo los datos necesarios para la exportación
+function serializeEdits() {
+    const allElementsData = {};
+    for (const pageId in editedElements) {
+        if (editedElements[pageId].length > 0) {
+            allElementsData[pageId] = editedElements[pageId].map(element => ({
+                type: element.type,
+                x: element.x,
+                y: element.y,
+                width: element.width,
+                height: element.height,
+                text: element.text,
+                fontSize: element.fontSize,
+                fontColor: element.fontColor,
+                bold: element.bold,
+                italic: element.italic,
+                src: element.src,
+                fillColor: element.fillColor,
+                borderColor: element.borderColor
+            }));
+        }
+    }
+    return allElementsData;
+}
+
+function downloadBlob(blob, filename) {
+    const url = URL.createObjectURL(blob);
+    const a = document.createElement('a');
+    a.href = url;
+    a.download = filename;
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
+    URL.revokeObjectURL(url);
+}
+
+function newJobId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, c => {
+        const r = Math.random() * 16 | 0;
+        return (c === 'x' ? r : (r & 0x3 | 0x8)).toString(16);
+    });
+}
+
+function formatBytes(bytes) {
+    if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(0)} KB`;
+    return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+}
+
+// Muestra la capa de progreso y la actualiza con los eventos SSE del trabajo.
+// Devuelve una promesa con el estado final (done, error o cancelled).
+function watchJob(jobId, message, controller = null) {
+    showProgress(jobId, message, controller);
+
+    return new Promise(resolve => {
+        const events = new EventSource(`/jobs/${jobId}/events`);
+        events.addEventListener('progress', e => {
+            const job = JSON.parse(e.data);
+            if (job.total > 0) {
+                loadingProgress.value = job.done / job.total;
+                let details = `${job.done} / ${job.total} páginas · ${formatBytes(job.bytesWritten)}`;
+                if (job.eta !== null) {
+                    details += ` · quedan ${Math.ceil(job.eta)} s`;
+                }
+                loadingDetails.textContent = details;
+            }
+            if (['done', 'error', 'cancelled'].includes(job.status)) {
+                events.close();
+                resolve(job);
+            }
+        });
+        events.onerror = () => {
+            // 404 o conexión cerrada: el que inició el trabajo decide
+            if (events.readyState === EventSource.CLOSED) {
+                resolve(null);
+            }
+        };
+    });
+}
+
+function showProgress(jobId, message, controller = null) {
+    activeJob = { id: jobId, controller: controller };
+    loadingMessage.textContent = message;
+    loadingProgress.removeAttribute('value');
+    loadingDetails.textContent = '';
+    loadingOverlay.classList.add('visible');
+}
+
+function hideProgress(jobId) {
+    if (activeJob && activeJob.id === jobId) {
+        activeJob = null;
+        loadingOverlay.classList.remove('visible');
+    }
+}
+
+document.getElementById('loading-cancel-btn').addEventListener('click', function() {
+    if (!activeJob) return;
+    fetch(`/jobs/${activeJob.id}`, { method: 'DELETE' });
+    if (activeJob.controller) {
+        activeJob.controller.abort();
+    }
+    hideProgress(activeJob.id);
+});
+
+// Al cerrar la pestaña el servidor no debe terminar un trabajo que nadie descargará
+window.addEventListener('pagehide', function() {
+    if (activeJob) {
+        navigator.sendBeacon(`/jobs/${activeJob.id}/cancel`);
+    }
+});
+
+// Encola la exportación en /jobs y sigue su progreso hasta que termine.
+// Devuelve null si el usuario la cancela.
+async function runExportJob(payload, message) {
+    const response = await fetch('/jobs', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    });
+    const job = await response.json();
+    if (!response.ok) {
+        throw new Error(job.error || `Server responded with status ${response.status}`);
+    }
+
+    try {
+        let finalJob = await watchJob(job.id, message);
+        if (finalJob === null) {
+            finalJob = await (await fetch(`/jobs/${job.id}`)).json();
+        }
+        if (finalJob.status === 'cancelled' || !activeJob) {
+            return null;
+        }
+        if (finalJob.status !== 'done') {
+            throw new Error(finalJob.error || 'El trabajo no terminó');
+        }
+
+        const resultResponse = await fetch(finalJob.resultUrl);
+        if (!resultResponse.ok) {
+            throw new Error(await resultResponse.text());
+        }
+        return resultResponse.blob();
+    } finally {
+        hideProgress(job.id);
+    }
+}
+
+document.getElementById('download-final-pdf-btn').addEventListener('click', async function() {
+    if (uploadedPdfs.pagesOrder.length === 0) {
+        alert('No hay páginas para descargar.');
+        return;
+    }
+
+    try {
+        const blob = await runExportJob({
+            kind: 'final',
+            pages_order: uploadedPdfs.pagesOrder,
+            all_elements_data: serializeEdits(),
+            redactions: redactions
+        }, 'Generando el PDF final...');
+        if (!blob) return;
+        downloadBlob(blob, 'documento_final.pdf');
+        alert('PDF descargado con éxito.');
+    } catch (error) {
+        alert(`Error al descargar el PDF: ${error.message}`);
+    }
+});
+
+document.getElementById('extract-pages-btn').addEventListener('click', async function() {
+    const pagesInput = document.getElementById('extract-pages-input').value;
+    const pages = parsePageRanges(pagesInput);
+
+    if (pages.length === 0) {
+        alert('Formato de páginas no válido. Usa "1, 3, 5-8".');
+        return;
+    }
+
+    try {
+        const blob = await runExportJob({
+            kind: 'extract',
+            pages: pages,
+            pages_order: uploadedPdfs.pagesOrder,
+            all_elements_data: serializeEdits(),
+            redactions: redactions
+        }, 'Extrayendo páginas...');
+        if (!blob) return;
+        downloadBlob(blob, 'documento_extraido.pdf');
+        alert('Páginas extraídas y descargadas con éxito.');
+    } catch (error) {
+        alert(`Error al extraer las páginas: ${error.message}`);
+    }
+});
+
+document.getElementById('split-all-btn').addEventListener('click', async function() {
+    if (uploadedPdfs.pagesOrder.length === 0) { alert('Sube un PDF primero.'); return; }
+
+    try {
+        const blob = await runExportJob({
+            kind: 'split',
+            pages_order: uploadedPdfs.pagesOrder,
+            all_elements_data: serializeEdits(),
+            redactions: redactions
+        }, 'Dividiendo páginas...');
+        if (!blob) return;
+        downloadBlob(blob, 'paginas_separadas.zip');
+        alert('PDF dividido y descargado con éxito.');
+    } catch (error) {
+        alert(`Error al dividir todas las páginas: ${error.message}`);
+    }
+});
+
+function parsePageRanges(input) {
+    const parts = input.split(',').map(s => s.trim()).filter(s => s.length > 0);
+    let pages = [];
+    parts.forEach(part => {
+        if (part.includes('-')) {
+            const [start, end] = part.split('-').map(Number);
+            if (!isNaN(start) && !isNaN(end) && start <= end) {
+                for (let i = start; i <= end; i++) {
+                    pages.push(i);
+                }
+            }
+        } else {
+            const pageNum = Number(part);
+            if (!isNaN(pageNum)) {
+                pages.push(pageNum);
+            }
+        }
+    });
+    return [...new Set(pages)].sort((a, b) => a - b);
+}
+
+function selectElement(element) {
+    if (selectedElement && selectedElement !== element) {
+        selectedElement.classList.remove('selected');
+    }
+    selectedElement = element;
+    selectedElement.classList.add('selected');
+}
+
+pageContainer.addEventListener('click', function(e) {
+    if (selectedElement && !e.target.closest('.added-element')) {
+        selectedElement.classList.remove('selected');
+        selectedElement = null;
+    }
+});
+
+document.addEventListener('mousemove', function(e) {
+    if (!draggedElement) return;
+
+    const pageContainerRect = pageContainer.getBoundingClientRect();
+
+    if (isResizing) {
+        const newWidth = Math.max(10, e.clientX - startX + startWidth);
+        const newHeight = Math.max(10, e.clientY - startY + startHeight);
+
+        updateElementPositionAndSize(
+            draggedElement,
+            startLeft,
+            startTop,
+            newWidth,
+            newHeight
+        );
+    } else if (isDragging) {
+        const newLeft = e.clientX - startX + startLeft;
+        const newTop = e.clientY - startY + startTop;
+
+        updateElementPositionAndSize(
+            draggedElement,
+            newLeft,
+            newTop,
+            draggedElement.offsetWidth,
+            draggedElement.offsetHeight
+        );
+    }
+});
+
+document.addEventListener('mouseup', function() {
+    isDragging = false;
+    isResizing = false;
+    draggedElement = null;
+});
+
+// Búsqueda de texto: el servidor indexa el texto de cada documento al
+// cargarlo y devuelve las páginas con coincidencias y sus rectángulos (en
+// puntos), que se resaltan sobre la página como porcentajes de su tamaño
+let searchHits = {};  // pageId -> { width, height, hits }
+const SEARCH_RETRY_MS = 1000;
+
+function drawSearchHits() {
+    pageContainer.querySelectorAll('.search-hit').forEach(mark => mark.remove());
+    const result = searchHits[`${currentDocumentId}_${currentPageIndex}`];
+    if (!result) return;
+    result.hits.forEach(hit => {
+        hit.forEach(([x0, y0, x1, y1]) => {
+            const mark = document.createElement('div');
+            mark.className = 'search-hit';
+            Object.assign(mark.style, {
+                left: `${x0 / result.width * 100}%`,
+                top: `${y0 / result.height * 100}%`,
+                width: `${(x1 - x0) / result.width * 100}%`,
+                height: `${(y1 - y0) / result.height * 100}%`
+            });
+            pageContainer.appendChild(mark);
+        });
+    });
+}
+
+function clearSearch() {
+    searchHits = {};
+    searchResults.innerHTML = '';
+    searchResults.style.display = 'none';
+    drawSearchHits();
+}
+
+function addSearchNote(text) {
+    const note = document.createElement('p');
+    note.textContent = text;
+    searchResults.appendChild(note);
+}
+
+async function runSearch() {
+    const query = searchInput.value.trim();
+    if (!query || uploadedPdfs.pagesOrder.length === 0) {
+        clearSearch();
+        return;
+    }
+    const params = new URLSearchParams({ q: query });
+    new Set(uploadedPdfs.pagesOrder.map(p => p.docId)).forEach(docId => params.append('doc', docId));
+
+    let data;
+    try {
+        const response = await fetch(`/search?${params}`);
+        data = await response.json();
+        if (!response.ok) throw new Error(data.error || 'Error en la búsqueda.');
+    } catch (error) {
+        alert(error.message);
+        return;
+    }
+    // Se escribió otra búsqueda mientras tanto
+    if (searchInput.value.trim() !== query) return;
+
+    // Las páginas se numeran según el orden actual de la sesión
+    const positions = new Map(uploadedPdfs.pagesOrder.map((p, i) => [`${p.docId}_${p.pageNum}`, i]));
+    const results = data.results
+        .filter(result => positions.has(`${result.docId}_${result.pageNum}`))
+        .sort((a, b) => positions.get(`${a.docId}_${a.pageNum}`) - positions.get(`${b.docId}_${b.pageNum}`));
+
+    clearSearch();
+    results.forEach(result => {
+        const pageId = `${result.docId}_${result.pageNum}`;
+        searchHits[pageId] = result;
+        const item = document.createElement('button');
+        item.className = 'search-result';
+        const count = result.hits.length;
+        item.textContent = `Página ${positions.get(pageId) + 1}: ${count} ${count === 1 ? 'coincidencia' : 'coincidencias'}`;
+        item.addEventListener('click', () => {
+            if (pageId in uploadedPdfs.pagesData) {
+                displayPage(result.docId, result.pageNum);
+            }
+        });
+        searchResults.appendChild(item);
+    });
+    if (results.length === 0 && data.pending.length === 0) {
+        addSearchNote('Sin coincidencias.');
+    }
+    if (data.truncated) {
+        addSearchNote('Se muestran solo las primeras páginas con coincidencias.');
+    }
+    if (data.pending.length > 0) {
+        addSearchNote('Aún se está leyendo el texto de algún documento; la búsqueda se actualizará.');
+        setTimeout(() => {
+            if (searchInput.value.trim() === query) runSearch();
+        }, SEARCH_RETRY_MS);
+    }
+    searchResults.style.display = 'block';
+    drawSearchHits();
+}
+
+document.getElementById('search-btn').addEventListener('click', runSearch);
+searchInput.addEventListener('keydown', function(e) {
+    if (e.key === 'Enter') runSearch();
+});
+
+// Tachados: los textos de la lista se buscan en todas las páginas al
+// exportar y se eliminan del PDF, no solo se cubren (ver redaction_rects)
+let redactions = [];  // [{ term, regex }]
+
+function renderRedactions() {
+    redactionList.innerHTML = '';
+    redactions.forEach((redaction, index) => {
+        const item = document.createElement('button');
+        item.className = 'redaction';
+        item.title = 'Quitar de la lista';
+        item.textContent = `Tachar ${redaction.regex ? `/${redaction.term}/` : `"${redaction.term}"`} ✕`;
+        item.addEventListener('click', () => {
+            redactions.splice(index, 1);
+            renderRedactions();
+        });
+        redactionList.appendChild(item);
+    });
+    redactionList.style.display = redactions.length > 0 ? 'block' : 'none';
+}
+
+document.getElementById('redact-btn').addEventListener('click', function() {
+    const term = searchInput.value.trim();
+    const regex = document.getElementById('redact-regex').checked;
+    if (!term) {
+        alert('Escribe en el buscador el texto a tachar.');
+        return;
+    }
+    if (regex) {
+        try {
+            new RegExp(term);
+        } catch (error) {
+            alert(`Expresión regular no válida: ${error.message}`);
+            return;
+        }
+    }
+    if (!redactions.some(r => r.term === term && r.regex === regex)) {
+        redactions.push({ term, regex });
+        renderRedactions();
+    }
+});
+
+// Inicializar el renderizado si hay algo en el historial de navegación
+window.onload = function() {
+    if (uploadedPdfs.pagesOrder.length > 0) {
+        renderThumbnails();
+    }
+};
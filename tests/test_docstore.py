@@ -0,0 +1,123 @@
+"""Vida de los documentos del almacén (docstore.py): alias y referencias."""
+import hashlib
+import io
+import os
+from multiprocessing import shared_memory
+
+import pytest
+
+import docstore
+
+PDF = b'%PDF-1.4 uno'
+OTHER = b'%PDF-1.4 dos'
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = docstore.DocumentStore(str(tmp_path / 'spool'))
+    yield store
+    store.close()
+
+
+def spooled_files(store):
+    return sorted(name for name in os.listdir(store.spool_dir)
+                  if name.endswith('.pdf'))
+
+
+def segment_exists(handle):
+    try:
+        shared_memory.SharedMemory(name=handle[1]).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def test_put_shares_the_segment_between_aliases(store):
+    sha256 = store.put('a', PDF)
+    assert sha256 == hashlib.sha256(PDF).hexdigest()
+    assert store.put('b', PDF) == sha256
+    with store.lease('a', 'b') as handles:
+        assert handles['a'] == handles['b']
+        handle = handles['a']
+    assert store.find(sha256) == len(PDF)
+    assert store.sha256('b') == sha256
+
+    store.discard('a')
+    assert 'a' not in store and 'b' in store
+    assert segment_exists(handle)
+    store.discard('b')
+    assert store.find(sha256) is None
+    assert not segment_exists(handle)
+
+
+def test_spooled_file_is_removed_with_its_last_alias(store):
+    sha256 = store.spool('a', io.BytesIO(PDF))
+    assert spooled_files(store) == [f"{sha256}.pdf"]
+    # Una subida igual no ocupa más espacio
+    assert store.spool('b', io.BytesIO(PDF)) == sha256
+    assert spooled_files(store) == [f"{sha256}.pdf"]
+
+    store.discard('a')
+    assert spooled_files(store) == [f"{sha256}.pdf"]
+    store.discard('b')
+    assert spooled_files(store) == []
+
+
+def test_lease_keeps_discarded_documents_until_it_ends(store):
+    sha256 = store.spool('a', io.BytesIO(PDF))
+    with store.lease('a', 'desconocido') as handles:
+        assert list(handles) == ['a']
+        store.discard('a')
+        assert 'a' not in store
+        with open(handles['a'][1], 'rb') as leased:
+            assert leased.read() == PDF
+    assert spooled_files(store) == []
+    assert store.find(sha256) is None
+
+
+def test_reusing_a_doc_id_releases_the_previous_content(store):
+    first = store.put('a', PDF)
+    with store.lease('a') as handles:
+        handle = handles['a']
+    second = store.put('a', OTHER)
+    assert store.sha256('a') == second
+    assert store.find(first) is None
+    assert not segment_exists(handle)
+    assert len(store) == 1
+
+
+def test_attach_only_knows_stored_content(store):
+    assert not store.attach('a', hashlib.sha256(PDF).hexdigest())
+    sha256 = store.put('a', PDF)
+    assert store.attach('b', sha256)
+    store.discard('a')
+    with store.lease('b') as handles:
+        assert segment_exists(handles['b'])
+
+
+def test_add_path_never_deletes_the_callers_file(store, tmp_path):
+    path = tmp_path / 'propio.pdf'
+    path.write_bytes(PDF)
+    sha256 = store.add_path('a', str(path))
+    assert sha256 == hashlib.sha256(PDF).hexdigest()
+    with store.lease('a') as handles:
+        assert handles['a'] == ('file', str(path), len(PDF))
+    store.discard('a')
+    assert path.read_bytes() == PDF
+    assert store.find(sha256) is None
+
+
+def test_copy_to(store, tmp_path):
+    store.put('a', PDF)
+    store.spool('b', io.BytesIO(OTHER))
+    store.copy_to('a', str(tmp_path / 'a.pdf'))
+    store.copy_to('b', str(tmp_path / 'b.pdf'))
+    assert (tmp_path / 'a.pdf').read_bytes() == PDF
+    assert (tmp_path / 'b.pdf').read_bytes() == OTHER
+
+
+def test_close_removes_a_temporary_spool_dir():
+    store = docstore.DocumentStore()
+    store.spool('a', io.BytesIO(PDF))
+    store.close()
+    assert not os.path.exists(store.spool_dir)
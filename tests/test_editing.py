@@ -0,0 +1,87 @@
+"""Guardado incremental de las ediciones (editing.incremental_update)."""
+import fitz
+import pytest
+
+import editing
+
+TEXT = {
+    'type': 'text',
+    'x': 100,
+    'y': 100,
+    'width': 300,
+    'height': 50,
+    'text': 'Firmado',
+    'fontSize': 20,
+    'fontColor': '#000000',
+}
+RECT = {
+    'type': 'rect',
+    'x': 100,
+    'y': 300,
+    'width': 200,
+    'height': 100,
+    'fillColor': '#ff0000',
+    'borderColor': '#000000',
+}
+
+
+def original_pdf(pages=3):
+    document = fitz.open()
+    for page_num in range(pages):
+        document.new_page(width=595, height=842).insert_text(
+            (72, 72), f'Página {page_num + 1}')
+    return document.tobytes()
+
+
+@pytest.fixture(params=['stream', 'fichero'])
+def opened(request, tmp_path):
+    """El original abierto desde memoria o desde un fichero, y sus bytes."""
+    data = original_pdf()
+    if request.param == 'stream':
+        document = fitz.open(stream=data, filetype='pdf')
+    else:
+        path = tmp_path / 'original.pdf'
+        path.write_bytes(data)
+        document = fitz.open(str(path))
+    yield document, data
+    document.close()
+
+
+def test_incremental_update_keeps_the_original_bytes_as_prefix(opened,
+                                                              tmp_path):
+    document, data = opened
+    output_path = str(tmp_path / 'editado.pdf')
+    assert editing.incremental_update(document, [(1, [TEXT, RECT])],
+                                      output_path) == output_path
+    with open(output_path, 'rb') as output_file:
+        output = output_file.read()
+    assert output.startswith(data)
+    assert len(output) > len(data)
+
+    edited = fitz.open(output_path)
+    assert edited.page_count == 3
+    assert 'Firmado' in edited[1].get_text()
+    assert 'Firmado' not in edited[0].get_text()
+    edited.close()
+
+
+def test_incremental_update_leaves_the_source_document_alone(opened,
+                                                             tmp_path):
+    document, _ = opened
+    editing.incremental_update(document, [(0, [TEXT])],
+                               str(tmp_path / 'editado.pdf'))
+    assert 'Firmado' not in document[0].get_text()
+
+
+def test_repaired_documents_are_not_updated_incrementally(tmp_path):
+    data = original_pdf()
+    # Un desplazamiento de xref erróneo obliga a MuPDF a reparar el fichero
+    start = data.rindex(b'startxref') + len(b'startxref')
+    broken = data[:start] + b'\n1\n%%EOF\n'
+    document = fitz.open(stream=broken, filetype='pdf')
+    try:
+        assert editing.incremental_update(document, [(0, [TEXT])],
+                                          str(tmp_path /
+                                              'editado.pdf')) is None
+    finally:
+        document.close()
@@ -0,0 +1,131 @@
+"""Cola de trabajos (jobs.py): cancelación y caducidad de los terminados."""
+import threading
+import time
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def make_manager():
+    managers = []
+
+    def make(**options):
+        manager = jobs.JobManager(**options)
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.close()
+
+
+def wait_finished(job, timeout=5):
+    deadline = time.time() + timeout
+    version = job.version
+    while not job.finished and time.time() < deadline:
+        version = job.wait_for_update(version, timeout=0.1)
+    assert job.finished
+
+
+def test_submit_runs_the_job_and_keeps_its_result(make_manager):
+    manager = make_manager()
+    job = manager.submit('final', lambda value, job: value * 2, 21)
+    wait_finished(job)
+    assert job.status == 'done' and job.result == 42
+    assert manager.get(job.id) is job
+
+
+def test_a_failing_job_keeps_the_error_status(make_manager):
+    manager = make_manager()
+
+    def fail(job):
+        error = ValueError('mal')
+        error.status = 422
+        raise error
+
+    job = manager.submit('final', fail)
+    wait_finished(job)
+    assert (job.status, job.error, job.error_status) == ('error', 'mal', 422)
+
+
+def test_cancel_stops_the_job_at_the_next_page(make_manager):
+    manager = make_manager()
+    started = threading.Event()
+    pages = []
+
+    def export(job):
+        job.start(100)
+        started.set()
+        for page in range(100):
+            pages.append(page)
+            time.sleep(0.01)
+            job.advance()
+
+    job = manager.submit('final', export)
+    assert started.wait(5)
+    job.cancel()
+    wait_finished(job)
+    assert job.status == 'cancelled'
+    assert len(pages) < 100
+
+
+def test_cancel_probe_cancels_the_job():
+    job = jobs.Job('final')
+    disconnected = []
+    job.add_cancel_probe(lambda: bool(disconnected))
+    job.check()
+    disconnected.append(True)
+    with pytest.raises(jobs.JobCancelled):
+        job.check()
+    assert job.cancel_requested
+
+
+def test_finished_jobs_expire_when_the_manager_is_used(make_manager):
+    expired = []
+    manager = make_manager(ttl=0.05, on_expire=expired.append,
+                           sweep_interval=3600)
+    job = manager.submit('final', lambda job: 'resultado')
+    wait_finished(job)
+    assert manager.get(job.id) is job
+    time.sleep(0.1)
+    assert manager.get(job.id) is None
+    assert expired == [job]
+
+
+def test_pending_jobs_do_not_expire(make_manager):
+    manager = make_manager(ttl=0)
+    job = manager.track('upload', 'carga')
+    assert manager.get('carga') is job
+    assert manager.track('upload', 'carga') is None
+
+
+def test_finished_jobs_expire_on_an_idle_server(make_manager):
+    expired = threading.Event()
+    manager = make_manager(ttl=0.05, on_expire=lambda job: expired.set(),
+                           sweep_interval=0.05)
+    job = manager.track('upload', 'carga')
+    job.finish(None)
+    # Nadie vuelve a usar el gestor: lo descarta el hilo de limpieza
+    assert expired.wait(5)
+
+
+def test_close_stops_the_sweeper(make_manager):
+    expired = []
+    manager = make_manager(ttl=0, on_expire=expired.append,
+                           sweep_interval=0.05)
+    manager.close()
+    time.sleep(0.1)
+    manager.track('upload', 'carga').finish(None)
+    time.sleep(0.2)
+    assert expired == []
+
+
+def test_queue_full(make_manager):
+    manager = make_manager(max_workers=1, max_pending=1)
+    release = threading.Event()
+    manager.submit('final', lambda job: release.wait(5))
+    with pytest.raises(jobs.QueueFull):
+        manager.submit('final', lambda job: None)
+    release.set()
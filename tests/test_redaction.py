@@ -0,0 +1,151 @@
+"""Búsqueda de los términos a tachar (search.py) y tachado (editing.py).
+
+El tachado es un requisito de cumplimiento: además de los rectángulos, se
+comprueba que el texto ya no está en el PDF exportado.
+"""
+import re
+
+import fitz
+import pytest
+
+import editing
+import search
+
+IBAN = re.compile(r'ES\d{2}( \d{4})+', re.IGNORECASE)
+
+
+def words(*texts):
+    """Una página de palabras con rectángulos ficticios, uno por palabra."""
+    return [(i * 10.0, 0.0, i * 10.0 + 9, 10.0, text)
+            for i, text in enumerate(texts)]
+
+
+def test_normalize_ignores_case_accents_and_surrounding_punctuation():
+    assert search.normalize('Camión,') == 'camion'
+    assert search.normalize('«ÁRBOL»') == 'arbol'
+    assert search.normalize('DNI:12345678Z') == 'dni:12345678z'
+    assert search.normalize('...') == ''
+
+
+def test_fold_keeps_punctuation():
+    assert search.fold('DNI: Ñandú.') == 'dni: nandu.'
+
+
+def test_query_terms_drops_punctuation_only_words():
+    assert search.query_terms('  El  camión — rojo ') == ['el', 'camion',
+                                                          'rojo']
+
+
+def test_find_matches_phrases_across_punctuation_only_words():
+    index = search.DocumentIndex([words('el', 'camión', '—', 'rojo', 'y')])
+    assert index.find(['camion', 'rojo']) == {0: [[[10.0, 0.0, 19.0, 10.0],
+                                                   [30.0, 0.0, 39.0, 10.0]]]}
+    assert index.find(['rojo', 'camion']) == {}
+
+
+def test_match_spans_several_words():
+    index = search.DocumentIndex([
+        words('IBAN', 'ES79', '2100', '0813', 'fin'),
+        None,
+    ])
+    hits = index.match(IBAN)
+    assert list(hits) == [0]
+    assert [rect[0] for rect in hits[0][0]] == [10.0, 20.0, 30.0]
+
+
+def test_match_starting_in_a_space_skips_the_previous_word():
+    index = search.DocumentIndex([words('titular', '1234', 'fin')])
+    hits = index.match(re.compile(r' 1234'))
+    assert [rect[0] for rect in hits[0][0]] == [10.0]
+
+
+def test_match_ignores_empty_matches():
+    index = search.DocumentIndex([words('a', 'b')])
+    assert index.match(re.compile(r'x*')) == {}
+
+
+def test_contains_finds_the_term_inside_other_words():
+    index = search.DocumentIndex([
+        words('DNI:12345678Z', 'titular', '12345678Z,', 'y', '(12345678z)')
+    ])
+    hits = index.contains('12345678Z')
+    assert [hit[0][0] for hit in hits[0]] == [0.0, 20.0, 40.0]
+
+
+def test_contains_ignores_case_and_accents():
+    index = search.DocumentIndex([words('CAMION', 'Camión', 'camion')])
+    assert len(index.contains('camión')[0]) == 3
+
+
+def test_contains_spans_words_and_collapses_spaces():
+    index = search.DocumentIndex([words('Juan', 'Pérez', 'García')])
+    hits = index.contains('  juan   perez ')
+    assert [rect[0] for rect in hits[0][0]] == [0.0, 10.0]
+    assert index.contains('   ') == {}
+
+
+def test_unreadable_pages():
+    index = search.DocumentIndex([words('a'), None, []])
+    assert index.unreadable_pages() == [1]
+    assert index.contains('a') == {0: [[[0.0, 0.0, 9.0, 10.0]]]}
+
+
+def _page(rotation=0, cropbox=None):
+    """Documento de una página con datos personales en dos líneas."""
+    document = fitz.open()
+    page = document.new_page(width=595, height=842)
+    page.insert_text((300, 300), 'DNI:12345678Z titular 12345678Z, y',
+                     fontsize=11)
+    page.insert_text((300, 330), 'Cuenta ES79 2100 0813 6101 fin',
+                     fontsize=11)
+    if cropbox is not None:
+        page.set_cropbox(fitz.Rect(cropbox))
+    page.set_rotation(rotation)
+    return document
+
+
+def _redacted_text(document, find):
+    """Texto de la página exportada tras tachar lo que encuentra `find`."""
+    index = search.DocumentIndex(editing.page_words(document, [0]))
+    hits = find(index)
+    assert hits, 'no se encontró nada que tachar'
+    rects = [rect for hit in hits[0] for rect in hit]
+    exported = fitz.open(stream=editing.export_pages(document, [(0, [])],
+                                                     {0: rects}),
+                         filetype='pdf')
+    return exported[0].get_text()
+
+
+PAGES = {
+    'normal': {},
+    'girada 90': {'rotation': 90},
+    'girada 270': {'rotation': 270},
+    'cropbox desplazado': {'cropbox': (250, 250, 560, 400)},
+    'girada con cropbox': {'rotation': 90, 'cropbox': (250, 250, 560, 400)},
+}
+
+
+@pytest.mark.parametrize('options', PAGES.values(), ids=PAGES.keys())
+def test_redacted_term_is_removed_from_the_exported_text(options):
+    text = _redacted_text(_page(**options),
+                          lambda index: index.contains('12345678z'))
+    assert '12345678' not in text
+    assert 'titular' in text and 'Cuenta' in text
+
+
+@pytest.mark.parametrize('options', PAGES.values(), ids=PAGES.keys())
+def test_redacted_regex_is_removed_from_the_exported_text(options):
+    text = _redacted_text(_page(**options), lambda index: index.match(IBAN))
+    assert 'ES79' not in text and '2100' not in text and '6101' not in text
+    assert 'Cuenta' in text and 'fin' in text
+
+
+def test_redact_page_removes_text_under_the_rectangles_only():
+    document = _page()
+    page = document[0]
+    words_on_page = editing.page_words(document, [0])[0]
+    titular = next(word for word in words_on_page if word[4] == 'titular')
+    editing.redact_page(page, [titular[:4]])
+    text = page.get_text()
+    assert 'titular' not in text
+    assert 'DNI:12345678Z' in text
@@ -0,0 +1,86 @@
+"""Caché de páginas rasterizadas (render_cache.py): orden de descarte."""
+import os
+
+import render_cache
+
+SHA = 'a' * 64
+IMAGE = b'x' * 100
+
+
+def cached_pages(cache):
+    return [page for page in range(10)
+            if os.path.exists(cache._path(cache._name(SHA, page, 'w800',
+                                                      'png', None)))]
+
+
+def test_least_recently_used_images_are_evicted_first(tmp_path):
+    cache = render_cache.RenderCache(str(tmp_path), max_bytes=300)
+    for page in range(3):
+        cache.put(SHA, page, 'w800', 'png', IMAGE)
+    # Un acierto hace que la página 0 sea la usada más recientemente
+    assert cache.get(SHA, 0, 'w800', 'png') == IMAGE
+    cache.put(SHA, 3, 'w800', 'png', IMAGE)
+    assert cache.get(SHA, 1, 'w800', 'png') is None
+    assert cached_pages(cache) == [0, 2, 3]
+
+    cache.put(SHA, 4, 'w800', 'png', IMAGE)
+    assert cached_pages(cache) == [0, 3, 4]
+
+
+def test_replacing_an_image_does_not_count_it_twice(tmp_path):
+    cache = render_cache.RenderCache(str(tmp_path), max_bytes=300)
+    for page in range(3):
+        cache.put(SHA, page, 'w800', 'png', IMAGE)
+    cache.put(SHA, 2, 'w800', 'png', IMAGE)
+    assert cached_pages(cache) == [0, 1, 2]
+
+
+def test_images_larger_than_the_cache_are_not_stored(tmp_path):
+    cache = render_cache.RenderCache(str(tmp_path), max_bytes=300)
+    cache.put(SHA, 0, 'w800', 'png', IMAGE)
+    cache.put(SHA, 1, 'w800', 'png', b'x' * 301)
+    assert cached_pages(cache) == [0]
+
+
+def test_reload_keeps_the_usage_order(tmp_path):
+    cache = render_cache.RenderCache(str(tmp_path), max_bytes=300)
+    for page in range(3):
+        cache.put(SHA, page, 'w800', 'png', IMAGE)
+    # Fechas de uso explícitas: la página 0 es la más reciente
+    for page, mtime in ((0, 3000), (1, 1000), (2, 2000)):
+        os.utime(cache._path(cache._name(SHA, page, 'w800', 'png', None)),
+                 (mtime, mtime))
+    # Temporal de una escritura interrumpida
+    stale = os.path.join(os.path.dirname(cache._path(SHA)), '.tmp1234')
+    open(stale, 'wb').close()
+
+    reloaded = render_cache.RenderCache(str(tmp_path), max_bytes=300)
+    assert not os.path.exists(stale)
+    reloaded.put(SHA, 3, 'w800', 'png', IMAGE)
+    assert cached_pages(reloaded) == [0, 2, 3]
+
+
+def test_reload_evicts_when_the_limit_shrinks(tmp_path):
+    cache = render_cache.RenderCache(str(tmp_path), max_bytes=300)
+    for page in range(3):
+        cache.put(SHA, page, 'w800', 'png', IMAGE)
+        path = cache._path(cache._name(SHA, page, 'w800', 'png', None))
+        os.utime(path, (1000 + page, 1000 + page))
+    render_cache.RenderCache(str(tmp_path), max_bytes=200)
+    assert cached_pages(cache) == [1, 2]
+
+
+def test_tiles_and_pages_are_separate_entries(tmp_path):
+    cache = render_cache.RenderCache(str(tmp_path), max_bytes=1000)
+    cache.put(SHA, 0, 'w800', 'png', b'pagina')
+    cache.put(SHA, 0, 'w800', 'png', b'tesela', tile=(1, 0, 0))
+    assert cache.get(SHA, 0, 'w800', 'png') == b'pagina'
+    assert cache.get(SHA, 0, 'w800', 'png', tile=(1, 0, 0)) == b'tesela'
+    assert cache.get(SHA, 0, 'w800', 'png', tile=(1, 1, 0)) is None
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = render_cache.RenderCache(str(tmp_path / 'cache'), max_bytes=0)
+    cache.put(SHA, 0, 'w800', 'png', IMAGE)
+    assert cache.get(SHA, 0, 'w800', 'png') is None
+    assert not os.path.exists(cache.cache_dir)
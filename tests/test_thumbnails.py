@@ -0,0 +1,62 @@
+"""Hojas de miniaturas (thumbnails.py): tamaño y posición de cada página."""
+import pytest
+
+import thumbnails
+
+A4 = (595, 842)
+LANDSCAPE = (842, 595)
+
+
+def test_thumbnail_size_fits_width_and_maximum_height():
+    assert thumbnails.thumbnail_size(*A4) == (200, 283)
+    assert thumbnails.thumbnail_size(*LANDSCAPE) == (200, 141)
+    # Una tira muy alargada se reduce para no pasar del alto máximo
+    assert thumbnails.thumbnail_size(100, 5000) == (8, 400)
+    assert thumbnails.thumbnail_size(10000, 1) == (200, 1)
+
+
+def test_sprite_layout_places_pages_in_rows():
+    gap = thumbnails.SPRITE_GAP
+    sheets = thumbnails.sprite_layout([A4] * 12 + [LANDSCAPE])
+    assert len(sheets) == 1
+    pages = sheets[0]['pages']
+    assert [page[0] for page in pages] == list(range(13))
+    assert pages[1][1:3] == (200 + gap, 0)
+    # La segunda fila empieza bajo la miniatura más alta de la primera
+    assert pages[10][1:3] == (0, 283 + gap)
+    assert pages[12][1:] == (2 * (200 + gap), 283 + gap, 200, 141)
+    assert sheets[0]['width'] == 10 * 200 + 9 * gap
+    assert sheets[0]['height'] == 2 * 283 + gap
+
+
+def test_sprite_layout_starts_a_new_sheet_every_sprite_pages():
+    count = 2 * thumbnails.SPRITE_PAGES + 3
+    sheets = thumbnails.sprite_layout([A4] * count)
+    assert [len(sheet['pages']) for sheet in sheets] == [
+        thumbnails.SPRITE_PAGES, thumbnails.SPRITE_PAGES, 3
+    ]
+    # Las posiciones son relativas a cada hoja
+    assert sheets[1]['pages'][0] == (thumbnails.SPRITE_PAGES, 0, 0, 200, 283)
+    assert sheets[2]['width'] == 3 * 200 + 2 * thumbnails.SPRITE_GAP
+    assert sheets[2]['height'] == 283
+
+
+@pytest.mark.parametrize('sizes', [[A4] * 37, [A4, LANDSCAPE] * 30,
+                                   [(100, 5000), A4, (3000, 200)] * 7],
+                         ids=['iguales', 'alternas', 'mezcladas'])
+def test_thumbnails_do_not_overlap_and_fit_in_the_sheet(sizes):
+    for sheet in thumbnails.sprite_layout(sizes):
+        boxes = [(x, y, x + w, y + h) for _, x, y, w, h in sheet['pages']]
+        for x0, y0, x1, y1 in boxes:
+            assert 0 <= x0 and x1 <= sheet['width']
+            assert 0 <= y0 and y1 <= sheet['height']
+        for i, a in enumerate(boxes):
+            for b in boxes[i + 1:]:
+                assert (a[2] + thumbnails.SPRITE_GAP <= b[0]
+                        or b[2] + thumbnails.SPRITE_GAP <= a[0]
+                        or a[3] + thumbnails.SPRITE_GAP <= b[1]
+                        or b[3] + thumbnails.SPRITE_GAP <= a[1])
+
+
+def test_sprite_layout_of_an_empty_document():
+    assert thumbnails.sprite_layout([]) == []
@@ -0,0 +1,65 @@
+"""Geometría de las teselas (tiles.py): niveles y recorte en los bordes."""
+import pytest
+
+import tiles
+
+A0 = (2384, 3370)
+
+
+def tiles_of(width, height, level):
+    """Recortes de todas las teselas de un nivel, por (x, y)."""
+    clips = {}
+    y = 0
+    while tiles.tile_clip(width, height, level, 0, y) is not None:
+        x = 0
+        while (clip := tiles.tile_clip(width, height, level, x, y)) is not None:
+            clips[x, y] = clip
+            x += 1
+        y += 1
+    return clips
+
+
+def test_level_zero_is_the_whole_page_in_one_tile():
+    zoom, clip = tiles.tile_clip(1000, 700, 0, 0, 0)
+    assert zoom == pytest.approx(tiles.TILE_SIZE / 1000)
+    assert clip == (0, 0, 1000, 700)
+    assert tiles.tile_clip(1000, 700, 0, 1, 0) is None
+    assert tiles.tile_clip(1000, 700, 0, 0, 1) is None
+
+
+def test_edge_tiles_are_clipped_to_the_page():
+    # En el nivel 2 cada tesela cubre 250 puntos
+    clips = tiles_of(1000, 700, 2)
+    assert sorted(clips) == [(x, y) for x in range(4) for y in range(3)]
+    assert clips[3, 0][1] == pytest.approx((750, 0, 1000, 250))
+    assert clips[0, 2][1] == pytest.approx((0, 500, 250, 700))
+    assert clips[3, 2][1] == pytest.approx((750, 500, 1000, 700))
+
+
+@pytest.mark.parametrize('size', [(1000, 700), (595, 842), A0, (100, 5000)],
+                         ids=['apaisada', 'A4', 'A0', 'tira'])
+def test_tiles_cover_the_page_without_overlapping(size):
+    width, height = size
+    for level in range(tiles.max_level(width, height) + 1):
+        area = 0
+        for zoom, (x0, y0, x1, y1) in tiles_of(width, height, level).values():
+            assert 0 <= x0 < x1 <= width and 0 <= y0 < y1 <= height
+            # Ninguna tesela pasa de TILE_SIZE píxeles por lado
+            assert (x1 - x0) * zoom <= tiles.TILE_SIZE + 1e-6
+            assert (y1 - y0) * zoom <= tiles.TILE_SIZE + 1e-6
+            area += (x1 - x0) * (y1 - y0)
+        assert area == pytest.approx(width * height)
+
+
+def test_max_level_reaches_the_maximum_zoom():
+    width, height = A0
+    level = tiles.max_level(width, height)
+    assert tiles.level_zoom(width, height, level) >= tiles.TILE_MAX_ZOOM
+    assert tiles.level_zoom(width, height, level - 1) < tiles.TILE_MAX_ZOOM
+    assert tiles.max_level(10, 10) == 0
+
+
+@pytest.mark.parametrize('level, x, y', [(-1, 0, 0), (99, 0, 0), (1, -1, 0),
+                                         (1, 0, -1)])
+def test_tiles_outside_the_pyramid_do_not_exist(level, x, y):
+    assert tiles.tile_clip(*A0, level, x, y) is None
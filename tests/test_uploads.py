@@ -0,0 +1,112 @@
+"""Cargas por bloques (uploads.py): tramos recibidos, orden y verificación."""
+import hashlib
+import io
+import itertools
+import os
+
+import pytest
+
+import uploads
+
+DATA = bytes(range(256)) * 40  # 10240 bytes
+CHUNK = 1024
+
+
+@pytest.fixture
+def manager(tmp_path):
+    counter = itertools.count()
+
+    def new_path(suffix):
+        path = tmp_path / f"carga{next(counter)}{suffix}"
+        path.touch()
+        return str(path)
+
+    return uploads.UploadManager(new_path, max_size=len(DATA),
+                                 chunk_size=CHUNK)
+
+
+def send(upload, start, end):
+    upload.write(start, io.BytesIO(DATA[start:end]), end - start)
+
+
+def test_chunks_out_of_order_complete_the_file(manager):
+    upload = manager.create('a.pdf', len(DATA),
+                            hashlib.sha256(DATA).hexdigest())
+    offsets = list(range(0, len(DATA), CHUNK))
+    for offset in reversed(offsets[1:]):
+        send(upload, offset, offset + CHUNK)
+    assert upload.missing() == [[0, CHUNK]]
+    assert upload.to_dict()['received'] == len(DATA) - CHUNK
+
+    send(upload, 0, CHUNK)
+    assert upload.missing() == []
+    path, filename, sha256 = manager.finish(upload.id)
+    assert (filename, sha256) == ('a.pdf', hashlib.sha256(DATA).hexdigest())
+    with open(path, 'rb') as received:
+        assert received.read() == DATA
+    assert manager.get(upload.id) is None
+
+
+def test_missing_merges_adjacent_and_overlapping_ranges(manager):
+    upload = manager.create('a.pdf', len(DATA))
+    send(upload, 2048, 3072)
+    send(upload, 5000, 6000)
+    assert upload.missing() == [[0, 2048], [3072, 5000], [6000, len(DATA)]]
+    send(upload, 3072, 4000)
+    send(upload, 3500, 4500)
+    send(upload, 4500, 5000)
+    assert upload.missing() == [[0, 2048], [6000, len(DATA)]]
+    # Repetir un bloque no cambia nada
+    send(upload, 2048, 3072)
+    assert upload.missing() == [[0, 2048], [6000, len(DATA)]]
+
+
+def test_finish_refuses_an_incomplete_upload(manager):
+    upload = manager.create('a.pdf', len(DATA))
+    send(upload, 0, CHUNK)
+    with pytest.raises(uploads.UploadError) as error:
+        manager.finish(upload.id)
+    assert error.value.status == 409
+    assert manager.get(upload.id) is upload
+
+
+def test_finish_discards_an_upload_with_the_wrong_hash(manager):
+    upload = manager.create('a.pdf', len(DATA),
+                            hashlib.sha256(b'otro').hexdigest())
+    for offset in range(0, len(DATA), CHUNK):
+        send(upload, offset, offset + CHUNK)
+    assert not upload.verify()
+    with pytest.raises(uploads.UploadError) as error:
+        manager.finish(upload.id)
+    assert error.value.status == 422
+    assert not os.path.exists(upload.path)
+
+
+@pytest.mark.parametrize('offset, length, status', [
+    (-1, 10, 416),
+    (len(DATA) - 10, 20, 416),
+    (0, CHUNK + 1, 413),
+], ids=['antes del inicio', 'pasado el final', 'demasiado grande'])
+def test_write_rejects_invalid_chunks(manager, offset, length, status):
+    upload = manager.create('a.pdf', len(DATA))
+    with pytest.raises(uploads.UploadError) as error:
+        upload.write(offset, io.BytesIO(b'x' * length), length)
+    assert error.value.status == status
+    assert upload.missing() == [[0, len(DATA)]]
+
+
+def test_a_truncated_chunk_is_not_marked_as_received(manager):
+    upload = manager.create('a.pdf', len(DATA))
+    with pytest.raises(uploads.UploadError):
+        upload.write(0, io.BytesIO(DATA[:100]), CHUNK)
+    assert upload.missing() == [[0, len(DATA)]]
+
+
+def test_cancel_removes_the_file(manager):
+    upload = manager.create('a.pdf', len(DATA))
+    assert manager.cancel(upload.id)
+    assert not os.path.exists(upload.path)
+    assert not manager.cancel(upload.id)
+    with pytest.raises(uploads.UploadError) as error:
+        send(upload, 0, CHUNK)
+    assert error.value.status == 404
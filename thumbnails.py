@@ -0,0 +1,56 @@
+"""Hojas de miniaturas (sprites) de un documento.
+
+Las miniaturas de las páginas se agrupan en hojas de SPRITE_PAGES páginas,
+en filas de SPRITE_COLUMNS, para que la tira de miniaturas de un documento
+de cientos de páginas se cargue con unas pocas peticiones. La posición de
+cada miniatura solo depende del tamaño de las páginas, así que el mapa de
+posiciones se calcula sin rasterizar nada y cada hoja se rasteriza de una
+vez en un worker cuando se pide.
+"""
+import math
+
+# Ancho en píxeles de una miniatura (el editor las muestra a unos 130 px)
+THUMBNAIL_WIDTH = 200
+# Alto máximo: las páginas muy alargadas se reducen para caber
+THUMBNAIL_MAX_HEIGHT = 400
+# Miniaturas por hoja y por fila de la hoja
+SPRITE_PAGES = 50
+SPRITE_COLUMNS = 10
+# Separación entre miniaturas, para que el suavizado no mezcle vecinas
+SPRITE_GAP = 2
+
+
+def thumbnail_size(width, height):
+    """Tamaño (ancho, alto) en píxeles de la miniatura de una página."""
+    scale = min(THUMBNAIL_WIDTH / width, THUMBNAIL_MAX_HEIGHT / height)
+    return max(1, math.floor(width * scale)), max(1, math.floor(height * scale))
+
+
+def sprite_layout(sizes):
+    """Reparte en hojas las páginas de tamaños `sizes` [(ancho, alto), ...].
+
+    Devuelve una lista de hojas {'width', 'height', 'pages'}, donde 'pages'
+    es [(página, x, y, ancho, alto), ...] en píxeles dentro de la hoja.
+    """
+    sheets = []
+    for first in range(0, len(sizes), SPRITE_PAGES):
+        placements = []
+        sheet_width = y = 0
+        page_nums = range(first, min(first + SPRITE_PAGES, len(sizes)))
+        for row_start in range(first, page_nums.stop, SPRITE_COLUMNS):
+            x = row_height = 0
+            for page_num in range(row_start,
+                                  min(row_start + SPRITE_COLUMNS,
+                                      page_nums.stop)):
+                width, height = thumbnail_size(*sizes[page_num])
+                placements.append((page_num, x, y, width, height))
+                x += width + SPRITE_GAP
+                row_height = max(row_height, height)
+            sheet_width = max(sheet_width, x - SPRITE_GAP)
+            y += row_height + SPRITE_GAP
+        sheets.append({
+            'width': sheet_width,
+            'height': y - SPRITE_GAP,
+            'pages': placements
+        })
+    return sheets
@@ -0,0 +1,41 @@
+"""Geometría de la pirámide de teselas para ampliar páginas muy grandes.
+
+En el nivel 0 la página entera cabe en una tesela de TILE_SIZE píxeles por
+su lado mayor y cada nivel duplica la resolución del anterior. Una tesela
+solo rasteriza el recorte de la página que cubre, así que la memoria por
+petición está acotada aunque la página sea un plano A0 a gran aumento.
+"""
+import math
+
+# Lado en píxeles de una tesela
+TILE_SIZE = 256
+# Zoom máximo respecto a 72 DPI (8 = 576 DPI)
+TILE_MAX_ZOOM = 8
+
+
+def max_level(width, height):
+    """Nivel más profundo de la pirámide de una página de `width` x `height`."""
+    return max(0, math.ceil(math.log2(max(width, height) * TILE_MAX_ZOOM /
+                                      TILE_SIZE)))
+
+
+def level_zoom(width, height, level):
+    """Zoom (respecto a 72 DPI) de la página en el nivel `level`."""
+    return TILE_SIZE * 2**level / max(width, height)
+
+
+def tile_clip(width, height, level, x, y):
+    """Devuelve (zoom, recorte) de la tesela (level, x, y) de la página.
+
+    El recorte es (x0, y0, x1, y1) en puntos de la página; las teselas del
+    borde derecho e inferior son más pequeñas. Devuelve None si la tesela no
+    existe.
+    """
+    if not 0 <= level <= max_level(width, height) or x < 0 or y < 0:
+        return None
+    zoom = level_zoom(width, height, level)
+    side = TILE_SIZE / zoom
+    if x * side >= width or y * side >= height:
+        return None
+    return zoom, (x * side, y * side, min((x + 1) * side, width),
+                  min((y + 1) * side, height))
@@ -0,0 +1,194 @@
+"""Cargas por bloques reanudables para archivos grandes.
+
+El cliente crea la carga con el tamaño (y opcionalmente el SHA-256) del
+archivo y envía bloques, en paralelo y en cualquier orden, indicando su
+posición. Cada bloque se escribe directamente en su sitio de un fichero del
+spool, así que un bloque que falla solo hay que repetirlo y una conexión
+caída no obliga a empezar de cero: el estado de la carga dice qué tramos
+faltan. Al completarla se comprueba el hash y el fichero pasa al almacén de
+documentos.
+"""
+import os
+import threading
+import time
+import uuid
+
+from docstore import file_sha256
+
+# Bytes que se leen de la petición o del fichero en cada escritura o lectura
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Petición no válida sobre una carga; lleva el código HTTP."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedUpload:
+    """Una carga en curso: el fichero de destino y los tramos ya recibidos."""
+
+    def __init__(self, path, filename, size, sha256, chunk_size):
+        self.id = str(uuid.uuid4())
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.chunk_size = chunk_size
+        self.updated_at = time.time()
+        self._received = []  # tramos [inicio, fin) ordenados y sin solapes
+        self._lock = threading.Lock()
+
+    def write(self, offset, stream, length):
+        """Escribe en `offset` los `length` bytes que se leen de `stream`."""
+        if offset < 0 or length <= 0 or offset + length > self.size:
+            raise UploadError("El bloque queda fuera del archivo.", 416)
+        if length > self.chunk_size:
+            raise UploadError("El bloque es demasiado grande.", 413)
+
+        written = 0
+        try:
+            target = open(self.path, 'r+b')
+        except FileNotFoundError:
+            # La carga se canceló o se completó mientras llegaba el bloque
+            raise UploadError("Carga no encontrada.", 404) from None
+        with target:
+            target.seek(offset)
+            while written < length:
+                block = stream.read(min(COPY_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                target.write(block)
+                written += len(block)
+        if written != length:
+            # Lo escrito se sobrescribirá cuando el cliente repita el bloque
+            raise UploadError("El bloque llegó incompleto.", 400)
+
+        with self._lock:
+            self._add_range(offset, offset + length)
+            self.updated_at = time.time()
+
+    def _add_range(self, start, end):
+        ranges = []
+        for range_start, range_end in self._received:
+            if range_end < start or range_start > end:
+                ranges.append((range_start, range_end))
+            else:
+                start, end = min(start, range_start), max(end, range_end)
+        ranges.append((start, end))
+        self._received = sorted(ranges)
+
+    def missing(self):
+        """Tramos [inicio, fin) que aún no se han recibido."""
+        with self._lock:
+            gaps = []
+            position = 0
+            for start, end in self._received:
+                if start > position:
+                    gaps.append([position, start])
+                position = end
+            if position < self.size:
+                gaps.append([position, self.size])
+            return gaps
+
+    def verify(self):
+        """Indica si el fichero recibido coincide con el SHA-256 declarado."""
+        return not self.sha256 or file_sha256(self.path) == self.sha256
+
+    def to_dict(self):
+        missing = self.missing()
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "size": self.size,
+            "chunkSize": self.chunk_size,
+            "received": self.size - sum(end - start for start, end in missing),
+            "missing": missing,
+        }
+
+
+class UploadManager:
+    """Cargas por bloques en curso.
+
+    Los ficheros se crean con `new_path(sufijo)` (normalmente en el spool del
+    almacén de documentos). Las cargas sin actividad durante `ttl` segundos
+    se descartan con su fichero.
+    """
+
+    def __init__(self,
+                 new_path,
+                 max_size,
+                 chunk_size=8 * 1024 * 1024,
+                 ttl=24 * 3600):
+        self._new_path = new_path
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self._ttl = ttl
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename, size, sha256=None):
+        self._expire()
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("Tamaño de archivo no válido.")
+        if size > self.max_size:
+            raise UploadError("El archivo es demasiado grande.", 413)
+        if sha256 is not None:
+            sha256 = str(sha256).lower()
+            if len(sha256) != 64 or any(c not in '0123456789abcdef'
+                                        for c in sha256):
+                raise UploadError("Hash SHA-256 no válido.")
+
+        path = self._new_path('.part')
+        # Reservar el tamaño final; los bloques se escriben en su posición
+        os.truncate(path, size)
+        upload = ChunkedUpload(path, filename or 'documento.pdf', size,
+                               sha256, self.chunk_size)
+        with self._lock:
+            self._uploads[upload.id] = upload
+        return upload
+
+    def get(self, upload_id):
+        with self._lock:
+            return self._uploads.get(upload_id)
+
+    def finish(self, upload_id):
+        """Retira una carga completa y verificada y devuelve (ruta, nombre, sha256).
+
+        Desde ese momento el fichero es de quien llama. El SHA-256 es None si
+        el cliente no lo declaró. Si no coincide la carga se descarta y el
+        cliente debe empezar de nuevo.
+        """
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                raise UploadError("Carga no encontrada.", 404)
+            if upload.missing():
+                raise UploadError("Faltan bloques por subir.", 409)
+            # A partir de aquí nadie más puede completarla ni cancelarla
+            del self._uploads[upload_id]
+
+        if not upload.verify():
+            os.remove(upload.path)
+            raise UploadError("El archivo recibido no coincide con su hash.",
+                              422)
+        return upload.path, upload.filename, upload.sha256
+
+    def cancel(self, upload_id):
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+        if upload is not None:
+            os.remove(upload.path)
+        return upload is not None
+
+    def _expire(self):
+        limit = time.time() - self._ttl
+        with self._lock:
+            expired = [upload for upload in self._uploads.values()
+                       if upload.updated_at < limit]
+            for upload in expired:
+                del self._uploads[upload.id]
+        for upload in expired:
+            os.remove(upload.path)
@@ -0,0 +1,306 @@
+"""Procesos aislados para todo el trabajo de MuPDF (abrir, renderizar, exportar).
+
+MuPDF no es seguro entre hilos y un PDF malformado puede provocar un fallo de
+segmentación, así que el servidor no abre los documentos subidos: cada worker
+es un proceso de larga duración que recibe operaciones por un Pipe. Los
+documentos no viajan por el Pipe: el worker los abre desde su fichero del
+spool o su segmento de memoria compartida (ver docstore) sin copiarlos. El
+proceso arranca con un límite de memoria (RLIMIT_AS) y antes de cada operación
+se fija su presupuesto de CPU (RLIMIT_CPU), de modo que una página patológica
+solo puede bloquear o tumbar su propio worker, que se reinicia, y quien la
+pidió recibe PageLimitExceeded para sustituirla por un aviso. Los workers se
+reciclan tras un número de trabajos para limitar la fragmentación de memoria.
+"""
+import collections
+import itertools
+import multiprocessing
+import os
+import queue
+import resource
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Documentos abiertos (y adjuntados) que conserva cada worker para no volver
+# a parsearlos; cada uno con las DisplayList de sus páginas ya interpretadas
+# (ver editing.display_list)
+DOCUMENT_CACHE_SIZE = 4
+
+metrics.describe('pdf_page_limit_exceeded_total',
+                 'Páginas sustituidas por un aviso al superar los límites')
+metrics.describe('pdf_worker_restarts_total',
+                 'Procesos worker reiniciados tras morir o superar un límite')
+metrics.describe('pdf_worker_recycled_total',
+                 'Procesos worker reciclados al alcanzar su número de trabajos')
+
+
+class PageLimitExceeded(Exception):
+    """Una página superó el límite de CPU, memoria o tiempo, o tumbó al worker."""
+
+    def __init__(self, reason):
+        super().__init__(f"Límite superado: {reason}")
+        self.reason = reason  # cpu | memory | timeout | crash
+
+
+class WorkerError(Exception):
+    """La operación falló dentro del worker (p. ej. una página corrupta)."""
+
+
+def _is_memory_error(error):
+    # MuPDF informa de un malloc fallido como FzErrorSystem y de las
+    # imágenes desmesuradas como FzErrorLimit
+    return (isinstance(error, MemoryError) or 'malloc' in str(error)
+            or type(error).__name__ == 'FzErrorLimit')
+
+
+def _virtual_memory_size():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _set_cpu_budget(cpu_seconds):
+    """Hace que el kernel mate el proceso (SIGXCPU) tras `cpu_seconds` más de CPU."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_seconds + 1, hard))
+
+
+def _worker_main(conn, cpu_seconds, memory_mb):
+    """Bucle del proceso worker: (op, doc_id, handle, kwargs) -> (estado, valor)."""
+    import docstore
+    import editing
+
+    operations = {
+        'open': editing.page_sizes,
+        'render': editing.render_page,
+        'sprite': editing.render_sprite,
+        'words': editing.page_words,
+        'export_pages': editing.export_pages,
+        'incremental': editing.incremental_update,
+        'fill_template': editing.fill_template,
+    }
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_mb:
+        # El límite es relativo a lo que ya ocupa el intérprete con MuPDF cargado
+        limit = _virtual_memory_size() + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS,
+                           (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+
+    documents = collections.OrderedDict()  # doc_id -> (doc, cerrar)
+
+    while True:
+        try:
+            op, doc_id, handle, kwargs, cost = conn.recv()
+        except EOFError:
+            break
+
+        if cpu_seconds:
+            _set_cpu_budget(cpu_seconds * cost)
+        try:
+            if doc_id not in documents:
+                documents[doc_id] = docstore.open_document(handle)
+                if len(documents) > DOCUMENT_CACHE_SIZE:
+                    doc, close = documents.popitem(last=False)[1]
+                    editing.forget_document(doc)
+                    close()
+            documents.move_to_end(doc_id)
+            reply = ('ok', operations[op](documents[doc_id][0], **kwargs))
+        except Exception as e:
+            if _is_memory_error(e):
+                # Liberar las páginas ya interpretadas antes de seguir
+                editing.clear_display_lists()
+                reply = ('limit', 'memory')
+            else:
+                reply = ('error', str(e))
+        conn.send(reply)
+
+
+class Worker:
+    """Un proceso worker y su canal de comunicación.
+
+    El proceso se arranca al primer uso y se reinicia cuando muere (por el
+    límite de CPU, por un fallo de MuPDF), cuando no responde a tiempo o
+    cuando ha atendido `max_jobs` operaciones.
+    """
+
+    def __init__(self, context, cpu_seconds, memory_mb, timeout, max_jobs):
+        self._context = context
+        self._cpu_seconds = cpu_seconds
+        self._memory_mb = memory_mb
+        self._timeout = timeout
+        self._max_jobs = max_jobs
+        self._jobs = 0
+        self._process = None
+        self._conn = None
+
+    def _start(self):
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self._cpu_seconds, self._memory_mb),
+            daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self._jobs = 0
+
+    def start(self):
+        """Arranca el proceso si no está en marcha."""
+        if self._process is None:
+            self._start()
+
+    def stop(self):
+        """Detiene el proceso si está en marcha."""
+        self._stop()
+
+    def _stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._conn.close()
+            self._process = None
+            self._conn = None
+
+    def _roundtrip(self, message, cost):
+        self.start()
+        try:
+            self._conn.send(message)
+            if not self._conn.poll(self._timeout and self._timeout * cost):
+                self._stop()
+                metrics.inc('pdf_worker_restarts_total', reason='timeout')
+                raise PageLimitExceeded('timeout')
+            return self._conn.recv()
+        except (EOFError, OSError):
+            self._process.join(1)
+            reason = ('cpu' if self._process.exitcode == -signal.SIGXCPU else
+                      'crash')
+            self._stop()
+            metrics.inc('pdf_worker_restarts_total', reason=reason)
+            raise PageLimitExceeded(reason)
+
+    def call(self, op, doc_id, handle, kwargs, cost):
+        if self._max_jobs and self._jobs >= self._max_jobs:
+            self._stop()
+            metrics.inc('pdf_worker_recycled_total')
+        self._jobs += 1
+
+        status, value = self._roundtrip((op, doc_id, handle, kwargs, cost),
+                                        cost)
+        if status == 'ok':
+            return value
+        if status == 'limit':
+            raise PageLimitExceeded(value)
+        raise WorkerError(value)
+
+
+class WorkerPool:
+    """Conjunto fijo de workers; cada llamada usa el primero que esté libre."""
+
+    def __init__(self,
+                 size,
+                 cpu_seconds=None,
+                 memory_mb=None,
+                 timeout=None,
+                 max_jobs=None):
+        methods = multiprocessing.get_all_start_methods()
+        # Hacer fork de un servidor con hilos puede heredar locks tomados
+        context = multiprocessing.get_context(
+            'forkserver' if 'forkserver' in methods else 'spawn')
+        if context.get_start_method() == 'forkserver':
+            # Precargar MuPDF en el servidor de fork y no el módulo principal
+            context.set_forkserver_preload(['editing'])
+        if cpu_seconds and timeout is None:
+            timeout = cpu_seconds * 2 + 5
+        self.size = size
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(
+                Worker(context, cpu_seconds, memory_mb, timeout, max_jobs))
+        # Hilos que solo esperan respuestas de los workers, para repartir
+        # las páginas de una petición entre todos ellos
+        self._dispatcher = ThreadPoolExecutor(max_workers=size,
+                                              thread_name_prefix='pdf-worker')
+
+    def warm(self, count=1):
+        """Arranca de antemano hasta `count` workers libres.
+
+        El primer arranque también pone en marcha el servidor de fork, que
+        carga MuPDF; así la primera operación no espera a nada de eso.
+        """
+        workers = []
+        for _ in range(min(count, self.size)):
+            try:
+                workers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            for worker in workers:
+                worker.start()
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+
+    def close(self):
+        """Detiene los procesos worker cuando terminan lo que estén haciendo.
+
+        Si se vuelve a usar el pool, los workers se arrancan de nuevo.
+        """
+        workers = [self._idle.get() for _ in range(self.size)]
+        try:
+            for worker in workers:
+                worker.stop()
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+
+    def call(self, op, doc_id, handle, cost=1, **kwargs):
+        """Ejecuta `op` sobre el documento `doc_id` en un worker libre.
+
+        `handle` indica dónde están los datos del documento (ver
+        DocumentStore.lease) y solo se usa si ese worker aún no lo tiene
+        abierto. `cost` es el número de páginas que procesa la
+        operación: multiplica el presupuesto de CPU y el tiempo de espera.
+        """
+        worker = self._idle.get()
+        try:
+            return worker.call(op, doc_id, handle, kwargs, cost)
+        except PageLimitExceeded as e:
+            metrics.inc('pdf_page_limit_exceeded_total', op=op, reason=e.reason)
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def map(self, op, calls):
+        """Ejecuta `op` para cada (doc_id, handle, kwargs) repartiendo entre workers.
+
+        Genera los resultados en el orden de `calls`; si una llamada falla se
+        genera la excepción (PageLimitExceeded o WorkerError) en lugar del
+        resultado, para que quien llama decida página a página. Como mucho hay
+        `size` llamadas en curso, y al cerrar el generador antes de tiempo (p.
+        ej. al cancelar un trabajo) las pendientes se descartan.
+        """
+        calls = iter(calls)
+        pending = collections.deque()
+
+        def submit(count):
+            for doc_id, handle, kwargs in itertools.islice(calls, count):
+                pending.append(
+                    self._dispatcher.submit(self.call, op, doc_id, handle,
+                                            **kwargs))
+
+        submit(self.size)
+        try:
+            while pending:
+                future = pending.popleft()
+                try:
+                    result = future.result()
+                except (PageLimitExceeded, WorkerError) as e:
+                    result = e
+                submit(1)
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()